@@ -0,0 +1,57 @@
+"""
+一括出品のベンチマーク
+
+  python -m benchmarks.bench_bulk_create [件数 ...]
+
+同じ件数のアイテムを、POST /api/v1/items/ をN回呼んで登録する場合と、
+POST /api/v1/items/bulk を1回呼んで登録する場合の所要時間を比較する
+"""
+import os
+import sys
+import time
+from flask_jwt_extended import create_access_token
+from sharefood import db
+from sharefood.models import Item, User
+from .common import make_app, print_table
+
+DEFAULT_SIZES = [10, 100, 500]
+
+def payload(size):
+  return [{
+    'name': f'食品{i}', 'description': '説明文' * 5, 'quantity': i % 10 + 1, 'unit': '個',
+    'expiration_date': '2026-12-31', 'location': '渋谷駅',
+  } for i in range(size)]
+
+def run(size):
+  app, db_path = make_app()
+  try:
+    with app.app_context():
+      user = User(username='bench', email_address='bench@example.com', password_hash='x' * 60, is_verified=True)
+      db.session.add(user)
+      db.session.commit()
+      headers = {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+    client = app.test_client()
+    rows = payload(size)
+
+    start = time.perf_counter()
+    for row in rows:
+      assert client.post('/api/v1/items/', data=row, headers=headers).status_code == 201
+    single_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    assert client.post('/api/v1/items/bulk', json=rows, headers=headers).status_code == 201
+    bulk_ms = (time.perf_counter() - start) * 1000
+
+    with app.app_context():
+      assert Item.query.count() == size * 2
+    return [size, f'{single_ms:.1f}', f'{bulk_ms:.1f}', f'{single_ms / bulk_ms:.1f}x']
+  finally:
+    os.remove(db_path)
+
+def main(argv):
+  sizes = [int(arg) for arg in argv] or DEFAULT_SIZES
+  rows = [run(size) for size in sizes]
+  print_table(['items', 'single POST x N(ms)', 'bulk POST(ms)', 'speedup'], rows)
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
@@ -0,0 +1,281 @@
+"""
+主要なエンドポイントに負荷をかけるHTTPベンチマーク（大量のデータ入り）
+
+  python -m benchmarks.bench_http [--users 100000] [--items 1000000] [--concurrency 1,8,32] [--duration 10]
+                                  [--endpoints login,items,item,me,create,toggle] [--db PATH]
+                                  [--url http://127.0.0.1:8000] [--json results.json] [--baseline previous.json]
+
+エンドポイントごと・同時実行数ごとに、指定した秒数のあいだスレッドからリクエストを送り続け、
+1秒あたりの処理件数と p50/p95/p99 のレイテンシを出す
+
+  --url なし : 一時ファイルのSQLiteにデータを入れ、アプリをこのプロセス内で（テストクライアント経由で）呼ぶ。
+               --db を指定するとそのファイルを使い、すでにデータが入っていれば入れ直さない（2回目以降の計測が速い）
+  --url あり : 起動済みのサーバー（gunicornなど）にHTTPで送る。サーバーのDBには flask seed で同じ形のデータ
+               （メールアドレス user<番号>@example.com、パスワード password）を入れておくこと
+  --json     : 結果をJSONで書き出す（CIで前回の結果と比べる用）
+  --baseline : 前回の --json の結果と比べた増減も表示する
+
+bcryptのcostは環境変数 BENCH_BCRYPT_ROUNDS で変えられる（既定は本番と同じ12。login の結果に大きく影響する）
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlencode, urlsplit
+from sharefood import db
+from sharefood.models import User
+from sharefood.seeding import DEFAULT_PASSWORD, FOODS, seed_database
+from .common import make_app, percentile, print_table
+
+ENDPOINTS = ['login', 'items', 'item', 'me', 'create', 'toggle']
+PASSWORD = DEFAULT_PASSWORD
+
+# --- データの準備（--url なしのとき） ---
+def seed(app, users, items, rng):
+  """flask seed と同じ方法でユーザーとアイテムを一括で入れる"""
+  with app.app_context():
+    result = seed_database(users, items, PASSWORD, rng=rng)
+  print('  ' + ' '.join(f'{name}={seconds:.2f}s' for name, seconds in result['timings'].items()))
+
+def is_seeded(app):
+  with app.app_context():
+    return db.session.query(User.id).first() is not None
+
+# --- クライアント ---
+class InProcessClient:
+  """アプリをこのプロセス内で呼ぶクライアント"""
+
+  def __init__(self, app):
+    self.client = app.test_client()
+
+  def request(self, method, path, headers=None, json_body=None, form=None):
+    response = self.client.open(path, method=method, headers=headers, json=json_body, data=form)
+    return response.status_code, response.get_json(silent=True)
+
+class HTTPClient:
+  """起動済みのサーバーにHTTPで送るクライアント（スレッドごとに1本の接続を使い回す）"""
+
+  def __init__(self, url):
+    parts = urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    self.connection = connection_class(parts.netloc, timeout=30)
+
+  def request(self, method, path, headers=None, json_body=None, form=None):
+    headers = dict(headers or {})
+    body = None
+    if json_body is not None:
+      body, headers['Content-Type'] = json.dumps(json_body), 'application/json'
+    elif form is not None:
+      body, headers['Content-Type'] = urlencode(form), 'application/x-www-form-urlencoded'
+    try:
+      self.connection.request(method, path, body=body, headers=headers)
+      response = self.connection.getresponse()
+      data = response.read()
+    except (OSError, http.client.HTTPException):
+      self.connection.close()  # 次のリクエストでつなぎ直す
+      return 0, None
+    try:
+      return response.status, json.loads(data) if data else None
+    except ValueError:
+      return response.status, None
+
+# --- シナリオ ---
+class Context:
+  """ログイン済みのユーザー（トークンと自分のアイテム）と、アイテムIDの範囲"""
+
+  def __init__(self, users, sessions, max_item_id):
+    self.users = users
+    self.sessions = sessions  # [(Authorizationヘッダー, 自分のアイテムのID), ...]
+    self.max_item_id = max_item_id
+
+def prepare(client, users, count):
+  """count人分ログインしてトークンを取り、それぞれが持つアイテムを1件ずつ用意する"""
+  sessions = []
+  for user_number in range(1, count + 1):
+    status, body = client.request('POST', '/api/v1/login', json_body={
+      'email_address': f'user{user_number}@example.com', 'password': PASSWORD,
+    })
+    if status != 200:
+      raise RuntimeError(f'user{user_number} でログインできませんでした（{status}）')
+    headers = {'Authorization': f"Bearer {body['access_token']}"}
+    user_id = client.request('GET', '/api/v1/me', headers=headers)[1]['user']['id']
+    owned = client.request('GET', f'/api/v1/items/?user_id={user_id}&limit=1')[1]['items']
+    if owned:
+      item_id = owned[0]['id']
+    else:
+      item_id = client.request('POST', '/api/v1/items/', headers=headers, form={'name': 'りんご', 'quantity': 1})[1]['item']['id']
+    sessions.append((headers, item_id))
+  newest = client.request('GET', '/api/v1/items/?limit=1')[1]['items']
+  return Context(users, sessions, newest[0]['id'] if newest else 1)
+
+# エンドポイント名 -> (成功とみなすステータス, リクエストを1つ送る関数)
+def _login(client, context, session, rng):
+  email = f'user{rng.randint(1, context.users)}@example.com'
+  return client.request('POST', '/api/v1/login', json_body={'email_address': email, 'password': PASSWORD})[0]
+
+def _items(client, context, session, rng):
+  query = '?limit=20&is_available=true' if rng.random() < 0.5 else '?limit=20'
+  return client.request('GET', f'/api/v1/items/{query}')[0]
+
+def _item(client, context, session, rng):
+  return client.request('GET', f'/api/v1/items/{rng.randint(1, context.max_item_id)}')[0]
+
+def _me(client, context, session, rng):
+  return client.request('GET', '/api/v1/me', headers=session[0])[0]
+
+def _create(client, context, session, rng):
+  form = {'name': rng.choice(FOODS)[0], 'quantity': rng.randint(1, 5), 'description': 'ベンチマーク'}
+  return client.request('POST', '/api/v1/items/', headers=session[0], form=form)[0]
+
+def _toggle(client, context, session, rng):
+  return client.request('POST', f'/api/v1/items/{session[1]}/toggle-availability', headers=session[0])[0]
+
+SCENARIOS = {
+  'login': ({200}, _login),
+  'items': ({200}, _items),
+  'item': ({200, 404}, _item),  # 削除されたIDに当たることがある
+  'me': ({200}, _me),
+  'create': ({201}, _create),
+  'toggle': ({200}, _toggle),
+}
+
+def run(make_client, context, endpoint, concurrency, duration):
+  """concurrency 本のスレッドから duration 秒間リクエストを送り、結果を辞書で返す"""
+  expected, send = SCENARIOS[endpoint]
+  latencies, statuses = [], {}
+  lock = threading.Lock()
+  start_line = threading.Barrier(concurrency + 1)
+  deadline = [0.0]
+
+  def worker(index):
+    client = make_client()
+    rng = random.Random(index)
+    session = context.sessions[index % len(context.sessions)]
+    send(client, context, session, rng)  # ウォームアップ（接続の確立など）
+    start_line.wait()
+    local_latencies, local_statuses = [], {}
+    while time.perf_counter() < deadline[0]:
+      started = time.perf_counter()
+      status = send(client, context, session, rng)
+      local_latencies.append((time.perf_counter() - started) * 1000)
+      local_statuses[status] = local_statuses.get(status, 0) + 1
+    with lock:
+      latencies.extend(local_latencies)
+      for status, count in local_statuses.items():
+        statuses[status] = statuses.get(status, 0) + count
+
+  threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+  for thread in threads:
+    thread.start()
+  deadline[0] = time.perf_counter() + 3600  # 全スレッドの準備ができるまでは終わらせない
+  start_line.wait()
+  started = time.perf_counter()
+  deadline[0] = started + duration
+  for thread in threads:
+    thread.join()
+  elapsed = time.perf_counter() - started
+
+  errors = sum(count for status, count in statuses.items() if status not in expected)
+  return {
+    'endpoint': endpoint, 'concurrency': concurrency, 'requests': len(latencies), 'errors': errors,
+    'rps': round(len(latencies) / elapsed, 1),
+    'p50_ms': round(percentile(latencies, 50), 2),
+    'p95_ms': round(percentile(latencies, 95), 2),
+    'p99_ms': round(percentile(latencies, 99), 2),
+    'statuses': {str(status): count for status, count in sorted(statuses.items())},
+  }
+
+# --- 出力 ---
+def _change(current, previous):
+  return f'{(current - previous) / previous:+.0%}' if previous else '-'
+
+def report(results, baseline=None):
+  headers = ['endpoint', 'concurrency', 'requests', 'errors', 'req/s', 'p50(ms)', 'p95(ms)', 'p99(ms)']
+  previous = {(row['endpoint'], row['concurrency']): row for row in (baseline or {}).get('results', [])}
+  if baseline is not None:
+    headers += ['req/s vs base', 'p95 vs base']
+  rows = []
+  for result in results:
+    row = [
+      result['endpoint'], result['concurrency'], result['requests'], result['errors'], f"{result['rps']:.1f}",
+      f"{result['p50_ms']:.1f}", f"{result['p95_ms']:.1f}", f"{result['p99_ms']:.1f}",
+    ]
+    if baseline is not None:
+      base = previous.get((result['endpoint'], result['concurrency']))
+      row += [_change(result['rps'], base['rps']), _change(result['p95_ms'], base['p95_ms'])] if base else ['-', '-']
+    rows.append(row)
+  print_table(headers, rows)
+
+def parse_args(argv):
+  parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_http', description='主要なエンドポイントのHTTPベンチマーク')
+  parser.add_argument('--users', type=int, default=100_000, help='ユーザー数')
+  parser.add_argument('--items', type=int, default=1_000_000, help='アイテム数')
+  parser.add_argument('--concurrency', default='1,8,32', help='同時実行数（カンマ区切り）')
+  parser.add_argument('--duration', type=float, default=10, help='1つの組み合わせを計測する秒数')
+  parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help=f"計測するエンドポイント（{','.join(ENDPOINTS)}）")
+  parser.add_argument('--db', help='使うSQLiteファイル（データが入っていれば入れ直さない）')
+  parser.add_argument('--url', help='起動済みのサーバーのURL（指定しなければプロセス内で呼ぶ）')
+  parser.add_argument('--json', dest='json_path', help='結果を書き出すJSONファイル')
+  parser.add_argument('--baseline', help='比べる前回のJSONファイル')
+  parser.add_argument('--seed', type=int, default=0, help='データ生成の乱数のシード')
+  args = parser.parse_args(argv)
+  args.concurrency = [int(value) for value in args.concurrency.split(',')]
+  args.endpoints = args.endpoints.split(',')
+  unknown = set(args.endpoints) - set(SCENARIOS)
+  if unknown:
+    parser.error(f"未対応のエンドポイントです: {', '.join(sorted(unknown))}")
+  return args
+
+def main(argv):
+  args = parse_args(argv)
+  db_path = None
+  temporary = args.url is None and args.db is None
+  try:
+    if args.url:
+      make_client = lambda: HTTPClient(args.url)
+    else:
+      rounds = int(os.getenv('BENCH_BCRYPT_ROUNDS', 12))
+      # 本番と同じく、アイテム一覧のレスポンスキャッシュを有効にし、N+1の検出は切る
+      app, db_path = make_app(
+        args.db, BCRYPT_LOG_ROUNDS=rounds, CACHE_BACKEND='lru', LAZY_LOAD_DETECTION=False, SLOW_QUERY_THRESHOLD_MS=0,
+      )
+      if not is_seeded(app):
+        started = time.perf_counter()
+        seed(app, args.users, args.items, random.Random(args.seed))
+        print(f'{args.users}ユーザー・{args.items}アイテムを {time.perf_counter() - started:.1f}秒で作成しました')
+      make_client = lambda: InProcessClient(app)
+
+    context = prepare(make_client(), args.users, max(args.concurrency))
+    results = [
+      run(make_client, context, endpoint, concurrency, args.duration)
+      for endpoint in args.endpoints for concurrency in args.concurrency
+    ]
+
+    baseline = None
+    if args.baseline:
+      with open(args.baseline) as f:
+        baseline = json.load(f)
+    report(results, baseline)
+    if args.json_path:
+      with open(args.json_path, 'w') as f:
+        json.dump({
+          'meta': {
+            'mode': 'http' if args.url else 'in-process', 'url': args.url, 'users': args.users,
+            'items': None if args.url else args.items,
+            'duration': args.duration, 'python': platform.python_version(),
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+          },
+          'results': results,
+        }, f, ensure_ascii=False, indent=2)
+  finally:
+    if temporary and db_path is not None:
+      os.remove(db_path)
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
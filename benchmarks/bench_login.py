@@ -0,0 +1,83 @@
+"""
+ログインAPIの同時実行ベンチマーク
+
+  python -m benchmarks.bench_login [同時実行数 ...]
+
+同時実行数ぶんのスレッドから /api/v1/login を繰り返し呼び、
+成功したリクエストのレイテンシ（p50/p95/p99）と、503（混雑）で断られた割合を出す
+ハッシュ計算の同時実行数・待ちの上限は PASSWORD_HASH_WORKERS / PASSWORD_HASH_QUEUE_SIZE で変えられる
+（環境変数 BENCH_BCRYPT_ROUNDS でbcryptのcostも変えられる。既定は本番と同じ12）
+"""
+import os
+import sys
+import threading
+import time
+from sharefood import db
+from sharefood.models import User
+from .common import make_app, percentile, print_table
+
+DEFAULT_CONCURRENCY = [1, 4, 16, 64]
+REQUESTS_PER_THREAD = 5
+USERS = 64
+
+def seed(app):
+  with app.app_context():
+    password_hash = User(password='password').password_hash
+    db.session.execute(db.insert(User.__table__), [{
+      'username': f'user{i}', 'email_address': f'user{i}@example.com',
+      'password_hash': password_hash, 'is_verified': True,
+    } for i in range(USERS)])
+    db.session.commit()
+
+def run(app, concurrency):
+  latencies = []
+  rejected = [0]
+  lock = threading.Lock()
+  start_line = threading.Barrier(concurrency)
+
+  def worker(index):
+    client = app.test_client()
+    body = {'email_address': f'user{index % USERS}@example.com', 'password': 'password'}
+    start_line.wait()
+    for _ in range(REQUESTS_PER_THREAD):
+      start = time.perf_counter()
+      status = client.post('/api/v1/login', json=body).status_code
+      elapsed = (time.perf_counter() - start) * 1000
+      with lock:
+        if status == 200:
+          latencies.append(elapsed)
+        elif status == 503:
+          rejected[0] += 1
+        else:
+          raise RuntimeError(f'unexpected status {status}')
+
+  threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+  started = time.perf_counter()
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  wall = time.perf_counter() - started
+
+  total = concurrency * REQUESTS_PER_THREAD
+  return [
+    concurrency, total, f'{len(latencies) / wall:.1f}',
+    f'{percentile(latencies, 50):.0f}', f'{percentile(latencies, 95):.0f}', f'{percentile(latencies, 99):.0f}',
+    f'{rejected[0] / total:.0%}',
+  ]
+
+def main(argv):
+  levels = [int(arg) for arg in argv] or DEFAULT_CONCURRENCY
+  rounds = int(os.getenv('BENCH_BCRYPT_ROUNDS', 12))
+  app, db_path = make_app(BCRYPT_LOG_ROUNDS=rounds)
+  try:
+    seed(app)
+    print(f"bcrypt cost={rounds} workers={app.config['PASSWORD_HASH_WORKERS']} "
+          f"queue={app.config['PASSWORD_HASH_QUEUE_SIZE']}")
+    rows = [run(app, level) for level in levels]
+    print_table(['concurrency', 'requests', 'ok/s', 'p50(ms)', 'p95(ms)', 'p99(ms)', '503'], rows)
+  finally:
+    os.remove(db_path)
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
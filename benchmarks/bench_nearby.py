@@ -0,0 +1,62 @@
+"""
+近くのアイテム検索（R*Tree + ハバーサイン）と全件スキャンの比較ベンチマーク
+
+  python -m benchmarks.bench_nearby [件数 ...]
+
+アイテムは日本全国に散らばらせ、東京駅の半径3km以内を検索する
+R*Treeを使った検索は周辺の件数にしか依存しないので、全体の件数が増えてもほぼ一定の時間で返る
+"""
+import os
+import random
+import sys
+from sharefood import db
+from sharefood.geo import find_nearby, haversine_km
+from sharefood.models import Item, User
+from .common import make_app, measure, print_table
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+CENTER = (35.681236, 139.767125)
+RADIUS_KM = 3
+# 日本のおおよその範囲
+LAT_RANGE = (31.0, 45.0)
+LNG_RANGE = (129.0, 146.0)
+
+def seed(size, rng):
+  db.session.execute(db.insert(User.__table__), [{
+    'id': 1, 'username': 'bench', 'email_address': 'bench@example.com',
+    'password_hash': 'x' * 60, 'is_verified': True,
+  }])
+  rows = [{
+    'name': '食品', 'quantity': 1, 'is_available': True, 'user_id': 1,
+    'latitude': rng.uniform(*LAT_RANGE), 'longitude': rng.uniform(*LNG_RANGE),
+  } for _ in range(size)]
+  db.session.execute(db.insert(Item.__table__), rows)
+  db.session.commit()
+
+def run(size):
+  app, db_path = make_app()
+  try:
+    with app.app_context():
+      seed(size, random.Random(size))
+
+      def full_scan():
+        rows = db.session.execute(db.select(Item.id, Item.latitude, Item.longitude)).all()
+        sorted(
+          (haversine_km(*CENTER, lat, lng), item_id) for item_id, lat, lng in rows
+          if haversine_km(*CENTER, lat, lng) <= RADIUS_KM
+        )
+
+      def indexed():
+        find_nearby(db.session, Item, *CENTER, RADIUS_KM, 20)
+
+      return [size, f'{measure(full_scan):.2f}', f'{measure(indexed):.2f}']
+  finally:
+    os.remove(db_path)
+
+def main(argv):
+  sizes = [int(arg) for arg in argv] or DEFAULT_SIZES
+  rows = [run(size) for size in sizes]
+  print_table(['items', 'full scan(ms)', 'r*tree(ms)'], rows)
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
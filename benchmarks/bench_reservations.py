@@ -0,0 +1,92 @@
+"""
+予約（在庫の確保）の競合ベンチマーク
+
+  python -m benchmarks.bench_reservations [スレッド数 ...]
+
+数量 QUANTITY のアイテム1件に、指定したスレッド数から合計 QUANTITY * 2 回の予約を同時に送り、
+1秒あたりの処理件数を測る。あわせて、成功した予約の数量の合計が元の数量と一致すること
+（売りすぎていないこと）、期限切れの処理で数量がすべて戻ることを確認する
+"""
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from flask_jwt_extended import create_access_token
+from sharefood import db
+from sharefood.models import Item, Reservation, User
+from sharefood.reservations import expire_reservations
+from .common import make_app, percentile, print_table
+
+DEFAULT_THREADS = [1, 4, 16, 32]
+QUANTITY = 500
+
+def run(threads_count):
+  app, db_path = make_app()
+  try:
+    with app.app_context():
+      users = [
+        User(username=f'bench{i}', email_address=f'bench{i}@example.com', password_hash='x' * 60, is_verified=True)
+        for i in range(threads_count + 1)
+      ]
+      db.session.add_all(users)
+      db.session.commit()
+      item = Item(name='人気の食品', quantity=QUANTITY, user_id=users[0].id)
+      db.session.add(item)
+      db.session.commit()
+      item_id = item.id
+      headers = [{'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'} for user in users[1:]]
+
+    attempts = QUANTITY * 2
+    per_thread = [attempts // threads_count + (1 if i < attempts % threads_count else 0) for i in range(threads_count)]
+    statuses, latencies = [], []
+    start_barrier = threading.Barrier(threads_count + 1)
+
+    def hammer(auth_header, count):
+      client = app.test_client()
+      start_barrier.wait()
+      for _ in range(count):
+        started = time.perf_counter()
+        status = client.post(f'/api/v1/items/{item_id}/reservations', headers=auth_header).status_code
+        latencies.append((time.perf_counter() - started) * 1000)
+        statuses.append(status)
+
+    threads = [threading.Thread(target=hammer, args=args) for args in zip(headers, per_thread)]
+    for thread in threads:
+      thread.start()
+    start_barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+      thread.join()
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+      remaining = db.session.get(Item, item_id).quantity
+      reserved = db.session.query(db.func.coalesce(db.func.sum(Reservation.quantity), 0)).scalar()
+      assert statuses.count(201) == QUANTITY and set(statuses) <= {201, 409}, statuses
+      assert remaining == 0 and reserved == QUANTITY, (remaining, reserved)
+
+      # すべての予約を期限切れにして、数量が元に戻ることを確認する
+      later = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(days=1)
+      expire_start = time.perf_counter()
+      expired = expire_reservations(now=later)
+      expire_ms = (time.perf_counter() - expire_start) * 1000
+      assert expired == QUANTITY and db.session.get(Item, item_id).quantity == QUANTITY
+      db.engine.dispose()
+
+    return [
+      threads_count, attempts, statuses.count(201), f'{attempts / elapsed:.0f}',
+      f'{percentile(latencies, 50):.1f}', f'{percentile(latencies, 99):.1f}', f'{expire_ms:.1f}', 'ok',
+    ]
+  finally:
+    os.remove(db_path)
+
+def main(argv):
+  threads = [int(arg) for arg in argv] or DEFAULT_THREADS
+  rows = [run(count) for count in threads]
+  print_table(
+    ['threads', 'requests', 'reserved', 'req/s', 'p50(ms)', 'p99(ms)', f'expire {QUANTITY}(ms)', 'no oversell'], rows
+  )
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
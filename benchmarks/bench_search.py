@@ -0,0 +1,69 @@
+"""
+全文検索インデックスと ilike('%...%') の比較ベンチマーク
+
+  python -m benchmarks.bench_search [件数 ...]
+
+件数を増やしたときに ilike は件数にほぼ比例して遅くなり、
+FTS5(trigram) の検索はヒット件数に応じた時間しかかからないことを確認する
+"""
+import os
+import random
+import sys
+from sharefood import db
+from sharefood.models import Item, User
+from sharefood.search import apply_search, build_search_text
+from .common import make_app, measure, print_table
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+FOODS = ['りんご', 'みかん', 'バナナ', 'にんじん', 'キャベツ', 'トマト', '食パン', '牛乳', 'お米', 'たまねぎ']
+ORIGINS = ['青森産', '愛媛産', '北海道産', '熊本産', '長野産', '千葉産']
+# 滅多にヒットしない語（ilikeは全件なめるが、インデックスならほぼ即座に返る）
+RARE_WORD = 'ドラゴンフルーツ'
+
+def seed(size, rng):
+  """size件のアイテムを一括INSERTする（そのうち数件だけRARE_WORDを含む）"""
+  db.session.execute(db.insert(User.__table__), [{
+    'id': 1, 'username': 'bench', 'email_address': 'bench@example.com',
+    'password_hash': 'x' * 60, 'is_verified': True,
+  }])
+  rows = []
+  for i in range(size):
+    name = rng.choice(FOODS) if i % 5000 else RARE_WORD
+    description = f'{rng.choice(ORIGINS)}の{name}です'
+    rows.append({
+      'name': name, 'description': description, 'quantity': 1, 'is_available': True,
+      'user_id': 1, 'search_text': build_search_text(name, description),
+    })
+  db.session.execute(db.insert(Item.__table__), rows)
+  db.session.commit()
+
+def run(size):
+  app, db_path = make_app()
+  try:
+    with app.app_context():
+      seed(size, random.Random(size))
+
+      def ilike_scan():
+        Item.query.filter(Item.name.ilike(f'%{RARE_WORD}%')).order_by(Item.created_at.desc()).limit(20).all()
+
+      def fts_search():
+        apply_search(Item.query, Item, RARE_WORD, ranked=True).limit(20).all()
+
+      def ilike_common():
+        Item.query.filter(Item.description.ilike('%青森産のりんご%')).limit(20).all()
+
+      def fts_common():
+        apply_search(Item.query, Item, '青森産のりんご').limit(20).all()
+
+      return [size, f'{measure(ilike_scan):.2f}', f'{measure(fts_search):.2f}',
+              f'{measure(ilike_common):.2f}', f'{measure(fts_common):.2f}']
+  finally:
+    os.remove(db_path)
+
+def main(argv):
+  sizes = [int(arg) for arg in argv] or DEFAULT_SIZES
+  rows = [run(size) for size in sizes]
+  print_table(['items', 'ilike rare(ms)', 'fts rare(ms)', 'ilike common(ms)', 'fts common(ms)'], rows)
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
@@ -0,0 +1,66 @@
+"""
+一覧レスポンスのシリアライズ比較ベンチマーク
+
+  python -m benchmarks.bench_serializer [件数 ...]
+
+ORMオブジェクト + items_schema.dump() と、行タプル + serializers.dump_item_rows() で、
+DBからの読み込みからJSON文字列にするまでの時間を比較する
+"""
+import json
+import os
+import random
+import sys
+from datetime import date, timedelta
+from sqlalchemy.orm import joinedload
+from sharefood import db
+from sharefood.models import Item, User
+from sharefood.schemas import items_schema
+from sharefood.serializers import dump_item_rows, item_rows_query
+from .common import make_app, measure, print_table
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+
+def seed(size, rng):
+  db.session.execute(db.insert(User.__table__), [{
+    'id': i, 'username': f'user{i}', 'email_address': f'user{i}@example.com',
+    'password_hash': 'x' * 60, 'is_verified': True,
+  } for i in range(1, 101)])
+  today = date.today()
+  rows = [{
+    'name': f'食品{i}', 'description': '説明文' * 5, 'quantity': rng.randint(1, 10), 'unit': '個',
+    'expiration_date': today + timedelta(days=rng.randint(0, 30)), 'location': '渋谷駅',
+    'is_available': True, 'img_url': f'photo_{i}.jpg' if i % 2 else None, 'user_id': rng.randint(1, 100),
+  } for i in range(size)]
+  db.session.execute(db.insert(Item.__table__), rows)
+  db.session.commit()
+
+def run(size):
+  app, db_path = make_app()
+  try:
+    with app.app_context():
+      seed(size, random.Random(size))
+
+    with app.test_request_context('/api/v1/items/'):
+      def schema_path():
+        items = Item.query.options(joinedload(Item.user)).order_by(Item.created_at.desc(), Item.id.desc()).all()
+        json.dumps(items_schema.dump(items))
+        db.session.expunge_all()
+
+      def fast_path():
+        rows = item_rows_query(Item.query).order_by(Item.created_at.desc(), Item.id.desc()).all()
+        json.dumps(dump_item_rows(rows))
+
+      repeat = 3 if size >= 100_000 else 5
+      schema_ms = measure(schema_path, repeat)
+      fast_ms = measure(fast_path, repeat)
+      return [size, f'{schema_ms:.1f}', f'{fast_ms:.1f}', f'{schema_ms / fast_ms:.1f}x']
+  finally:
+    os.remove(db_path)
+
+def main(argv):
+  sizes = [int(arg) for arg in argv] or DEFAULT_SIZES
+  rows = [run(size) for size in sizes]
+  print_table(['items', 'marshmallow(ms)', 'fast(ms)', 'speedup'], rows)
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
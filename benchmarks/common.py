@@ -0,0 +1,52 @@
+import os
+import statistics
+import tempfile
+import time
+from sharefood import create_app, db
+from sharefood.config import TestingConfig
+
+# ベンチマーク共通のヘルパー
+# テストと同じ TestingConfig をベースに、インメモリではなく一時ファイルのSQLiteを使う
+# （インメモリDBだとディスクI/Oやページキャッシュの影響が測れないため）
+
+def make_app(db_path=None, **overrides):
+  """ベンチマーク用のアプリと、作成したDBファイルのパスを返す"""
+  if db_path is None:
+    fd, db_path = tempfile.mkstemp(prefix='sharefood-bench-', suffix='.db')
+    os.close(fd)
+
+  class BenchConfig(TestingConfig):
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + db_path
+
+  for key, value in overrides.items():
+    setattr(BenchConfig, key, value)
+
+  app = create_app(config_class=BenchConfig)
+  with app.app_context():
+    db.create_all()
+  return app, db_path
+
+def measure(func, repeat=5):
+  """funcをrepeat回実行し、所要時間の中央値（ミリ秒）を返す"""
+  timings = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    func()
+    timings.append((time.perf_counter() - start) * 1000)
+  return statistics.median(timings)
+
+def percentile(samples, pct):
+  """サンプルのパーセンタイル値を返す（最近傍法）"""
+  if not samples:
+    return 0.0
+  ordered = sorted(samples)
+  index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+  return ordered[index]
+
+def print_table(headers, rows):
+  """結果を列揃えした表として標準出力に出す"""
+  widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+  line = '  '.join(f'{{:>{width}}}' for width in widths)
+  print(line.format(*headers))
+  for row in rows:
+    print(line.format(*row))
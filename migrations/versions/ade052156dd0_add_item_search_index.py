@@ -0,0 +1,56 @@
+"""Add item full-text search index
+
+Revision ID: ade052156dd0
+Revises: 6b9cc5b8f5ce
+Create Date: 2026-10-18 10:12:31.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from sharefood.search import build_search_text, postgres_ddl, sqlite_ddl
+
+
+# revision identifiers, used by Alembic.
+revision = 'ade052156dd0'
+down_revision = '6b9cc5b8f5ce'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('search_text', sa.Text(), nullable=True))
+
+    # 既存のアイテムの search_text を埋める（正規化はPython側の関数で行う）
+    bind = op.get_bind()
+    item = sa.table('item', sa.column('id'), sa.column('name'), sa.column('description'), sa.column('search_text'))
+    rows = bind.execute(sa.select(item.c.id, item.c.name, item.c.description)).all()
+    if rows:
+        bind.execute(
+            item.update().where(item.c.id == sa.bindparam('item_id')).values(search_text=sa.bindparam('text')),
+            [{'item_id': row.id, 'text': build_search_text(row.name, row.description)} for row in rows]
+        )
+
+    if bind.dialect.name == 'sqlite':
+        for statement in sqlite_ddl():
+            op.execute(statement)
+        # 外部コンテンツテーブルを既存の行から作り直す
+        op.execute("INSERT INTO item_search(item_search) VALUES ('rebuild')")
+    elif bind.dialect.name == 'postgresql':
+        for statement in postgres_ddl():
+            op.execute(statement)
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS item_search_ai")
+        op.execute("DROP TRIGGER IF EXISTS item_search_ad")
+        op.execute("DROP TRIGGER IF EXISTS item_search_au")
+        op.execute("DROP TABLE IF EXISTS item_search")
+    elif bind.dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_item_search_text_trgm")
+
+    with op.batch_alter_table('item', schema=None) as batch_op:
+        batch_op.drop_column('search_text')
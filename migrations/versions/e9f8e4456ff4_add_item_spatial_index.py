@@ -0,0 +1,43 @@
+"""Add item spatial index
+
+Revision ID: e9f8e4456ff4
+Revises: ade052156dd0
+Create Date: 2026-10-18 11:03:47.581902
+
+"""
+from alembic import op
+
+from sharefood.geo import postgres_ddl, sqlite_ddl
+
+
+# revision identifiers, used by Alembic.
+revision = 'e9f8e4456ff4'
+down_revision = 'ade052156dd0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        for statement in sqlite_ddl():
+            op.execute(statement)
+        # 既存の位置情報付きアイテムをR*Treeに登録する
+        op.execute(
+            "INSERT INTO item_geo SELECT id, latitude, latitude, longitude, longitude FROM item "
+            "WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+        )
+    elif bind.dialect.name == 'postgresql':
+        for statement in postgres_ddl():
+            op.execute(statement)
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS item_geo_ai")
+        op.execute("DROP TRIGGER IF EXISTS item_geo_ad")
+        op.execute("DROP TRIGGER IF EXISTS item_geo_au")
+        op.execute("DROP TABLE IF EXISTS item_geo")
+    elif bind.dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_item_latitude_longitude")
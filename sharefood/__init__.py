@@ -4,30 +4,38 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
-from flask_bcrypt import Bcrypt
 from .config import Config
 from flask_mail import Mail
+from .cache import response_cache
+from .hashing import PasswordHasher, HashingBusyError
+from .images import ImagePipeline
+from .revocation import token_blocklist
+from .user_cache import user_cache
 
 # --- 拡張機能のインスタンスを作成 ---
 db = SQLAlchemy()    # SQLAlchemyを利用するためのオブジェクト
 migrate = Migrate()  # マイグレーションを管理するオブジェクト
 cors = CORS()        # frontendとbackendを繋げるためのCORS設定用オブジェクト
 jwt = JWTManager()   # JWT（JSON Web Token）を扱うオブジェクト
-bcrypt = Bcrypt()    # パスワードをハッシュ化するオブジェクト
+password_hasher = PasswordHasher() # パスワードをハッシュ化するオブジェクト（同時実行数を制限したスレッドで実行）
 mail = Mail()        # メアド認証機能
+image_pipeline = ImagePipeline() # アップロード画像の検証と縮小版の作成
 
 # プロジェクトのルートディレクトリ (ShareFood-backend) を取得
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 
 def create_app(testing=False, config_class=Config):
     """アプリケーションファクトリ関数"""
-    # フロントエンドのビルドファイルが格納されている静的フォルダを明示的に指定
-    # これでFlaskはどこにあるindex.htmlを返せばいいか分かるようになる
-    static_folder_path = os.path.join(project_root, 'static')
-    app = Flask(__name__, static_folder=static_folder_path, static_url_path='')
+    # 静的ファイルはFlask組み込みのstaticルートではなく view_route.py で配信する
+    app = Flask(__name__, static_folder=None)
 
     # --- ここで渡されたconfig_classから設定を読み込む ---
     app.config.from_object(config_class)
+
+    # フロントエンドのビルドファイルが格納されている静的フォルダ
+    # これでどこにあるindex.htmlを返せばいいか分かるようになる
+    # （テストなどで別の場所を使う場合は、設定クラスの STATIC_FOLDER で指定する）
+    app.config['STATIC_FOLDER'] = app.config.get('STATIC_FOLDER') or os.path.join(project_root, 'static')
     
     # 画像保存先設定
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -39,8 +47,12 @@ def create_app(testing=False, config_class=Config):
     migrate.init_app(app, db, render_as_batch=True)
     cors.init_app(app, resources={r"/api/*": {"origins": "*"}})
     jwt.init_app(app)
-    bcrypt.init_app(app)
+    password_hasher.init_app(app)
     mail.init_app(app)
+    response_cache.init_app(app)
+    token_blocklist.init_app(app)
+    user_cache.init_app(app)
+    image_pipeline.init_app(app)
 
     # --- 共通エラーハンドラの登録 ---
     @app.errorhandler(404)
@@ -48,20 +60,33 @@ def create_app(testing=False, config_class=Config):
         """404 Not FoundエラーをJSONで返す"""
         return jsonify({"message": error.description or "リソースが見つかりません"}), 404
 
+    @app.errorhandler(413)
+    def request_entity_too_large(error):
+        """413 Request Entity Too LargeエラーをJSONで返す"""
+        return jsonify({"message": "アップロードするファイルが大きすぎます"}), 413
+
     @app.errorhandler(500)
     def internal_error(error):
         """500 Internal Server ErrorをJSONで返す"""
         return jsonify({"message": "サーバー内部でエラーが発生しました"}), 500
 
+    @app.errorhandler(HashingBusyError)
+    def hashing_busy_error(error):
+        """パスワードのハッシュ計算が混み合っているときは503と再試行までの秒数を返す"""
+        response = jsonify({"message": "只今混み合っています。しばらくしてから再度お試しください"})
+        response.headers['Retry-After'] = str(error.retry_after)
+        return response, 503
+
     with app.app_context():
         # --- ルーティングとモデルのインポート ---
         # ファクトリ内でインポートすることで循環参照を避けます。
         from .routes import (
             register_route, login_route, profile_route, 
             logout_route, item_route, view_route,
-            refresh_route, upload_route, verify_email_route
+            refresh_route, upload_route, verify_email_route,
+            reservation_route, metrics_route
         )
-        from . import models
+        from . import models, mail_outbox, storage, reservations, metrics, slow_queries, lazy_loads, seeding
 
         # ブループリントの登録
         app.register_blueprint(register_route.bp)
@@ -73,6 +98,23 @@ def create_app(testing=False, config_class=Config):
         app.register_blueprint(refresh_route.bp)
         app.register_blueprint(upload_route.bp)
         app.register_blueprint(verify_email_route.bp)
+        app.register_blueprint(reservation_route.bp)
+        app.register_blueprint(metrics_route.bp)
+
+        # メール送信箱（CLIコマンドと送信スレッド）
+        mail_outbox.init_app(app)
+        # アップロード画像の管理（CLIコマンド）
+        storage.init_app(app)
+        # 予約の期限切れ処理（CLIコマンドと定期実行のスレッド）
+        reservations.init_app(app)
+        # リクエストの処理時間とSQLの計測（/metrics で公開する）
+        metrics.init_app(app)
+        # 遅いSQLのログと実行計画（CLIコマンド）
+        slow_queries.init_app(app)
+        # 遅延ロード（N+1問題）の検出（開発・テスト用）
+        lazy_loads.init_app(app)
+        # ベンチマーク・ステージング用のデータ投入（flask seed）
+        seeding.init_app(app)
     
         # JWTのエラーハンドリングを追加すると、より親切なエラーメッセージを返せます
         @jwt.unauthorized_loader
@@ -83,4 +125,22 @@ def create_app(testing=False, config_class=Config):
         def invalid_token_callback(error):
             return jsonify({"message": "無効な認証トークンです"}), 422
 
+        # ログアウトで無効にしたトークンを拒否する（revocation.py参照）
+        @jwt.token_in_blocklist_loader
+        def check_if_token_revoked(jwt_header, jwt_payload):
+            return token_blocklist.is_revoked(jwt_payload['jti'])
+
+        @jwt.revoked_token_loader
+        def revoked_token_callback(jwt_header, jwt_payload):
+            return jsonify({"message": "このトークンは無効になっています。もう一度ログインしてください"}), 401
+
+        # current_user はキャッシュから返す（user_cache.py参照）
+        @jwt.user_lookup_loader
+        def user_lookup_callback(jwt_header, jwt_data):
+            return user_cache.load(int(jwt_data['sub']))
+
+        @jwt.user_lookup_error_loader
+        def user_lookup_error_callback(jwt_header, jwt_data):
+            return jsonify({"message": "ユーザーが見つかりません"}), 404
+
     return app
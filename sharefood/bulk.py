@@ -0,0 +1,127 @@
+from datetime import date
+from sqlalchemy import delete, not_, select, update
+from . import db
+from .cache import response_cache
+from .models import Item, Reservation
+
+# 出品者自身のアイテムをまとめて更新・削除する処理
+# ORMオブジェクトを1件ずつ読み込んで変更・コミットするのではなく、
+#   UPDATE item SET ... WHERE user_id = :me AND (id IN (...) または絞り込み条件) RETURNING id
+# のような集合指向のSQL文1つで処理する。所有者のチェックもWHERE句の中で行うので、
+# 他人のアイテムのIDが混ざっていても、そのアイテムは単に対象にならない
+#
+# RETURNINGに対応していないDBでは、同じ条件でIDを先にSELECTしてから、そのIDに対して更新・削除する
+# 1件だけの出品停止/再開・削除（toggle_owned_item / delete_owned_item）も同じ考え方で、読み込まずに条件付きの1文で処理する
+# ORMを通さない文なので、コミット後にレスポンスキャッシュを明示的に無効にする
+# 削除では、ORMのカスケードもSQLiteの外部キー（ON DELETE CASCADE）も働かないので、
+# 対象アイテムの予約も同じトランザクションで削除する（残すと存在しないアイテムへの予約になる）
+
+def selection_criteria(user_id, ids=None, filters=None):
+  """
+  対象アイテムのWHERE条件のリストを返す（所有者の条件は必ず含める）
+  ids: 対象のIDのリスト
+  filters: {'is_available': bool, 'expired': bool, 'expires_before': date} のうち指定したもの
+  """
+  criteria = [Item.user_id == user_id]
+  if ids is not None:
+    criteria.append(Item.id.in_(ids))
+  filters = filters or {}
+  if 'is_available' in filters:
+    criteria.append(Item.is_available.is_(filters['is_available']))
+  if 'expired' in filters:
+    expired = Item.expiration_date < date.today()
+    criteria.append(expired if filters['expired'] else not_(expired))
+  if 'expires_before' in filters:
+    criteria.append(Item.expiration_date < filters['expires_before'])
+  return criteria
+
+def supports_returning(kind):
+  """使っているDBが UPDATE ... RETURNING（kind='update'）/ DELETE ... RETURNING（kind='delete'）に対応しているか"""
+  dialect = db.session.get_bind().dialect
+  return dialect.update_returning if kind == 'update' else dialect.delete_returning
+
+def _execute_returning(statement, criteria, columns, kind):
+  """
+  statement（UPDATE/DELETE）を criteria で絞り込んで実行し、対象になった行の columns を返す
+  RETURNINGが使えないDBでは、先に対象行をロックしてSELECTし、そのIDに対して実行する
+  """
+  if supports_returning(kind):
+    result = db.session.execute(
+      statement.where(*criteria).returning(*columns).execution_options(synchronize_session=False)
+    )
+    return result.all()
+
+  rows = db.session.execute(select(*columns).where(*criteria).with_for_update()).all()
+  if rows:
+    ids = [row.id for row in rows]
+    db.session.execute(statement.where(Item.id.in_(ids)).execution_options(synchronize_session=False))
+  return rows
+
+def _commit(rows):
+  db.session.commit()
+  if rows:
+    response_cache.invalidate('items')
+
+def bulk_update(criteria, changes):
+  """対象アイテムに changes を設定し、更新したIDのリストを返す"""
+  rows = _execute_returning(update(Item).values(**changes), criteria, [Item.id], 'update')
+  _commit(rows)
+  return sorted(row.id for row in rows)
+
+def bulk_toggle(criteria):
+  """対象アイテムの出品状態を反転し、[(ID, 反転後の is_available)] を返す"""
+  rows = _execute_returning(
+    update(Item).values(is_available=not_(Item.is_available)), criteria, [Item.id, Item.is_available], 'update'
+  )
+  if rows and not supports_returning('update'):
+    # SELECTしたのは反転前の値
+    rows = [(row.id, not row.is_available) for row in rows]
+  _commit(rows)
+  return sorted((row_id, bool(is_available)) for row_id, is_available in rows)
+
+def _delete_reservations(criteria):
+  """criteria に当てはまるアイテムへの予約を削除する（アイテムより先に消して、同じトランザクションでコミットする）"""
+  db.session.execute(
+    delete(Reservation)
+    .where(Reservation.item_id.in_(select(Item.id).where(*criteria).scalar_subquery()))
+    .execution_options(synchronize_session=False)
+  )
+
+def bulk_delete(criteria):
+  """対象アイテムとその予約を削除し、削除したIDのリストを返す"""
+  _delete_reservations(criteria)
+  rows = _execute_returning(delete(Item), criteria, [Item.id], 'delete')
+  _commit(rows)
+  return sorted(row.id for row in rows)
+
+def _owned_item(item_id, user_id):
+  return [Item.id == item_id, Item.user_id == user_id]
+
+def toggle_owned_item(item_id, user_id):
+  """
+  自分のアイテム1件の出品状態を反転し、反転後の is_available を返す（対象がなければ None）
+  Pythonで読んで反転して書き戻すと、同時に切り替えたときに片方の変更が失われるので、DB側で NOT を取る
+  """
+  criteria = _owned_item(item_id, user_id)
+  statement = update(Item).values(is_available=not_(Item.is_available)).where(*criteria)
+  if supports_returning('update'):
+    is_available = db.session.scalar(
+      statement.returning(Item.is_available).execution_options(synchronize_session=False)
+    )
+  else:
+    # 先に更新して行をロックしてから、同じトランザクションで反転後の値を読む
+    result = db.session.execute(statement.execution_options(synchronize_session=False))
+    is_available = db.session.scalar(select(Item.is_available).where(*criteria)) if result.rowcount else None
+  _commit(is_available is not None)
+  return None if is_available is None else bool(is_available)
+
+def delete_owned_item(item_id, user_id):
+  """自分のアイテム1件とその予約を削除し、削除できたかを返す"""
+  _delete_reservations(_owned_item(item_id, user_id))
+  statement = delete(Item).where(*_owned_item(item_id, user_id)).execution_options(synchronize_session=False)
+  if supports_returning('delete'):
+    deleted = db.session.scalar(statement.returning(Item.id)) is not None
+  else:
+    deleted = db.session.execute(statement).rowcount > 0
+  _commit(deleted)
+  return deleted
@@ -0,0 +1,220 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+from flask import current_app, has_app_context, make_response, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, inspect
+
+# アイテム取得APIのレスポンスキャッシュとETagによる条件付きGET
+#
+# キャッシュキーには名前空間ごとの「世代番号」を含める。書き込みがあったら世代番号を1つ進めるだけで、
+# 古い世代のエントリは二度と参照されなくなり、LRU/TTLで自然に消える（キーを探して消す必要がない）
+#
+# 世代番号はItem（と出品者名）の変更をコミットしたときに自動で進む（下の after_flush / after_commit）
+# ORMを通さないUPDATE/DELETE文で書き込む場合は response_cache.invalidate() を明示的に呼ぶこと
+#
+# バックエンドは CACHE_BACKEND で切り替える
+#   'lru'   : プロセス内のLRU（デフォルト）。gunicornの各ワーカーが別々に持つので、
+#             他のワーカーでの書き込みはTTLが切れるまで反映されない
+#   'redis' : Redis互換のサーバー（CACHE_REDIS_URL）。全ワーカーで世代番号とキャッシュを共有する
+#   'null'  : キャッシュしない（ETagによる304は有効）
+
+class LRUCache:
+  """TTL付きのスレッドセーフなLRUキャッシュ（プロセス内）"""
+
+  def __init__(self, max_entries=1024, clock=time.monotonic):
+    self.max_entries = max_entries
+    self._clock = clock
+    self._entries = OrderedDict()
+    self._counters = {}  # 世代番号はLRUで追い出されないよう別に持つ
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+      value, expires_at = entry
+      if expires_at is not None and expires_at <= self._clock():
+        del self._entries[key]
+        return None
+      self._entries.move_to_end(key)
+      return value
+
+  def set(self, key, value, ttl=None):
+    expires_at = self._clock() + ttl if ttl else None
+    with self._lock:
+      self._entries[key] = (value, expires_at)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+
+  def delete(self, key):
+    with self._lock:
+      self._entries.pop(key, None)
+
+  def __len__(self):
+    with self._lock:
+      return len(self._entries)
+
+  def get_counter(self, key):
+    with self._lock:
+      return self._counters.get(key, 0)
+
+  def incr(self, key):
+    with self._lock:
+      self._counters[key] = self._counters.get(key, 0) + 1
+      return self._counters[key]
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self._counters.clear()
+
+class RedisCache:
+  """Redis互換クライアント（get / set(ex=) / incr / delete を持つもの）を使うキャッシュ"""
+
+  def __init__(self, client, prefix='sharefood:cache:'):
+    self.client = client
+    self.prefix = prefix
+
+  def get(self, key):
+    return self.client.get(self.prefix + key)
+
+  def set(self, key, value, ttl=None):
+    self.client.set(self.prefix + key, value, ex=ttl or None)
+
+  def get_counter(self, key):
+    value = self.client.get(self.prefix + key)
+    return int(value) if value is not None else 0
+
+  def incr(self, key):
+    return int(self.client.incr(self.prefix + key))
+
+  def clear(self):
+    # 世代番号を進めれば既存のエントリは参照されなくなる
+    pass
+
+class NullCache:
+  """何もキャッシュしないバックエンド（テストや、キャッシュを無効にしたいとき用）"""
+
+  def get(self, key):
+    return None
+
+  def set(self, key, value, ttl=None):
+    pass
+
+  def get_counter(self, key):
+    return 0
+
+  def incr(self, key):
+    return 0
+
+  def clear(self):
+    pass
+
+def _create_backend(config):
+  backend = config.get('CACHE_BACKEND', 'lru')
+  if not isinstance(backend, str):
+    return backend  # バックエンドのインスタンスが直接渡された場合
+  if backend == 'lru':
+    return LRUCache(max_entries=config.get('CACHE_MAX_ENTRIES', 1024))
+  if backend == 'null':
+    return NullCache()
+  if backend == 'redis':
+    try:
+      import redis
+    except ImportError as err:
+      raise RuntimeError("CACHE_BACKEND='redis' を使うには redis パッケージが必要です") from err
+    return RedisCache(redis.Redis.from_url(config['CACHE_REDIS_URL']))
+  raise ValueError(f'未対応のCACHE_BACKENDです: {backend}')
+
+def _make_etag(body):
+  return hashlib.sha256(body).hexdigest()
+
+def _pack(etag, mimetype, body):
+  return f'{etag}\n{mimetype}\n'.encode() + body
+
+def _unpack(value):
+  etag, mimetype, body = value.split(b'\n', 2)
+  return etag.decode(), mimetype.decode(), body
+
+class ResponseCache:
+  """Flask拡張として使うレスポンスキャッシュ（__init__.py で init_app する）"""
+
+  def init_app(self, app):
+    app.extensions['response_cache'] = _create_backend(app.config)
+    app.config.setdefault('CACHE_DEFAULT_TTL', 60)
+
+  @property
+  def backend(self):
+    return current_app.extensions['response_cache']
+
+  def _generation_key(self, namespace):
+    return f'{namespace}:generation'
+
+  def invalidate(self, namespace):
+    """名前空間のキャッシュをすべて無効にする（世代番号を進める）"""
+    self.backend.incr(self._generation_key(namespace))
+
+  def cached(self, namespace, ttl=None):
+    """
+    GETのレスポンス(200)をキャッシュし、強いETagを付けるデコレーター
+    If-None-Match が一致すれば、ビュー関数（ORMやmarshmallow）を呼ばずに304を返す
+    """
+    def decorator(view):
+      @wraps(view)
+      def wrapper(*args, **kwargs):
+        backend = self.backend
+        generation = backend.get_counter(self._generation_key(namespace))
+        query = urlencode(sorted(request.args.items(multi=True)))
+        key = f'{namespace}:{generation}:{request.path}?{query}'
+
+        value = backend.get(key)
+        if value is not None:
+          etag, mimetype, body = _unpack(value)
+          response = current_app.response_class(body, status=200, mimetype=mimetype)
+        else:
+          response = make_response(view(*args, **kwargs))
+          if response.status_code != 200:
+            return response
+          body = response.get_data()
+          etag = _make_etag(body)
+          backend.set(key, _pack(etag, response.mimetype, body), ttl or current_app.config['CACHE_DEFAULT_TTL'])
+
+        response.set_etag(etag)
+        # 変更があるまでは同じETagが返るので、毎回サーバーに確認してもらう
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+      return wrapper
+    return decorator
+
+response_cache = ResponseCache()
+
+# --- ORMの変更を検知して自動で無効化する ---
+def _touches_items(session):
+  from .models import Item, User
+  for obj in (*session.new, *session.dirty, *session.deleted):
+    if isinstance(obj, Item):
+      return True
+    # アイテムのレスポンスには出品者名が含まれる
+    if isinstance(obj, User) and inspect(obj).attrs.username.history.has_changes():
+      return True
+  return False
+
+@event.listens_for(Session, 'after_flush')
+def _record_item_changes(session, flush_context):
+  if _touches_items(session):
+    session.info['items_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+  if session.info.pop('items_changed', False) and has_app_context():
+    response_cache.invalidate('items')
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+  session.info.pop('items_changed', None)
@@ -0,0 +1,8 @@
+from datetime import datetime, timezone
+
+# DBに保存する日時はタイムゾーンなしのUTCで揃えている（SQLiteの CURRENT_TIMESTAMP と同じ）。
+# 現在時刻と比べたり保存したりするときは、datetime.now() ではなくこの utcnow() を使う
+
+def utcnow():
+  """タイムゾーン情報を外した現在のUTC時刻"""
+  return datetime.now(timezone.utc).replace(tzinfo=None)
@@ -10,6 +10,8 @@ from dotenv import load_dotenv
 project_root = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
 
 UPLOAD_FOLDER = os.path.join(project_root, 'sharefood', 'static', 'uploads')
+# 処理前のアップロード画像を置く一時フォルダ（配信されない場所にする）
+IMAGE_SPOOL_FOLDER = os.path.join(project_root, 'var', 'upload_spool')
 
 # .env ファイルをロード
 load_dotenv()
@@ -36,6 +38,18 @@ class Config:
   JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
   JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30) # リフレッシュトークンの有効期限を30日に設定
 
+  # ログアウトしたトークンの無効化（revocation.py参照）
+  JWT_REVOCATION_STORE = os.getenv('JWT_REVOCATION_STORE', 'db')          # 'db' | 'redis'
+  JWT_REVOCATION_REDIS_URL = os.getenv('JWT_REVOCATION_REDIS_URL')        # 未設定なら CACHE_REDIS_URL を使う
+  JWT_REVOCATION_FILTER_CAPACITY = 100_000                                # ブルームフィルターに入れる想定の件数
+  JWT_REVOCATION_FILTER_ERROR_RATE = 0.001                                # 誤判定（ストアへの無駄な問い合わせ）の割合
+  JWT_REVOCATION_SYNC_SECONDS = int(os.getenv('JWT_REVOCATION_SYNC_SECONDS', 5))  # 他のプロセスの無効化を取り込む間隔
+  JWT_REVOCATION_REBUILD_SECONDS = 3600                                   # 期限切れを消してフィルターを作り直す間隔
+
+  # 認証済みユーザーのキャッシュ（user_cache.py参照）
+  JWT_USER_CACHE_TTL = int(os.getenv('JWT_USER_CACHE_TTL', 30))           # 他のワーカーでの変更が反映されるまでの最大秒数
+  JWT_USER_CACHE_MAX_ENTRIES = 10_000
+
   # メール設定 (Flask-Mail)
   MAIL_SERVER = os.getenv('MAIL_SERVER', 'smtp.example.com') # 例: smtp.gmail.com
   MAIL_PORT = int(os.getenv('MAIL_PORT', 587))
@@ -44,6 +58,26 @@ class Config:
   MAIL_PASSWORD = os.getenv('MAIL_PASSWORD') # アプリケーションパスワード推奨
   MAIL_DEFAULT_SENDER = os.getenv('MAIL_DEFAULT_SENDER', 'no-reply@example.com')
 
+  # メール送信箱の設定（mail_outbox.py参照）
+  MAIL_OUTBOX_AUTOSTART = os.getenv('MAIL_OUTBOX_AUTOSTART', 'True').lower() in ('true', '1', 't') # Webサーバーのプロセス内のスレッドで送信するか
+  MAIL_OUTBOX_BATCH_SIZE = 50              # 1本のSMTP接続でまとめて送る件数
+  MAIL_OUTBOX_MAX_ATTEMPTS = 6             # この回数失敗したら送信不能(dead)にする
+  MAIL_OUTBOX_RETRY_BASE_SECONDS = 30      # 再送までの待ち時間（失敗するたびに2倍）
+  MAIL_OUTBOX_RETRY_MAX_SECONDS = 3600     # 再送までの待ち時間の上限
+  MAIL_OUTBOX_CLAIM_TIMEOUT_SECONDS = 600  # 送信処理が落ちて取得中のまま残った行を取り直すまでの時間
+  MAIL_OUTBOX_POLL_INTERVAL = 5            # 送信スレッドが送信箱を確認する間隔（秒）
+
+  # パスワードのハッシュ化（hashing.py参照）
+  BCRYPT_LOG_ROUNDS = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))                 # bcryptのcost。変えると次回ログイン時にハッシュし直す
+  PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)) # 同時に実行するハッシュ計算の数
+  PASSWORD_HASH_QUEUE_SIZE = int(os.getenv('PASSWORD_HASH_QUEUE_SIZE', 16))   # 実行待ちにできる数。超えたら503を返す
+  PASSWORD_HASH_RETRY_AFTER = 1                                               # 503のRetry-After（秒）
+
+  # フロントエンドのビルド成果物の配信（static_assets.py参照）
+  STATIC_SENDFILE_MODE = os.getenv('STATIC_SENDFILE_MODE')                   # None | 'x-sendfile' | 'x-accel-redirect'
+  STATIC_ACCEL_PREFIX = os.getenv('STATIC_ACCEL_PREFIX', '/_static/')        # X-Accel-Redirect で使うnginxの内部location
+  UPLOADS_ACCEL_PREFIX = os.getenv('UPLOADS_ACCEL_PREFIX', '/_uploads/')
+
   # フロントエンドのベースURL (メール認証リンク生成用)
   FRONTEND_BASE_URL = os.getenv('FRONTEND_BASE_URL', 'http://localhost:3000')
 
@@ -53,6 +87,47 @@ class Config:
   # 画像アップロードの保存先
   UPLOAD_FOLDER = UPLOAD_FOLDER
   ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+  MAX_CONTENT_LENGTH = 32 * 1024 * 1024 # リクエスト全体の上限（超えたら413）
+
+  # アップロード画像の処理（images.py参照）
+  IMAGE_SPOOL_FOLDER = IMAGE_SPOOL_FOLDER
+  IMAGE_VARIANT_WIDTHS = (160, 480, 1080)  # 縮小版の幅（px）。それぞれJPEGとWebPを作る
+  IMAGE_QUALITY = 82                       # JPEG・WebPの画質
+  IMAGE_MAX_BYTES = 10 * 1024 * 1024       # 1ファイルの上限
+  IMAGE_MAX_PIXELS = 40_000_000            # 画素数の上限（巨大な画像でメモリを使い切らないように）
+  IMAGE_WORKERS = 2                        # 画像を処理するスレッドの数
+
+  # 参照されなくなったアップロード画像のGC（storage.py参照）
+  UPLOAD_GC_GRACE_SECONDS = 24 * 3600                                        # これより新しいファイルは消さない
+  UPLOAD_GC_INTERVAL_SECONDS = int(os.getenv('UPLOAD_GC_INTERVAL_SECONDS', 0)) # アプリ内で定期実行する間隔（0なら実行しない）
+  UPLOAD_QUARANTINE_FOLDER = os.getenv('UPLOAD_QUARANTINE_FOLDER')           # 設定すると削除せずにここへ移す
+
+  # アイテムの予約（reservations.py参照）
+  RESERVATION_TTL_SECONDS = 30 * 60                                                     # 予約してから出品者が確定するまでの期限
+  RESERVATION_EXPIRE_BATCH_SIZE = 500                                                   # 期限切れの処理で1回にコミットする件数
+  RESERVATION_EXPIRE_INTERVAL_SECONDS = int(os.getenv('RESERVATION_EXPIRE_INTERVAL_SECONDS', 0)) # アプリ内で期限切れを処理する間隔（0なら実行しない。cronで flask reservations expire を使う）
+
+  # Prometheus形式のメトリクス（/metrics、metrics.py参照）
+  METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() in ('true', '1', 't')
+  METRICS_DIR = os.getenv('METRICS_DIR')                                # 複数プロセスで動かすときの集計の置き場所（起動前に空にする）
+  METRICS_FLUSH_INTERVAL = int(os.getenv('METRICS_FLUSH_INTERVAL', 5))  # METRICS_DIR に書き出す間隔（秒）
+  METRICS_AUTH_TOKEN = os.getenv('METRICS_AUTH_TOKEN')                  # /metrics のBearerトークン（未設定なら集計だけして /metrics は404）
+
+  # 遅いSQLの記録（slow_queries.py参照）
+  SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', 200)) # これより時間のかかったSQLを記録する（0なら記録しない）
+  SLOW_QUERY_MAX_ENTRIES = 256                                               # 記録する文の種類の上限
+  SLOW_QUERY_EXPLAIN = True                                                  # 初めて遅かった文の実行計画を取るか
+
+  # 遅延ロード（N+1問題）の検出（lazy_loads.py参照）
+  LAZY_LOAD_DETECTION = os.getenv('LAZY_LOAD_DETECTION', 'False').lower() in ('true', '1', 't') # リクエストごとに遅延ロードを数える
+  LAZY_LOAD_THRESHOLD = 2                                                                       # 同じリレーションがこの回数読み込まれたら警告する
+  LAZY_LOAD_RAISE = False                                                                       # 警告の代わりに NPlusOneError を送出する
+
+  # アイテム取得APIのレスポンスキャッシュ（'lru' | 'redis' | 'null'、cache.py参照）
+  CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'lru')
+  CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')
+  CACHE_DEFAULT_TTL = int(os.getenv('CACHE_DEFAULT_TTL', 60)) # 秒
+  CACHE_MAX_ENTRIES = 1024
 
 class DevelopmentConfig(Config):
   # 開発環境用の設定
@@ -69,6 +144,12 @@ class TestingConfig(Config):
   SECRET_KEY = 'test-secret-key-for-testing' # テスト用の秘密鍵
   JWT_SECRET_KEY = 'test-jwt-secret-key-for-testing' # テスト用のJWT秘密鍵
   MAIL_SUPPRESS_SEND = True # テスト時にメール送信を抑制
+  MAIL_OUTBOX_AUTOSTART = False # テスト中は送信スレッドを動かさない
+  RESERVATION_EXPIRE_INTERVAL_SECONDS = 0 # テスト中は期限切れ処理のスレッドを動かさない
+  BCRYPT_LOG_ROUNDS = 4 # テストを速くするため、bcryptのcostを最小にする
+  CACHE_BACKEND = 'null' # テスト間でレスポンスキャッシュが残らないようにする
+  LAZY_LOAD_DETECTION = True # N+1になる変更を入れたらテストが失敗するようにする
+  LAZY_LOAD_RAISE = True
 
 class ProductionConfig(Config):
   # 本番環境用の設定
@@ -0,0 +1,156 @@
+import heapq
+import math
+from sqlalchemy import DDL, Integer, and_, cast, column, event, func, or_, select, table
+
+# 位置情報（Item.latitude / Item.longitude）による近傍検索
+# 1. 検索円を囲む緯度経度の矩形（バウンディングボックス）で空間インデックスから候補を絞る
+#      - SQLite     : R*Tree 仮想テーブル item_geo（itemテーブルのトリガーで同期）
+#      - PostgreSQL : (latitude, longitude) の複合B-treeインデックス
+# 2. 候補についてだけハバーサイン公式で正確な距離を計算し、半径外を除いて距離順に並べる
+# 矩形で絞るので、テーブル全体の件数ではなく「周辺の件数」に比例した時間で済む
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = math.pi * EARTH_RADIUS_KM / 180
+
+# --- SQLite (R*Tree) ---
+# R*Treeは座標を32bit浮動小数で持つ（外側に丸められる）ので、矩形の重なり判定で候補を取り、距離は元の値で計算する
+item_geo = table('item_geo', column('id'), column('min_lat'), column('max_lat'), column('min_lng'), column('max_lng'))
+
+_SQLITE_DDL = [
+  "CREATE VIRTUAL TABLE IF NOT EXISTS item_geo USING rtree(id, min_lat, max_lat, min_lng, max_lng)",
+  "CREATE TRIGGER IF NOT EXISTS item_geo_ai AFTER INSERT ON item BEGIN "
+  "INSERT INTO item_geo SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude "
+  "WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL; END",
+  "CREATE TRIGGER IF NOT EXISTS item_geo_ad AFTER DELETE ON item BEGIN "
+  "DELETE FROM item_geo WHERE id = old.id; END",
+  "CREATE TRIGGER IF NOT EXISTS item_geo_au AFTER UPDATE OF latitude, longitude ON item BEGIN "
+  "DELETE FROM item_geo WHERE id = old.id; "
+  "INSERT INTO item_geo SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude "
+  "WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL; END",
+]
+_SQLITE_DROP_DDL = ["DROP TABLE IF EXISTS item_geo"]
+
+# --- PostgreSQL ---
+_POSTGRES_DDL = [
+  "CREATE INDEX IF NOT EXISTS ix_item_latitude_longitude ON item (latitude, longitude)",
+]
+
+def sqlite_ddl():
+  """マイグレーションからも使う、SQLite用の空間インデックス作成DDL"""
+  return list(_SQLITE_DDL)
+
+def postgres_ddl():
+  """マイグレーションからも使う、PostgreSQL用のインデックス作成DDL"""
+  return list(_POSTGRES_DDL)
+
+def register_spatial_index(item_table):
+  """db.create_all() でitemテーブルが作られたときに、空間インデックスも一緒に作る"""
+  for statement in _SQLITE_DDL:
+    event.listen(item_table, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+  for statement in _SQLITE_DROP_DDL:
+    event.listen(item_table, 'before_drop', DDL(statement).execute_if(dialect='sqlite'))
+  for statement in _POSTGRES_DDL:
+    event.listen(item_table, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+
+def haversine_km(lat1, lng1, lat2, lng2):
+  """2点間の大円距離（km）"""
+  phi1, phi2 = math.radians(lat1), math.radians(lat2)
+  d_phi = phi2 - phi1
+  d_lambda = math.radians(lng2 - lng1)
+  a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+  return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def bounding_box(lat, lng, radius_km):
+  """
+  中心から半径radius_kmの円を囲む矩形を返す
+  戻り値は (south, north, [(west, east), ...])。日付変更線をまたぐ場合は経度の範囲が2つになる
+  """
+  d_lat = radius_km / KM_PER_DEGREE_LAT
+  south, north = max(-90.0, lat - d_lat), min(90.0, lat + d_lat)
+
+  # 極を含む場合や、経度1度あたりの距離が小さすぎる場合は経度で絞れない
+  if south <= -90.0 or north >= 90.0:
+    return south, north, [(-180.0, 180.0)]
+  d_lng = math.degrees(math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(lat)))))
+  if d_lng >= 180.0:
+    return south, north, [(-180.0, 180.0)]
+
+  west, east = lng - d_lng, lng + d_lng
+  if west < -180.0:
+    return south, north, [(west + 360.0, 180.0), (-180.0, east)]
+  if east > 180.0:
+    return south, north, [(west, 180.0), (-180.0, east - 360.0)]
+  return south, north, [(west, east)]
+
+def bbox_filter(stmt, model, dialect, south, north, lng_ranges):
+  """SELECT文に「矩形内にある」という条件を、空間インデックスを使う形で追加する"""
+  if dialect == 'sqlite':
+    # R*Treeの重なり判定（このWHERE句の形でR*Treeのインデックスが使われる）
+    lng_conditions = [and_(item_geo.c.max_lng >= west, item_geo.c.min_lng <= east) for west, east in lng_ranges]
+    return stmt.join(item_geo, item_geo.c.id == model.id).where(
+      item_geo.c.max_lat >= south, item_geo.c.min_lat <= north, or_(*lng_conditions)
+    )
+  lng_conditions = [model.longitude.between(west, east) for west, east in lng_ranges]
+  return stmt.where(model.latitude.between(south, north), or_(*lng_conditions))
+
+def viewport_ranges(west, east):
+  """地図の表示範囲の経度を範囲のリストにする（日付変更線をまたぐとwest > eastになる）"""
+  if west <= east:
+    return [(west, east)]
+  return [(west, 180.0), (-180.0, east)]
+
+def find_nearby(session, model, lat, lng, radius_km, limit, *criteria):
+  """
+  半径radius_km以内のアイテムIDを距離の近い順に最大limit件返す
+  戻り値は [(item_id, distance_km), ...]。criteriaで追加の絞り込み条件を渡せる
+  """
+  dialect = session.get_bind().dialect.name
+  south, north, lng_ranges = bounding_box(lat, lng, radius_km)
+  stmt = select(model.id, model.latitude, model.longitude)
+  stmt = bbox_filter(stmt, model, dialect, south, north, lng_ranges).where(*criteria)
+
+  hits = []
+  for item_id, item_lat, item_lng in session.execute(stmt):
+    distance = haversine_km(lat, lng, item_lat, item_lng)
+    if distance <= radius_km:
+      hits.append((item_id, distance))
+  return heapq.nsmallest(limit, hits, key=lambda hit: (hit[1], hit[0]))
+
+# --- 地図表示用のクラスタリング ---
+# ズームレベルごとに地図を格子に区切り、セルごとの件数と重心をGROUP BYで一度に集計する
+# タイル(256px)1枚をCELLS_PER_TILE×CELLS_PER_TILEに分けるので、マーカーはおおよそ64px間隔にまとまる
+CELLS_PER_TILE = 4
+
+def cell_size_degrees(zoom):
+  """ズームレベルに対応する格子1マスの大きさ（度）"""
+  return 360.0 / (2 ** zoom) / CELLS_PER_TILE
+
+def _cell_index(col, offset, cell, dialect):
+  """座標を格子の番号にする。offsetを足して正の値にしてから切り捨てる"""
+  scaled = (col + offset) / cell
+  if dialect == 'sqlite':
+    # SQLiteは環境によってfloor()が無いが、正の値ならINTEGERへのCASTが切り捨てになる
+    return cast(scaled, Integer)
+  return func.floor(scaled)
+
+def cluster_viewport(session, model, south, north, lng_ranges, zoom, *criteria):
+  """
+  矩形内のアイテムを格子ごとに集計する
+  戻り値は [{'count', 'latitude', 'longitude'}, ...]（latitude/longitudeはセル内の重心）
+  """
+  dialect = session.get_bind().dialect.name
+  cell = cell_size_degrees(zoom)
+  lat_cell = _cell_index(model.latitude, 90.0, cell, dialect).label('lat_cell')
+  lng_cell = _cell_index(model.longitude, 180.0, cell, dialect).label('lng_cell')
+  stmt = select(
+    lat_cell, lng_cell,
+    func.count(model.id).label('count'),
+    func.avg(model.latitude).label('latitude'),
+    func.avg(model.longitude).label('longitude'),
+  )
+  stmt = bbox_filter(stmt, model, dialect, south, north, lng_ranges).where(*criteria)
+  stmt = stmt.group_by(lat_cell, lng_cell)
+  return [
+    {'count': row.count, 'latitude': row.latitude, 'longitude': row.longitude}
+    for row in session.execute(stmt)
+  ]
@@ -0,0 +1,84 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt as _bcrypt
+from flask import current_app
+
+# パスワードのハッシュ化・照合
+# bcryptはわざと遅く作られている（cost=12で1回数百ミリ秒）ため、リクエストのスレッドでそのまま実行すると、
+# ログインや登録が集中したときに全ワーカーがbcryptで埋まり、他のAPIまで応答しなくなる
+# ここでは同時に実行するハッシュ計算の数を PASSWORD_HASH_WORKERS に制限し、
+# 待ちが PASSWORD_HASH_QUEUE_SIZE を超えたら HashingBusyError（503 + Retry-After）ですぐに断る
+#
+# cost（BCRYPT_LOG_ROUNDS）を変えても既存のハッシュはそのまま照合でき、
+# ログインに成功したときに新しいcostでハッシュし直す（User.check_password参照）
+
+class HashingBusyError(Exception):
+  """ハッシュ計算の待ちがいっぱいで、受け付けられなかったときの例外"""
+
+  def __init__(self, retry_after):
+    super().__init__('パスワードのハッシュ計算が混み合っています')
+    self.retry_after = retry_after
+
+class _HasherState:
+  """アプリごとのスレッドプールと、実行中・待ちの数を制限するセマフォ"""
+
+  def __init__(self, workers, queue_size):
+    self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hasher')
+    self.slots = threading.BoundedSemaphore(workers + queue_size)
+
+def hash_cost(password_hash):
+  """bcryptのハッシュ文字列（$2b$12$...）からcostを取り出す"""
+  try:
+    return int(password_hash.split('$')[2])
+  except (AttributeError, IndexError, ValueError):
+    return None
+
+class PasswordHasher:
+  """件数を制限したスレッドプールでbcryptを実行する拡張機能"""
+
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('BCRYPT_LOG_ROUNDS', 12)
+    app.config.setdefault('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+    app.config.setdefault('PASSWORD_HASH_QUEUE_SIZE', 16)
+    app.config.setdefault('PASSWORD_HASH_RETRY_AFTER', 1)
+    app.extensions['password_hasher'] = _HasherState(
+      app.config['PASSWORD_HASH_WORKERS'], app.config['PASSWORD_HASH_QUEUE_SIZE']
+    )
+
+  @property
+  def rounds(self):
+    return current_app.config['BCRYPT_LOG_ROUNDS']
+
+  def run(self, func, *args):
+    """
+    funcをハッシュ用のスレッドで実行し、終わるまで待って結果を返す
+    実行中と待ちの合計が上限に達していれば、待たずに HashingBusyError を出す
+    """
+    state = current_app.extensions['password_hasher']
+    if not state.slots.acquire(blocking=False):
+      raise HashingBusyError(current_app.config['PASSWORD_HASH_RETRY_AFTER'])
+    try:
+      future = state.executor.submit(func, *args)
+    except BaseException:
+      state.slots.release()
+      raise
+    future.add_done_callback(lambda _: state.slots.release())
+    return future.result()
+
+  def hash(self, password):
+    """設定されたcostでパスワードをハッシュ化する"""
+    salt = _bcrypt.gensalt(self.rounds)
+    return self.run(_bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+  def verify(self, password_hash, password):
+    """パスワードがハッシュと一致するか"""
+    return self.run(_bcrypt.checkpw, password.encode('utf-8'), password_hash.encode('utf-8'))
+
+  def needs_rehash(self, password_hash):
+    """ハッシュのcostが設定と違う（ハッシュし直すべき）か"""
+    return hash_cost(password_hash) != self.rounds
@@ -0,0 +1,220 @@
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from PIL import Image, ImageOps
+from flask import current_app
+from .storage import content_filename, save_hashed, touch
+
+# アップロード画像の処理パイプライン
+# リクエストの中では「中身が本当に許可された画像か」のチェック（ヘッダーを読むだけなので速い）と
+# 一時フォルダへの保存だけを行い、重い処理はバックグラウンドのスレッドで行う
+#   1. 向きをEXIFの回転情報どおりに直してから、EXIF（撮影場所などの位置情報を含む）を取り除いて保存し直す
+#   2. IMAGE_VARIANT_WIDTHS の各幅に縮小したJPEGとWebPを作る
+# 処理が終わるまで（通常は1秒未満）、画像URLは404になる
+#
+# 保存するファイル名はアップロードされた内容のハッシュから決まる（storage.py参照）
+# 同じ画像が再度アップロードされたときは、処理済みのファイルをそのまま使う
+# 縮小版のファイル名は元のファイル名から決まる（variant_filenames参照）ので、DBには元のファイル名だけを保存する
+
+# 拡張子と、Pillowが判定する画像形式の対応
+FORMATS_BY_EXTENSION = {'png': 'PNG', 'jpg': 'JPEG', 'jpeg': 'JPEG', 'gif': 'GIF'}
+# 保存するときの拡張子（画像形式から決める。ファイル名の拡張子は信用しない）
+EXTENSIONS_BY_FORMAT = {'PNG': 'png', 'JPEG': 'jpg', 'GIF': 'gif'}
+
+class InvalidImageError(ValueError):
+  """アップロードされたファイルが画像として受け付けられないときの例外"""
+
+class ImageTooLargeError(InvalidImageError):
+  """ファイルサイズや画素数が上限を超えているときの例外"""
+
+def variant_filenames(filename, width):
+  """元のファイル名から、幅widthの縮小版のファイル名 (JPEG, WebP) を返す"""
+  stem = os.path.splitext(filename)[0]
+  return f'{stem}_w{width}.jpg', f'{stem}_w{width}.webp'
+
+def stored_filenames(filename, widths):
+  """元画像と、すべての縮小版のファイル名のリスト"""
+  names = [filename]
+  for width in sorted(widths):
+    names.extend(variant_filenames(filename, width))
+  return names
+
+def _allowed_formats(allowed_extensions):
+  return sorted({FORMATS_BY_EXTENSION[ext] for ext in allowed_extensions if ext in FORMATS_BY_EXTENSION})
+
+def sniff_image(stream, allowed_extensions, max_bytes, max_pixels):
+  """
+  ファイルの中身から画像形式を判定し、(画像形式, 幅, 高さ) を返す
+  ファイル名の拡張子ではなく先頭のバイト列で判定するので、画像に見せかけた別のファイルは弾かれる
+  画像データ全体はデコードしない（ヘッダーだけ読む）
+  """
+  stream.seek(0, os.SEEK_END)
+  size = stream.tell()
+  stream.seek(0)
+  if size > max_bytes:
+    raise ImageTooLargeError(f'画像ファイルは{max_bytes // (1024 * 1024)}MB以下にしてください')
+
+  formats = _allowed_formats(allowed_extensions)
+  try:
+    with Image.open(stream, formats=formats) as image:
+      image_format, (width, height) = image.format, image.size
+  except (OSError, Image.DecompressionBombError) as err:
+    raise InvalidImageError(f"対応していない画像形式です（{', '.join(sorted(allowed_extensions))}のみ）") from err
+  finally:
+    stream.seek(0)
+
+  if width * height > max_pixels:
+    raise ImageTooLargeError('画像の画素数が大きすぎます')
+  return image_format, width, height
+
+def _to_rgb(image):
+  """JPEGで保存できるように、透過部分を白で塗りつぶしたRGB画像にする"""
+  if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+    image = image.convert('RGBA')
+    background = Image.new('RGB', image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+  return image.convert('RGB')
+
+def _save_atomic(image, path, **params):
+  """書き込み途中のファイルが配信されないよう、一時ファイルに書いてから置き換える"""
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+  try:
+    image.save(tmp_path, **params)
+    os.replace(tmp_path, path)
+  finally:
+    if os.path.exists(tmp_path):
+      os.remove(tmp_path)
+
+def process_image(source_path, dest_folder, filename, widths, quality):
+  """
+  source_path の画像からEXIFを取り除いた元画像と縮小版を dest_folder に書き出す
+  作成したファイル名のリストを返す
+  """
+  written = []
+  with Image.open(source_path) as original:
+    image_format = original.format
+    if image_format == 'GIF':
+      # GIFにはEXIFがないので、アニメーションを保ったままそのままコピーする
+      _save_atomic(original, os.path.join(dest_folder, filename), format='GIF', save_all=True)
+      image = original.convert('RGBA')
+    else:
+      # exif_transpose で向きを直した新しい画像には、元のEXIFは引き継がれない
+      image = ImageOps.exif_transpose(original)
+      image.info.pop('exif', None)
+      params = {'quality': quality} if image_format == 'JPEG' else {}
+      _save_atomic(image, os.path.join(dest_folder, filename), format=image_format, **params)
+    written.append(filename)
+
+    for width in sorted(widths):
+      variant = image.copy()
+      variant.thumbnail((width, width * 4), Image.Resampling.LANCZOS) # 縦長の写真も幅で揃える（拡大はしない）
+      jpeg_name, webp_name = variant_filenames(filename, width)
+      _save_atomic(_to_rgb(variant), os.path.join(dest_folder, jpeg_name), format='JPEG', quality=quality, optimize=True)
+      _save_atomic(variant, os.path.join(dest_folder, webp_name), format='WEBP', quality=quality, method=4)
+      written.extend([jpeg_name, webp_name])
+  return written
+
+class _PipelineState:
+  """アプリごとの処理スレッドと、処理中のジョブ（ファイル名ごと）"""
+
+  def __init__(self, workers):
+    self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-pipeline')
+    self.pending = {}
+    self.lock = threading.Lock()
+
+class ImagePipeline:
+  """アップロード画像の検証・保存・バックグラウンド処理を行う拡張機能"""
+
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('IMAGE_VARIANT_WIDTHS', (160, 480, 1080))
+    app.config.setdefault('IMAGE_QUALITY', 82)
+    app.config.setdefault('IMAGE_MAX_BYTES', 10 * 1024 * 1024)
+    app.config.setdefault('IMAGE_MAX_PIXELS', 40_000_000)
+    app.config.setdefault('IMAGE_WORKERS', 2)
+    os.makedirs(app.config['IMAGE_SPOOL_FOLDER'], exist_ok=True)
+    app.extensions['image_pipeline'] = _PipelineState(app.config['IMAGE_WORKERS'])
+
+  def accept(self, file):
+    """
+    アップロードされたファイルを検証して一時フォルダに保存し、バックグラウンド処理を登録する
+    DBに保存するファイル名を返す。受け付けられなければ InvalidImageError を出す
+    """
+    config = current_app.config
+    image_format, _, _ = sniff_image(
+      file.stream, config['ALLOWED_EXTENSIONS'], config['IMAGE_MAX_BYTES'], config['IMAGE_MAX_PIXELS']
+    )
+    digest, spool_path = save_hashed(file.stream, config['IMAGE_SPOOL_FOLDER'])
+    filename = content_filename(digest, EXTENSIONS_BY_FORMAT[image_format])
+    self.submit(spool_path, filename)
+    return filename
+
+  def submit(self, spool_path, filename):
+    """
+    一時フォルダの画像の処理をバックグラウンドで開始する（処理後に一時ファイルは消す）
+    同じファイルが処理済み・処理中なら何もしない
+    """
+    app = current_app._get_current_object()
+    state = app.extensions['image_pipeline']
+    with state.lock:
+      future = state.pending.get(filename)
+      if future is None:
+        if not self.is_stored(filename):
+          future = state.executor.submit(self._process, app, spool_path, filename)
+          state.pending[filename] = future
+          future.add_done_callback(lambda _: self._finish(state, filename))
+          return future
+        # 使い回すファイルがGC（storage.py）の猶予期間中に消されないよう、更新時刻を新しくする
+        touch(app.config['UPLOAD_FOLDER'], stored_filenames(filename, app.config['IMAGE_VARIANT_WIDTHS']))
+    os.remove(spool_path)
+    return future
+
+  @staticmethod
+  def _finish(state, filename):
+    with state.lock:
+      state.pending.pop(filename, None)
+
+  def is_accepted(self, filename):
+    """
+    /upload で受け付けた画像として使えるか（元画像が保存済みか、このプロセスでまだ処理中か）
+    /upload の直後は処理が終わるまで UPLOAD_FOLDER にファイルがないので、処理中のものも含める
+    """
+    state = current_app.extensions['image_pipeline']
+    with state.lock:
+      if filename in state.pending:
+        return True
+    return os.path.isfile(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
+
+  def is_stored(self, filename):
+    """元画像とすべての縮小版が保存済みか"""
+    config = current_app.config
+    return all(
+      os.path.exists(os.path.join(config['UPLOAD_FOLDER'], name))
+      for name in stored_filenames(filename, config['IMAGE_VARIANT_WIDTHS'])
+    )
+
+  @staticmethod
+  def _process(app, spool_path, filename):
+    try:
+      return process_image(
+        spool_path, app.config['UPLOAD_FOLDER'], filename,
+        app.config['IMAGE_VARIANT_WIDTHS'], app.config['IMAGE_QUALITY']
+      )
+    except Exception as err:
+      app.logger.error(f"画像の処理に失敗しました({filename}): {err}", exc_info=True)
+      raise
+    finally:
+      os.remove(spool_path)
+
+  def wait(self, timeout=None):
+    """処理中の画像がすべて終わるまで待つ（テストやプロセス終了前に使う）"""
+    state = current_app.extensions['image_pipeline']
+    with state.lock:
+      futures = list(state.pending.values())
+    wait_futures(futures, timeout=timeout)
@@ -0,0 +1,89 @@
+import os
+import traceback
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# 遅延ロード（N+1問題）の検出（開発・テスト用）
+#
+# LAZY_LOAD_DETECTION を有効にすると、リクエストの中で起きた遅延ロード
+# （item.user のようなリレーションの読み込みと、コミットなどで期限切れになった属性の読み直し）をすべて数え、
+# 同じリレーションが LAZY_LOAD_THRESHOLD 回以上読み込まれたら（= ループの中で1件ずつSELECTしている）、
+# 場所と一緒にWARNINGを出す。LAZY_LOAD_RAISE も有効なら NPlusOneError を送出する
+# TestingConfig では両方が有効なので、N+1になる変更を入れるとテストが失敗する
+#
+# 直し方は item_route.py の _load_item_with_owner のように、joinedload / selectinload で前もって読み込むこと
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class NPlusOneError(Exception):
+  """同じリレーションが1リクエストの中で繰り返し遅延ロードされた"""
+
+def _describe(orm_execute_state):
+  """遅延ロードなら 'Item.user' のような名前を、そうでなければNoneを返す"""
+  if not orm_execute_state.is_select:
+    return None
+  if orm_execute_state.lazy_loaded_from is not None:
+    return str(orm_execute_state.loader_strategy_path.prop)
+  if orm_execute_state.is_column_load:
+    # 期限切れの属性の読み直しと、deferred な列の読み込み
+    mapper = orm_execute_state.bind_mapper
+    return f'{mapper.class_.__name__}（属性の読み直し）' if mapper is not None else None
+  return None
+
+def _caller():
+  """このプロジェクトのコードの中で、遅延ロードを起こした場所（ファイル:行 関数名）"""
+  this_file = os.path.abspath(__file__)
+  for frame in reversed(traceback.extract_stack()):
+    path = os.path.abspath(frame.filename)
+    if path.startswith(PROJECT_DIR + os.sep) and path != this_file and 'site-packages' not in path:
+      return f'{os.path.relpath(path, PROJECT_DIR)}:{frame.lineno} {frame.name}'
+  return '(不明)'
+
+def lazy_loads():
+  """処理中のリクエストで起きた遅延ロードの回数（名前 -> 回数）"""
+  return dict(g.get('_lazy_loads') or {})
+
+@event.listens_for(Session, 'do_orm_execute')
+def _record_lazy_load(orm_execute_state):
+  # 数えるのは before_request から after_request までの間だけ
+  # （テストクライアントが残したリクエストコンテキストの中で動くテストのコードは対象外）
+  if not has_request_context():
+    return
+  counts = g.get('_lazy_loads')
+  if counts is None:
+    return
+  name = _describe(orm_execute_state)
+  if name is None:
+    return
+  counts[name] = counts.get(name, 0) + 1
+  if counts[name] != current_app.config['LAZY_LOAD_THRESHOLD']:
+    return
+
+  message = (
+    f'N+1の可能性: {name} が1リクエストの中で{counts[name]}回遅延ロードされました'
+    f'（{request.endpoint}, {_caller()}）'
+  )
+  current_app.logger.warning(message)
+  if current_app.config['LAZY_LOAD_RAISE']:
+    raise NPlusOneError(message)
+
+def _start():
+  g._lazy_loads = {}
+
+def _report(response):
+  counts = g.pop('_lazy_loads', None)
+  if counts:
+    current_app.logger.debug(
+      f"遅延ロード（{request.endpoint}）: {', '.join(f'{name} x{count}' for name, count in counts.items())}"
+    )
+  return response
+
+def init_app(app):
+  """設定の既定値を入れ、（有効なら）リクエストごとの集計をログに出す"""
+  app.config.setdefault('LAZY_LOAD_DETECTION', False)
+  app.config.setdefault('LAZY_LOAD_THRESHOLD', 2)
+  app.config.setdefault('LAZY_LOAD_RAISE', False)
+  if app.config['LAZY_LOAD_DETECTION']:
+    app.before_request(_start)
+    app.after_request(_report)
@@ -0,0 +1,167 @@
+import smtplib
+import uuid
+from datetime import timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from flask_mail import Message
+from sqlalchemy import and_, or_, select, update
+from . import db, mail
+from .clock import utcnow
+from .models import MailOutbox
+from .workers import PeriodicWorker
+
+# メールの送信箱（トランザクショナル・アウトボックス）
+# - リクエスト側は enqueue_mail() で mail_outbox に1行追加するだけ（ユーザー登録と同じトランザクションでコミットされる）
+# - 送信処理 dispatch_pending() が送信待ちの行をまとめて取得し、1本のSMTP接続を使い回して送る
+# - 失敗したら指数バックオフで再送し、MAIL_OUTBOX_MAX_ATTEMPTS 回失敗したら dead（送信不能）にする
+#
+# 送信処理の起動方法
+#   flask outbox dispatch        : 送信待ちがなくなるまで送って終了（cronなど向け）
+#   flask outbox dispatch --loop : 常駐して MAIL_OUTBOX_POLL_INTERVAL 秒ごとに送信
+#   MAIL_OUTBOX_AUTOSTART = True : Webサーバーの各プロセスで、最初のリクエストからバックグラウンドスレッドで送信処理を動かす
+#                                  （既定。CLIのプロセスでは動かない。False にする場合は上のどちらかを別に動かさないと、
+#                                    登録確認メールが送られない）
+# 複数の送信処理が同時に動いても、claim_token で行を取り合うので二重送信しない
+
+PENDING = 'pending'
+SENDING = 'sending'
+SENT = 'sent'
+DEAD = 'dead'
+
+# SMTPサーバーとの接続自体が使えなくなったエラー。残りはこのバッチでは送らず、次回に回す
+_CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError)
+
+def enqueue_mail(recipient, subject, body):
+  """送信するメールを送信箱に追加する（コミットは呼び出し側で行う）"""
+  message = MailOutbox(recipient=recipient, subject=subject, body=body, status=PENDING, next_attempt_at=utcnow())
+  db.session.add(message)
+  return message
+
+def retry_delay(attempts):
+  """attempts回目の失敗の後、次に送信を試みるまでの待ち時間（指数バックオフ）"""
+  base = current_app.config['MAIL_OUTBOX_RETRY_BASE_SECONDS']
+  maximum = current_app.config['MAIL_OUTBOX_RETRY_MAX_SECONDS']
+  return timedelta(seconds=min(maximum, base * 2 ** (attempts - 1)))
+
+def _claim_batch(batch_size):
+  """
+  送信待ちの行をbatch_size件まで取得中にして返す
+  取得中のまま一定時間たった行（送信処理が途中で落ちたもの）も取り直す
+  """
+  now = utcnow()
+  lease = timedelta(seconds=current_app.config['MAIL_OUTBOX_CLAIM_TIMEOUT_SECONDS'])
+  token = uuid.uuid4().hex
+  claimable = or_(
+    and_(MailOutbox.status == PENDING, MailOutbox.next_attempt_at <= now),
+    and_(MailOutbox.status == SENDING, MailOutbox.claimed_at < now - lease),
+  )
+  candidates = select(MailOutbox.id).where(claimable).order_by(MailOutbox.next_attempt_at).limit(batch_size)
+  # 外側のWHEREでも条件を確認し、同時に動いている別の送信処理が先に取った行は取らない
+  db.session.execute(
+    update(MailOutbox)
+    .where(MailOutbox.id.in_(candidates), claimable)
+    .values(status=SENDING, claim_token=token, claimed_at=now)
+    .execution_options(synchronize_session=False)
+  )
+  db.session.commit()
+  return MailOutbox.query.filter_by(claim_token=token, status=SENDING).order_by(MailOutbox.id).all()
+
+def _record_failure(message, error):
+  message.attempts += 1
+  message.last_error = f'{type(error).__name__}: {error}'
+  message.claim_token = None
+  if message.attempts >= current_app.config['MAIL_OUTBOX_MAX_ATTEMPTS']:
+    message.status = DEAD
+    current_app.logger.error(f"メール送信を諦めました(id={message.id}, 宛先={message.recipient}): {error}")
+  else:
+    message.status = PENDING
+    message.next_attempt_at = utcnow() + retry_delay(message.attempts)
+    current_app.logger.warning(f"メール送信に失敗したため再送します(id={message.id}, {message.attempts}回目): {error}")
+
+def _release(messages):
+  """送らなかった行を、試行回数を増やさずに送信待ちに戻す"""
+  for message in messages:
+    message.status = PENDING
+    message.claim_token = None
+
+def dispatch_pending(batch_size=None):
+  """
+  送信待ちのメールを1バッチ分送る。(取得した件数, 送信できた件数) を返す
+  バッチ内のメールは1本のSMTP接続で送る
+  """
+  batch_size = batch_size or current_app.config['MAIL_OUTBOX_BATCH_SIZE']
+  messages = _claim_batch(batch_size)
+  if not messages:
+    return 0, 0
+
+  sent = 0
+  try:
+    with mail.connect() as connection:
+      for index, message in enumerate(messages):
+        try:
+          connection.send(Message(message.subject, recipients=[message.recipient], body=message.body))
+        except _CONNECTION_ERRORS as err:
+          _record_failure(message, err)
+          _release(messages[index + 1:])
+          break
+        except Exception as err:
+          _record_failure(message, err)
+        else:
+          message.status = SENT
+          message.sent_at = utcnow()
+          message.claim_token = None
+          sent += 1
+  except _CONNECTION_ERRORS + (smtplib.SMTPException, OSError) as err:
+    # 接続（またはログイン）自体に失敗した場合は、取得した行すべてを失敗として扱う
+    for message in messages:
+      if message.status == SENDING:
+        _record_failure(message, err)
+  db.session.commit()
+  return len(messages), sent
+
+def dispatch_all():
+  """
+  今送れる送信待ちがなくなるまでバッチ送信を繰り返す。送信できた件数の合計を返す
+  失敗したメールは次回の送信予定時刻が未来になるので、ここでは再送されない
+  """
+  total = 0
+  while True:
+    claimed, sent = dispatch_pending()
+    total += sent
+    if claimed == 0:
+      return total
+
+class MailDispatcher(PeriodicWorker):
+  """アプリと同じプロセス内で送信処理を定期的に動かすスレッド"""
+
+  thread_name = 'mail-outbox-dispatcher'
+  interval_setting = 'MAIL_OUTBOX_POLL_INTERVAL'
+  label = 'メール送信処理'
+  run_at_start = True
+
+  def run_once(self):
+    dispatch_all()
+
+def init_app(app):
+  """CLIコマンドと、（MAIL_OUTBOX_AUTOSTART なら）最初のリクエストで動き出す送信スレッドを登録する"""
+  app.cli.add_command(outbox_cli)
+  if app.config.get('MAIL_OUTBOX_AUTOSTART'):
+    dispatcher = MailDispatcher(app)
+    app.extensions['mail_dispatcher'] = dispatcher
+    app.before_request(dispatcher.start_once)
+
+@click.group('outbox')
+def outbox_cli():
+  """メール送信箱の操作"""
+
+@outbox_cli.command('dispatch')
+@click.option('--loop', is_flag=True, help='常駐して定期的に送信する')
+@with_appcontext
+def dispatch_command(loop):
+  """送信待ちのメールを送る"""
+  if loop:
+    dispatcher = MailDispatcher(current_app._get_current_object())
+    dispatcher.run()
+    return
+  click.echo(f'{dispatch_all()}件のメールを送信しました')
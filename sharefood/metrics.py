@@ -0,0 +1,293 @@
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from .workers import PeriodicWorker
+
+# Prometheus形式のメトリクス（/metrics で公開する。routes/metrics_route.py）
+#
+# エンドポイント（Blueprint名.関数名）ごとに次を記録する
+#   sharefood_http_requests_total            : ステータスコードごとのリクエスト数
+#   sharefood_http_request_duration_seconds  : 処理時間のヒストグラム
+#   sharefood_sql_statements_total           : 発行したSQL文の数（SQLAlchemyのエンジンのイベントで数える）
+#   sharefood_sql_duration_seconds_total     : SQL文の実行時間の合計
+# リクエストの外（バックグラウンドのスレッドなど）で発行したSQLは endpoint="(background)" にまとめる
+#
+# 1リクエストあたりの処理は、ロックを1回取って辞書の値をいくつか足すだけなので、本番でも有効にしておける
+#
+# gunicornなどで複数のプロセスを動かす場合は METRICS_DIR に全プロセスで共有するディレクトリを設定する。
+# リクエストを処理した各プロセスは METRICS_FLUSH_INTERVAL 秒ごと（と終了時）に自分の集計を METRICS_DIR/metrics-<pid>-<id>.json に書き出し、
+# /metrics を処理したプロセスがすべてのファイルを合算して返す（終了したプロセスの分もカウンターとして残る）
+# METRICS_DIR はサーバーの起動前に空にしておくこと
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNMATCHED = '(unmatched)'    # どのルートにも一致しなかったリクエスト（404）
+BACKGROUND = '(background)'  # リクエストの外で発行したSQL
+
+class MetricsRegistry:
+  """1プロセス分の集計（スレッドセーフ）"""
+
+  def __init__(self, buckets=DEFAULT_BUCKETS):
+    self.buckets = tuple(buckets)
+    self.lock = threading.Lock()
+    self.requests = {}  # (endpoint, method, status) -> 件数
+    self.latency = {}   # (endpoint, method) -> [バケットごとの件数..., 合計秒数, 件数]
+    self.sql = {}       # endpoint -> [文の数, 合計秒数]
+    self.collectors = []  # (名前, 説明, 値を返す関数)。他の機能のカウンターを取り込む
+    self.sections = {}    # 名前 -> JSONにできる値を返す関数。他の機能の集計をプロセスごとのファイルに一緒に書き出す
+
+  def observe_request(self, endpoint, method, status, seconds):
+    index = bisect_left(self.buckets, seconds)
+    with self.lock:
+      key = (endpoint, method, status)
+      self.requests[key] = self.requests.get(key, 0) + 1
+      histogram = self.latency.get((endpoint, method))
+      if histogram is None:
+        histogram = self.latency[(endpoint, method)] = [0] * len(self.buckets) + [0.0, 0]
+      if index < len(self.buckets):
+        histogram[index] += 1
+      histogram[-2] += seconds
+      histogram[-1] += 1
+
+  def observe_sql(self, endpoint, count, seconds):
+    with self.lock:
+      totals = self.sql.get(endpoint)
+      if totals is None:
+        totals = self.sql[endpoint] = [0, 0.0]
+      totals[0] += count
+      totals[1] += seconds
+
+  def add_counter(self, name, help_text, func):
+    self.collectors.append((name, help_text, func))
+
+  def add_section(self, name, func):
+    self.sections[name] = func
+
+  def snapshot(self):
+    """JSONにできる形の集計を返す"""
+    with self.lock:
+      data = {
+        'buckets': list(self.buckets),
+        'requests': [[*key, count] for key, count in self.requests.items()],
+        'latency': [[*key, list(values)] for key, values in self.latency.items()],
+        'sql': [[endpoint, *totals] for endpoint, totals in self.sql.items()],
+      }
+    data['counters'] = [[name, help_text, func()] for name, help_text, func in self.collectors]
+    for name, func in self.sections.items():
+      data[name] = func()
+    return data
+
+def merge_snapshots(snapshots):
+  """複数プロセスの集計を合算する（バケットの境界が同じものだけ）"""
+  merged = {'buckets': None, 'requests': {}, 'latency': {}, 'sql': {}, 'counters': {}}
+  for data in snapshots:
+    if merged['buckets'] is None:
+      merged['buckets'] = data['buckets']
+    for *key, count in data['requests']:
+      key = tuple(key)
+      merged['requests'][key] = merged['requests'].get(key, 0) + count
+    if data['buckets'] == merged['buckets']:
+      for endpoint, method, values in data['latency']:
+        current = merged['latency'].get((endpoint, method))
+        merged['latency'][(endpoint, method)] = values if current is None else [a + b for a, b in zip(current, values)]
+    for endpoint, count, seconds in data['sql']:
+      current = merged['sql'].get(endpoint, [0, 0.0])
+      merged['sql'][endpoint] = [current[0] + count, current[1] + seconds]
+    for name, help_text, value in data['counters']:
+      current = merged['counters'].get(name, (help_text, 0))
+      merged['counters'][name] = (help_text, current[1] + value)
+  merged['buckets'] = merged['buckets'] or list(DEFAULT_BUCKETS)
+  return merged
+
+def _escape(value):
+  return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels):
+  return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+def _number(value):
+  return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render(merged):
+  """合算した集計をPrometheusのテキスト形式にする"""
+  lines = [
+    '# HELP sharefood_http_requests_total HTTP requests by endpoint, method and status code.',
+    '# TYPE sharefood_http_requests_total counter',
+  ]
+  for (endpoint, method, status), count in sorted(merged['requests'].items()):
+    lines.append(f'sharefood_http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+
+  lines += [
+    '# HELP sharefood_http_request_duration_seconds HTTP request latency by endpoint and method.',
+    '# TYPE sharefood_http_request_duration_seconds histogram',
+  ]
+  bounds = [_number(float(bound)) for bound in merged['buckets']] + ['+Inf']
+  for (endpoint, method), values in sorted(merged['latency'].items()):
+    cumulative = 0
+    for bound, count in zip(bounds, values[:-2] + [0]):
+      cumulative += count
+      bucket = cumulative if bound != '+Inf' else values[-1]
+      lines.append(
+        f'sharefood_http_request_duration_seconds_bucket{_labels(endpoint=endpoint, method=method, le=bound)} {bucket}'
+      )
+    labels = _labels(endpoint=endpoint, method=method)
+    lines.append(f'sharefood_http_request_duration_seconds_sum{labels} {_number(float(values[-2]))}')
+    lines.append(f'sharefood_http_request_duration_seconds_count{labels} {values[-1]}')
+
+  lines += [
+    '# HELP sharefood_sql_statements_total SQL statements executed, by endpoint.',
+    '# TYPE sharefood_sql_statements_total counter',
+  ]
+  lines += [f'sharefood_sql_statements_total{_labels(endpoint=endpoint)} {count}'
+            for endpoint, (count, _) in sorted(merged['sql'].items())]
+  lines += [
+    '# HELP sharefood_sql_duration_seconds_total Time spent executing SQL statements, by endpoint.',
+    '# TYPE sharefood_sql_duration_seconds_total counter',
+  ]
+  lines += [f'sharefood_sql_duration_seconds_total{_labels(endpoint=endpoint)} {_number(float(seconds))}'
+            for endpoint, (_, seconds) in sorted(merged['sql'].items())]
+
+  for name, (help_text, value) in sorted(merged['counters'].items()):
+    lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter', f'{name} {_number(value)}']
+  return '\n'.join(lines) + '\n'
+
+class MetricsFlusher(PeriodicWorker):
+  """
+  集計を METRICS_DIR に定期的に書き出すスレッド
+  flask db upgrade などCLIのプロセスでファイルを作らないよう、最初のリクエストで start_once() から動き出す
+  （gunicorn の --preload でも、fork した後の各ワーカーのpidでファイルを作れる）
+  """
+
+  thread_name = 'metrics-flusher'
+  interval_setting = 'METRICS_FLUSH_INTERVAL'
+  label = 'メトリクスの書き出し'
+
+  def __init__(self, app, directory):
+    super().__init__(app)
+    self.directory = directory
+    self.path = None
+
+  def start(self):
+    super().start()
+    atexit.register(self.flush)
+
+  def flush(self):
+    with self.app.app_context():
+      data = self.app.extensions['metrics'].snapshot()
+    if self.path is None:
+      os.makedirs(self.directory, exist_ok=True)
+      self.path = os.path.join(self.directory, f'metrics-{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+    tmp_path = f'{self.path}.tmp'
+    with open(tmp_path, 'w') as f:
+      json.dump(data, f)
+    os.replace(tmp_path, self.path)
+
+  def run_once(self):
+    self.flush()
+
+def read_snapshots(app):
+  """
+  METRICS_DIR にある全プロセスの集計を読む
+  このプロセスがリクエストを処理していれば、その分は最新の値を書き出してから読む（CLIのプロセスは書き出さない）
+  """
+  flusher = app.extensions.get('metrics_flusher')
+  if flusher is None:
+    return []
+  if flusher.active:
+    flusher.flush()
+  snapshots = []
+  for path in glob.glob(os.path.join(app.config['METRICS_DIR'], 'metrics-*.json')):
+    try:
+      with open(path) as f:
+        snapshots.append(json.load(f))
+    except (OSError, ValueError):
+      continue  # 書き出し中などで読めないファイルは飛ばす
+  return snapshots
+
+def collect():
+  """このプロセス（と、METRICS_DIR があれば他のプロセス）の集計を合算して返す"""
+  app = current_app._get_current_object()
+  if 'metrics_flusher' not in app.extensions:
+    return merge_snapshots([app.extensions['metrics'].snapshot()])
+  return merge_snapshots(read_snapshots(app))
+
+# --- リクエストとSQLの計測 ---
+def _before_request():
+  g._metrics_started = time.perf_counter()
+  g._metrics_sql = [0, 0.0]
+
+def _after_request(response):
+  started = g.pop('_metrics_started', None)
+  if started is not None:
+    endpoint = request.endpoint or UNMATCHED
+    registry = current_app.extensions['metrics']
+    registry.observe_request(endpoint, request.method, str(response.status_code), time.perf_counter() - started)
+    count, seconds = g.pop('_metrics_sql')
+    if count:
+      registry.observe_sql(endpoint, count, seconds)
+  return response
+
+def _listen_sql(app, engine):
+  registry = app.extensions['metrics']
+
+  @event.listens_for(engine, 'before_cursor_execute')
+  def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+  @event.listens_for(engine, 'after_cursor_execute')
+  def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_started
+    if not has_request_context():
+      registry.observe_sql(BACKGROUND, 1, elapsed)
+      return
+    totals = g.get('_metrics_sql')
+    if totals is not None:
+      totals[0] += 1
+      totals[1] += elapsed
+    else:
+      # after_request より後（teardownなど）で発行されたSQL
+      registry.observe_sql(request.endpoint or UNMATCHED, 1, elapsed)
+
+def _extension_counters(registry):
+  """他の機能が持っているカウンターを取り込む"""
+  from .revocation import token_blocklist
+  from .user_cache import user_cache
+  counters = [
+    ('sharefood_user_cache_hits_total', 'Authenticated user lookups served from the cache.', lambda: user_cache.stats()['hits']),
+    ('sharefood_user_cache_misses_total', 'Authenticated user lookups that queried the database.', lambda: user_cache.stats()['misses']),
+    ('sharefood_token_checks_total', 'JWT revocation checks.', lambda: token_blocklist.state.stats['checks']),
+    ('sharefood_token_filter_hits_total', 'JWT revocation checks that had to query the store.', lambda: token_blocklist.state.stats['filter_hits']),
+  ]
+  for name, help_text, func in counters:
+    registry.add_counter(name, help_text, func)
+
+def init_app(app):
+  """計測を有効にする（METRICS_ENABLED が偽なら何もしない）。db.init_app の後に呼ぶこと"""
+  app.config.setdefault('METRICS_ENABLED', True)
+  app.config.setdefault('METRICS_DIR', None)
+  app.config.setdefault('METRICS_FLUSH_INTERVAL', 5)
+  app.config.setdefault('METRICS_BUCKETS', DEFAULT_BUCKETS)
+  app.config.setdefault('METRICS_AUTH_TOKEN', None)
+  if not app.config['METRICS_ENABLED']:
+    return
+
+  from . import db
+  registry = MetricsRegistry(app.config['METRICS_BUCKETS'])
+  app.extensions['metrics'] = registry
+  _extension_counters(registry)
+  app.before_request(_before_request)
+  app.after_request(_after_request)
+  with app.app_context():
+    for engine in db.engines.values():
+      _listen_sql(app, engine)
+
+  if app.config['METRICS_DIR']:
+    flusher = MetricsFlusher(app, app.config['METRICS_DIR'])
+    app.extensions['metrics_flusher'] = flusher
+    app.before_request(flusher.start_once)
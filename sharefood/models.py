@@ -1,8 +1,13 @@
-from . import db, bcrypt # __init__.pyで定義したインスタンスをインポート
+from . import db, password_hasher # __init__.pyで定義したインスタンスをインポート
 from datetime import datetime, timedelta, timezone
 import secrets
 import hashlib
 from sqlalchemy import DateTime
+from sqlalchemy.dialects import sqlite
+from .search import build_search_text, register_search_index
+from .geo import register_spatial_index
+from .clock import utcnow
+from .hashing import HashingBusyError
 
 # nullable そのcolumnに(null)を許すかどうか(許す→True)
 # unique そのcolumnが他の行との重複を禁止にするかどうか→重複禁止(True)
@@ -32,11 +37,21 @@ class User(db.Model):
   def password(self, plain_text_password):
     # Userの中のpassword_hashに代入するからself.password_hashにする    
     # この段階でUser.password_hash関数が呼び出されてハッシュ化する
-    self.password_hash = bcrypt.generate_password_hash(plain_text_password).decode('utf-8')
+    self.password_hash = password_hasher.hash(plain_text_password)
 
   # こっちはログイン時にパスワードをハッシュ化する関数、上のハッシュ化パスワードと照合する
+  # 照合に成功し、保存されているハッシュのcostが設定(BCRYPT_LOG_ROUNDS)と違えば、新しいcostでハッシュし直す
+  # （コミットは呼び出し側で行う）
+  # ハッシュし直すのはついでの処理なので、ハッシュ計算が混み合っていたら今回は見送り、ログインは成功させる（次回のログインでやり直す）
   def check_password(self, attempted_password):
-    return bcrypt.check_password_hash(self.password_hash, attempted_password)
+    if not password_hasher.verify(self.password_hash, attempted_password):
+      return False
+    if password_hasher.needs_rehash(self.password_hash):
+      try:
+        self.password = attempted_password
+      except HashingBusyError:
+        pass
+    return True
 
   def generate_verification_token(self):
     """
@@ -56,6 +71,21 @@ class User(db.Model):
     return f'<User {self.username}>'
   
 class Item(db.Model):
+  # よく使う検索・並び替えの形に合わせた複合インデックス
+  # 一覧は (created_at, id) の降順で並べてキーセットページネーションするので、末尾は created_at, id に揃える
+  __table_args__ = (
+    # 一覧（絞り込みなし）
+    db.Index('ix_item_created_at_id', 'created_at', 'id'),
+    # 一覧（出品中/停止中で絞り込み）
+    db.Index('ix_item_is_available_created_at_id', 'is_available', 'created_at', 'id'),
+    # 出品者ごとの一覧・所有者での絞り込み
+    db.Index('ix_item_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+    # 出品中アイテムの賞味期限切れ・期限間近の抽出
+    db.Index('ix_item_is_available_expiration_date', 'is_available', 'expiration_date'),
+    # アップロード画像のGCが、ファイル名がどのアイテムからも参照されていないかを調べる（storage.py参照）
+    db.Index('ix_item_img_url', 'img_url'),
+  )
+
   id = db.Column(db.Integer, primary_key=True)
   name = db.Column(db.String(50), nullable=False)                    # 食品名
   description = db.Column(db.String(255))                            # 説明文
@@ -63,7 +93,12 @@ class Item(db.Model):
   unit = db.Column(db.String(10), default='個')                      # 単位（個, 袋, 本 など）
   expiration_date = db.Column(db.Date)                               # 賞味期限
   location = db.Column(db.String(120))                               # 受け渡し場所
-  created_at = db.Column(db.DateTime, server_default=db.func.now())  # 登録日時
+  # SQLiteのCURRENT_TIMESTAMPはマイクロ秒なしの文字列で保存されるため、バインド値も同じ形式に揃える
+  # （揃えないとページネーションのカーソル比較が文字列比較でずれる）
+  created_at = db.Column(
+    db.DateTime().with_variant(sqlite.DATETIME(truncate_microseconds=True), 'sqlite'),
+    server_default=db.func.now()
+  )                                                                  # 登録日時
   is_available = db.Column(db.Boolean, default=True)                 # 受け渡し可能かどうか
   img_url = db.Column(db.String(255))                                # 画像データ
   latitude = db.Column(db.Float)
@@ -71,4 +106,96 @@ class Item(db.Model):
   # Userとのリレーションを追加
   user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False) 
   user = db.relationship('User', backref=db.backref('items', lazy=True))
+  # 全文検索用に name と description を正規化して連結した文字列（search.py参照）
+  search_text = db.Column(db.Text)
+
+# name/description が変わったら保存前に search_text を作り直す
+@db.event.listens_for(Item, 'before_insert')
+@db.event.listens_for(Item, 'before_update')
+def _update_search_text(mapper, connection, target):
+  target.search_text = build_search_text(target.name, target.description)
+
+# create_all() で item テーブルを作るときに全文検索用・位置検索用の索引も作る
+register_search_index(Item.__table__)
+register_spatial_index(Item.__table__)
+
+
+class MailOutbox(db.Model):
+  """
+  送信待ちメールの送信箱（アウトボックス）
+  リクエスト中はここに1行追加するだけにして、実際のSMTP送信はバックグラウンドの送信処理が行う（mail_outbox.py参照）
+  日時はすべてタイムゾーンなしのUTCで保存する
+  """
+  __tablename__ = 'mail_outbox'
+  __table_args__ = (
+    # 送信処理が「送信待ちで、送信予定時刻を過ぎたもの」を探すためのインデックス
+    db.Index('ix_mail_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    db.Index('ix_mail_outbox_claim_token', 'claim_token'),
+  )
+
+  id = db.Column(db.Integer, primary_key=True)
+  recipient = db.Column(db.String(120), nullable=False)                       # 宛先
+  subject = db.Column(db.String(255), nullable=False)                         # 件名
+  body = db.Column(db.Text, nullable=False)                                   # 本文
+  status = db.Column(db.String(10), nullable=False, default='pending')        # pending / sending / sent / dead
+  attempts = db.Column(db.Integer, nullable=False, default=0)                 # 送信を試みた回数
+  next_attempt_at = db.Column(db.DateTime, nullable=False, default=utcnow)    # 次に送信を試みる時刻
+  claim_token = db.Column(db.String(32))                                      # 送信処理が取得中の目印
+  claimed_at = db.Column(db.DateTime)                                         # 送信処理が取得した時刻
+  last_error = db.Column(db.Text)                                             # 最後に失敗したときのエラー内容
+  created_at = db.Column(db.DateTime, server_default=db.func.now())
+  sent_at = db.Column(db.DateTime)
+
+  def __repr__(self):
+    return f'<MailOutbox {self.id} {self.status}>'
+
 
+class Reservation(db.Model):
+  """
+  受け取り希望者によるアイテムの予約
+  予約した時点で Item.quantity から数量を差し引いておき（在庫の確保）、
+  期限までに出品者が受け渡しを確定しなければ期限切れにして数量を戻す（reservations.py参照）
+  日時はすべてタイムゾーンなしのUTCで保存する
+  """
+  __tablename__ = 'reservation'
+  __table_args__ = (
+    # 期限切れの処理が「確定待ちで、期限を過ぎたもの」を探すためのインデックス
+    db.Index('ix_reservation_status_expires_at', 'status', 'expires_at'),
+    db.Index('ix_reservation_user_id_created_at', 'user_id', 'created_at'),
+    db.Index('ix_reservation_item_id', 'item_id'),
+  )
+
+  id = db.Column(db.Integer, primary_key=True)
+  item_id = db.Column(db.Integer, db.ForeignKey('item.id', ondelete='CASCADE'), nullable=False)
+  user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)   # 予約した人
+  quantity = db.Column(db.Integer, nullable=False)                            # 確保した数量
+  status = db.Column(db.String(10), nullable=False, default='pending')        # pending / confirmed / cancelled / expired
+  created_at = db.Column(db.DateTime, nullable=False)
+  expires_at = db.Column(db.DateTime, nullable=False)                         # これを過ぎても確定されなければ期限切れ
+  confirmed_at = db.Column(db.DateTime)
+
+  def __repr__(self):
+    return f'<Reservation {self.id} {self.status}>'
+
+
+class RevokedToken(db.Model):
+  """
+  ログアウトなどで無効にしたJWTのjti（revocation.py参照）
+  トークン自体の有効期限（expires_at）を過ぎたら不要なので削除する
+  日時はすべてタイムゾーンなしのUTCで保存する
+  """
+  __tablename__ = 'revoked_token'
+  __table_args__ = (
+    db.Index('ix_revoked_token_expires_at', 'expires_at'),
+  )
+
+  # idは各プロセスが「前回の同期以降に無効にされたもの」を取るためのカーソルにも使う
+  id = db.Column(db.Integer, primary_key=True)
+  jti = db.Column(db.String(36), nullable=False, unique=True)
+  token_type = db.Column(db.String(10), nullable=False)                       # access / refresh
+  user_id = db.Column(db.Integer)
+  revoked_at = db.Column(db.DateTime, nullable=False)
+  expires_at = db.Column(db.DateTime, nullable=False)
+
+  def __repr__(self):
+    return f'<RevokedToken {self.jti}>'
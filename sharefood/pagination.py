@@ -0,0 +1,69 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import literal, tuple_
+
+# キーセット（カーソル）ページネーション用のヘルパー
+# OFFSET方式だと深いページほど読み飛ばす行が増えて遅くなるため、
+# 「最後に返した行の (created_at, id)」より後ろだけを取得する方式にしている
+# カーソルはクライアントから見て中身を意識しない不透明な文字列として扱う
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+class InvalidCursorError(ValueError):
+  """カーソルやlimitの値が不正な場合に送出する例外"""
+
+def encode_cursor(created_at, item_id):
+  """(created_at, id) をURLセーフなbase64文字列に変換する"""
+  payload = json.dumps([created_at.isoformat(), item_id])
+  return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+  """encode_cursorで作ったカーソルを (created_at, id) に戻す"""
+  try:
+    padded = cursor + '=' * (-len(cursor) % 4)
+    created_at, item_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    if not isinstance(item_id, int):
+      raise TypeError
+    return datetime.fromisoformat(created_at), item_id
+  except (ValueError, TypeError) as err:
+    raise InvalidCursorError('カーソルの形式が正しくありません') from err
+
+def parse_limit(value):
+  """クエリパラメータのlimitを検証し、1〜MAX_LIMITの整数にして返す"""
+  if value is None:
+    return DEFAULT_LIMIT
+  try:
+    limit = int(value)
+  except ValueError as err:
+    raise InvalidCursorError('limitは整数で指定してください') from err
+  if limit < 1:
+    raise InvalidCursorError('limitは1以上で指定してください')
+  return min(limit, MAX_LIMIT)
+
+def keyset_filter(created_at_col, id_col, cursor):
+  """
+  created_at DESC, id DESC の並び順で、カーソルより後ろの行だけを絞り込む条件を作る
+  (created_at, id) < (:created_at, :id) の行値比較にしておくと、複合インデックスの範囲検索になる
+  created_at は server_default で必ず入るため NULL は考慮しない
+  """
+  created_at, item_id = cursor
+  # バインド値は列と同じ型で渡す（SQLiteでは日時の文字列表現を列と揃える必要がある）
+  return tuple_(created_at_col, id_col) < tuple_(literal(created_at, created_at_col.type), literal(item_id, id_col.type))
+
+def paginate(query, created_at_col, id_col, cursor, limit):
+  """
+  クエリにキーセット条件と並び順を適用し、(行のリスト, next_cursor) を返す
+  limit+1件取得して、次のページがあるかどうかを追加のCOUNTなしで判定する
+  """
+  if cursor is not None:
+    query = query.filter(keyset_filter(created_at_col, id_col, cursor))
+  rows = query.order_by(created_at_col.desc(), id_col.desc()).limit(limit + 1).all()
+
+  next_cursor = None
+  if len(rows) > limit:
+    rows = rows[:limit]
+    last = rows[-1]
+    next_cursor = encode_cursor(last.created_at, last.id)
+  return rows, next_cursor
@@ -0,0 +1,218 @@
+from collections import defaultdict
+from datetime import date, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import case, or_, select, update
+from . import db
+from .bulk import supports_returning
+from .cache import response_cache
+from .clock import utcnow
+from .models import Item, Reservation
+from .workers import PeriodicWorker
+
+# アイテムの予約（受け取り希望）
+# 人気のアイテムには同時にたくさんの予約が来るので、Item.quantity を読んでから引いて書き戻すと売りすぎる。
+# そこで在庫の確保は
+#   UPDATE item SET quantity = quantity - :n
+#   WHERE id = :id AND quantity >= :n AND is_available AND user_id != :me ...
+# という条件付きのUPDATE文1つで行い、更新できた（条件を満たした）ときだけ予約の行を追加する。
+# どのDBでも行単位のロックの中で条件が判定されるので、同時に何件来ても数量がマイナスにはならない
+#
+# 確定されないまま期限（RESERVATION_TTL_SECONDS）を過ぎた予約は、expire_reservations() がまとめて期限切れにして数量を戻す
+#   flask reservations expire                     : 期限切れの予約を処理して終了（通常はこちらをcronなどで定期的に実行する。
+#                                                   例: * * * * * cd /app && flask reservations expire）
+#   RESERVATION_EXPIRE_INTERVAL_SECONDS を設定     : アプリ起動時にバックグラウンドスレッドで定期的に処理する
+#                                                   （既定は0で動かさない。flask db upgrade などCLIのプロセスでもスレッドが
+#                                                     動いてしまうので、Webサーバーのプロセスの環境変数だけで設定すること）
+# PostgreSQLでは対象の行を FOR UPDATE SKIP LOCKED で取るので、複数の処理が同時に動いても同じ予約を取り合わない
+
+PENDING = 'pending'
+CONFIRMED = 'confirmed'
+CANCELLED = 'cancelled'
+EXPIRED = 'expired'
+
+class ReservationError(Exception):
+  """予約できない・確定できないときのエラー（status_code はAPIで返すステータスコード）"""
+
+  def __init__(self, message, status_code):
+    super().__init__(message)
+    self.message = message
+    self.status_code = status_code
+
+def _reservable(item_id, user_id, quantity):
+  """予約できるアイテムの条件（数量の確認も含む）"""
+  return [
+    Item.id == item_id,
+    Item.quantity >= quantity,
+    Item.is_available.is_(True),
+    Item.user_id != user_id,
+    or_(Item.expiration_date.is_(None), Item.expiration_date >= date.today()),
+  ]
+
+def _reject_reason(item_id, user_id, quantity):
+  """在庫を確保できなかった理由を ReservationError にして返す（失敗したときだけ読み込む）"""
+  item = db.session.get(Item, item_id)
+  if item is None:
+    return ReservationError('食品が見つかりません', 404)
+  if item.user_id == user_id:
+    return ReservationError('自分が出品した食品は予約できません', 400)
+  if not item.is_available or (item.expiration_date is not None and item.expiration_date < date.today()):
+    return ReservationError('この食品は現在受け付けていません', 409)
+  return ReservationError(f'数量が足りません（残り{item.quantity}{item.unit or ""}）', 409)
+
+def reserve(item_id, user_id, quantity=1):
+  """
+  アイテムの数量を quantity だけ確保して予約を作り、コミットして返す
+  確保できなければ ReservationError を送出する
+  """
+  result = db.session.execute(
+    update(Item)
+    .where(*_reservable(item_id, user_id, quantity))
+    .values(quantity=Item.quantity - quantity)
+    .execution_options(synchronize_session=False)
+  )
+  if result.rowcount == 0:
+    db.session.rollback()
+    raise _reject_reason(item_id, user_id, quantity)
+
+  now = utcnow()
+  ttl = timedelta(seconds=current_app.config['RESERVATION_TTL_SECONDS'])
+  reservation = Reservation(
+    item_id=item_id, user_id=user_id, quantity=quantity, status=PENDING, created_at=now, expires_at=now + ttl
+  )
+  db.session.add(reservation)
+  db.session.commit()
+  # ORMを通さないUPDATEなので、レスポンスキャッシュを明示的に無効にする
+  response_cache.invalidate('items')
+  return reservation
+
+def _restore_quantities(rows):
+  """[(item_id, quantity), ...] の数量をアイテムに戻す（アイテムの数によらずUPDATE文1つ）"""
+  totals = defaultdict(int)
+  for item_id, quantity in rows:
+    totals[item_id] += quantity
+  if totals:
+    db.session.execute(
+      update(Item)
+      .where(Item.id.in_(totals))
+      .values(quantity=Item.quantity + case(totals, value=Item.id))
+      .execution_options(synchronize_session=False)
+    )
+
+def cancel(reservation_id, user_id):
+  """予約した本人が確定前の予約を取り消し、数量を戻す。取り消せたかを返す"""
+  result = db.session.execute(
+    update(Reservation)
+    .where(Reservation.id == reservation_id, Reservation.user_id == user_id, Reservation.status == PENDING)
+    .values(status=CANCELLED)
+    .execution_options(synchronize_session=False)
+  )
+  if result.rowcount == 0:
+    db.session.rollback()
+    return False
+  # 状態を更新した時点でこの行はロックされているので、同じトランザクションで読んでから数量を戻す
+  row = db.session.execute(
+    select(Reservation.item_id, Reservation.quantity).where(Reservation.id == reservation_id)
+  ).one()
+  _restore_quantities([row])
+  db.session.commit()
+  response_cache.invalidate('items')
+  return True
+
+def confirm(reservation_id, owner_id):
+  """出品者が期限内の予約の受け渡しを確定する。確定できなければ ReservationError を送出する"""
+  now = utcnow()
+  owned_items = select(Item.id).where(Item.user_id == owner_id)
+  result = db.session.execute(
+    update(Reservation)
+    .where(
+      Reservation.id == reservation_id, Reservation.item_id.in_(owned_items),
+      Reservation.status == PENDING, Reservation.expires_at > now,
+    )
+    .values(status=CONFIRMED, confirmed_at=now)
+    .execution_options(synchronize_session=False)
+  )
+  db.session.commit()
+  if result.rowcount == 0:
+    reservation = db.session.get(Reservation, reservation_id)
+    item = db.session.get(Item, reservation.item_id) if reservation else None
+    if item is None or item.user_id != owner_id:
+      raise ReservationError('予約が見つかりません', 404)
+    raise ReservationError('この予約は確定できません（取り消し済みまたは期限切れ）', 409)
+
+def _expire_batch(now, batch_size):
+  """期限を過ぎた確定待ちの予約を batch_size 件まで期限切れにし、[(item_id, quantity)] を返す"""
+  expired = (Reservation.status == PENDING, Reservation.expires_at <= now)
+  # 同時に動いている別の処理がロックしている行は飛ばす（SKIP LOCKED に対応していないDBでは無視される）
+  candidates = (
+    select(Reservation.id, Reservation.item_id, Reservation.quantity)
+    .where(*expired)
+    .order_by(Reservation.expires_at)
+    .limit(batch_size)
+    .with_for_update(skip_locked=True)
+  )
+  statement = update(Reservation).values(status=EXPIRED).execution_options(synchronize_session=False)
+
+  if supports_returning('update'):
+    # 外側のWHEREでも条件を確認し、先に取り消し・確定された予約は数量を戻さない
+    ids = candidates.with_only_columns(Reservation.id).scalar_subquery()
+    result = db.session.execute(
+      statement.where(Reservation.id.in_(ids), *expired).returning(Reservation.item_id, Reservation.quantity)
+    )
+    return result.all()
+
+  rows = db.session.execute(candidates).all()
+  if rows:
+    db.session.execute(statement.where(Reservation.id.in_([row.id for row in rows]), *expired))
+  return [(row.item_id, row.quantity) for row in rows]
+
+def expire_reservations(batch_size=None, now=None):
+  """
+  期限切れの予約がなくなるまでバッチ単位で期限切れにし、数量を戻す。処理した件数を返す
+  バッチごとにコミットするので、長いトランザクションで予約APIを待たせない
+  """
+  batch_size = batch_size or current_app.config['RESERVATION_EXPIRE_BATCH_SIZE']
+  now = now or utcnow()
+  total = 0
+  while True:
+    rows = _expire_batch(now, batch_size)
+    _restore_quantities(rows)
+    db.session.commit()
+    total += len(rows)
+    if len(rows) < batch_size:
+      break
+  if total:
+    response_cache.invalidate('items')
+  return total
+
+class ReservationExpirer(PeriodicWorker):
+  """アプリと同じプロセス内で期限切れの予約を定期的に処理するスレッド"""
+
+  thread_name = 'reservation-expirer'
+  interval_setting = 'RESERVATION_EXPIRE_INTERVAL_SECONDS'
+  label = '予約の期限切れ処理'
+
+  def run_once(self):
+    expired = expire_reservations()
+    if expired:
+      self.app.logger.info(f"期限切れの予約を{expired}件処理しました")
+
+def init_app(app):
+  """CLIコマンドと、（RESERVATION_EXPIRE_INTERVAL_SECONDS が設定されていれば）期限切れ処理のスレッドを登録する"""
+  app.cli.add_command(reservations_cli)
+  if app.config.get('RESERVATION_EXPIRE_INTERVAL_SECONDS'):
+    expirer = ReservationExpirer(app)
+    app.extensions['reservation_expirer'] = expirer
+    expirer.start()
+
+@click.group('reservations')
+def reservations_cli():
+  """予約の管理"""
+
+@reservations_cli.command('expire')
+@click.option('--batch-size', type=int, default=None, help='1回のトランザクションで処理する件数（既定は RESERVATION_EXPIRE_BATCH_SIZE）')
+@with_appcontext
+def expire_command(batch_size):
+  """期限を過ぎた確定待ちの予約を期限切れにし、数量を戻す"""
+  click.echo(f'{expire_reservations(batch_size)}件の予約を期限切れにしました')
@@ -0,0 +1,264 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timezone
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from .clock import utcnow
+
+# JWTの無効化（ログアウトしたトークンを有効期限前でも使えなくする）
+#
+# 無効にしたトークンのjtiは「無効化ストア」（DBのテーブルかRedis互換サーバー）に保存し、
+# 各プロセスはその写しをブルームフィルター（メモリ上のビット列）で持つ。
+# リクエストごとの確認はまずフィルターを引き、「含まれていない」なら確実に無効化されていないので、
+# I/Oなしでそのまま通す。「含まれているかもしれない」ときだけストアに問い合わせる
+#
+# 他のプロセス（gunicornの別ワーカーなど）で無効にされたjtiは、JWT_REVOCATION_SYNC_SECONDS ごとに
+# 前回以降の分をストアから取ってフィルターに追加する。つまり別のプロセスでは最大でこの秒数だけ、
+# 無効にしたトークンが通る可能性がある（同じプロセスではすぐに反映される）
+#
+# ブルームフィルターからは削除できないので、JWT_REVOCATION_REBUILD_SECONDS ごとに、
+# 有効期限内のjtiだけでフィルターを作り直す。有効期限を過ぎたjtiのストアからの削除は、
+# 同じ間隔でトークンを無効にするとき（ログアウトの処理の中）に行う（確認する側のリクエストでは書き込まない）
+#   flask tokens prune : 有効期限を過ぎたjtiをストアから削除する（cronなど向け）
+#
+# ストアは JWT_REVOCATION_STORE で切り替える
+#   'db'    : revoked_token テーブル（デフォルト）
+#   'redis' : Redis互換のサーバー（JWT_REVOCATION_REDIS_URL、なければ CACHE_REDIS_URL）
+
+# 同期のたびに、前回のカーソルより少し前から取り直す
+# （採番とコミットの順番が前後して、前回の同期の時点では見えていなかった行を取りこぼさないように）
+SYNC_OVERLAP = 100
+
+class BloomFilter:
+  """
+  文字列の集合を固定サイズのビット列で表すブルームフィルター
+  「含まれていない」と判定したものは確実に含まれていない。「含まれている」は error_rate の確率で誤り
+  """
+
+  def __init__(self, capacity, error_rate=0.001):
+    capacity = max(1, capacity)
+    self.capacity = capacity
+    self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))  # ビット数
+    self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+    self.bits = bytearray((self.size + 7) // 8)
+    self.count = 0
+
+  def _positions(self, key):
+    # 1回のハッシュ計算から2つの値を取り、その組み合わせで hash_count 個の位置を作る
+    digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'little')
+    h2 = int.from_bytes(digest[8:], 'little') | 1
+    return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+  def add(self, key):
+    for position in self._positions(key):
+      self.bits[position >> 3] |= 1 << (position & 7)
+    self.count += 1
+
+  def __contains__(self, key):
+    return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class DatabaseRevocationStore:
+  """revoked_token テーブルを使う無効化ストア"""
+
+  def revoke(self, jti, token_type, user_id, expires_at):
+    # 循環インポートを避けるため、ここでインポートする
+    from sqlalchemy.exc import IntegrityError
+    from . import db
+    from .models import RevokedToken
+    # リクエストのセッションとは別の接続で書き込み、ビュー関数のトランザクションに影響しないようにする
+    try:
+      with db.engine.begin() as conn:
+        conn.execute(RevokedToken.__table__.insert().values(
+          jti=jti, token_type=token_type, user_id=user_id, revoked_at=utcnow(), expires_at=expires_at,
+        ))
+    except IntegrityError:
+      pass  # すでに無効化済み
+
+  def is_revoked(self, jti):
+    from sqlalchemy import select
+    from . import db
+    from .models import RevokedToken
+    with db.engine.connect() as conn:
+      return conn.execute(select(RevokedToken.id).where(RevokedToken.jti == jti)).first() is not None
+
+  def revoked_since(self, cursor):
+    """cursor より後に無効にされた、有効期限内のjtiのリストと、次のカーソルを返す"""
+    from sqlalchemy import select
+    from . import db
+    from .models import RevokedToken
+    with db.engine.connect() as conn:
+      rows = conn.execute(
+        select(RevokedToken.id, RevokedToken.jti)
+        .where(RevokedToken.id > cursor, RevokedToken.expires_at > utcnow())
+        .order_by(RevokedToken.id)
+      ).all()
+    return [row.jti for row in rows], max((row.id for row in rows), default=cursor)
+
+  def prune(self, now):
+    """有効期限を過ぎたjtiを削除し、削除した件数を返す"""
+    from . import db
+    from .models import RevokedToken
+    with db.engine.begin() as conn:
+      return conn.execute(RevokedToken.__table__.delete().where(RevokedToken.expires_at <= now)).rowcount
+
+class RedisRevocationStore:
+  """
+  Redis互換クライアント（set(ex=) / exists / incr / zadd / zrangebyscore / zrem を持つもの）を使う無効化ストア
+  jtiごとのキーは有効期限が切れるとRedisが消す。同期用に、無効にした順番（log）と有効期限（expiry）をソート済みセットで持つ
+  """
+
+  def __init__(self, client, prefix='sharefood:revoked:'):
+    self.client = client
+    self.prefix = prefix
+
+  def _key(self, jti):
+    return f'{self.prefix}jti:{jti}'
+
+  def revoke(self, jti, token_type, user_id, expires_at):
+    expires_ts = expires_at.replace(tzinfo=timezone.utc).timestamp()
+    ttl = max(1, math.ceil(expires_ts - time.time()))
+    self.client.set(self._key(jti), token_type, ex=ttl)
+    sequence = self.client.incr(self.prefix + 'sequence')
+    self.client.zadd(self.prefix + 'log', {jti: sequence})
+    self.client.zadd(self.prefix + 'expiry', {jti: expires_ts})
+
+  def is_revoked(self, jti):
+    return bool(self.client.exists(self._key(jti)))
+
+  def revoked_since(self, cursor):
+    entries = self.client.zrangebyscore(self.prefix + 'log', f'({cursor}', '+inf', withscores=True)
+    jtis = [member.decode() if isinstance(member, bytes) else member for member, _ in entries]
+    return jtis, max((int(score) for _, score in entries), default=cursor)
+
+  def prune(self, now):
+    expired = self.client.zrangebyscore(self.prefix + 'expiry', '-inf', now.replace(tzinfo=timezone.utc).timestamp())
+    if expired:
+      self.client.zrem(self.prefix + 'log', *expired)
+      self.client.zrem(self.prefix + 'expiry', *expired)
+    return len(expired)
+
+def _create_store(config):
+  store = config.get('JWT_REVOCATION_STORE', 'db')
+  if not isinstance(store, str):
+    return store  # ストアのインスタンスが直接渡された場合
+  if store == 'db':
+    return DatabaseRevocationStore()
+  if store == 'redis':
+    try:
+      import redis
+    except ImportError as err:
+      raise RuntimeError("JWT_REVOCATION_STORE='redis' を使うには redis パッケージが必要です") from err
+    url = config.get('JWT_REVOCATION_REDIS_URL') or config['CACHE_REDIS_URL']
+    return RedisRevocationStore(redis.Redis.from_url(url))
+  raise ValueError(f'未対応のJWT_REVOCATION_STOREです: {store}')
+
+class _BlocklistState:
+  """アプリごとのストアとフィルター"""
+
+  def __init__(self, store, capacity, error_rate, clock):
+    self.store = store
+    self.capacity = capacity
+    self.error_rate = error_rate
+    self.clock = clock
+    self.filter = BloomFilter(capacity, error_rate)
+    self.cursor = 0
+    self.synced_at = None
+    self.rebuilt_at = None
+    self.pruned_at = None
+    self.lock = threading.Lock()
+    # 確認した回数、フィルターに含まれていた（ストアに問い合わせた）回数、実際に無効化されていた回数
+    self.stats = {'checks': 0, 'filter_hits': 0, 'revoked': 0}
+
+class TokenBlocklist:
+  """JWTの無効化を扱うFlask拡張（__init__.py で init_app し、token_in_blocklist_loader から使う）"""
+
+  def init_app(self, app, clock=time.monotonic):
+    app.config.setdefault('JWT_REVOCATION_STORE', 'db')
+    app.config.setdefault('JWT_REVOCATION_FILTER_CAPACITY', 100_000)
+    app.config.setdefault('JWT_REVOCATION_FILTER_ERROR_RATE', 0.001)
+    app.config.setdefault('JWT_REVOCATION_SYNC_SECONDS', 5)
+    app.config.setdefault('JWT_REVOCATION_REBUILD_SECONDS', 3600)
+    app.extensions['token_blocklist'] = _BlocklistState(
+      _create_store(app.config), app.config['JWT_REVOCATION_FILTER_CAPACITY'],
+      app.config['JWT_REVOCATION_FILTER_ERROR_RATE'], clock,
+    )
+    app.cli.add_command(tokens_cli)
+
+  @property
+  def state(self):
+    return current_app.extensions['token_blocklist']
+
+  @property
+  def store(self):
+    return self.state.store
+
+  def revoke(self, payload):
+    """デコード済みのJWT（get_jwt() や decode_token() の戻り値）を無効にする"""
+    state = self.state
+    expires_at = datetime.fromtimestamp(payload['exp'], timezone.utc).replace(tzinfo=None)
+    subject = str(payload.get('sub', ''))
+    state.store.revoke(payload['jti'], payload['type'], int(subject) if subject.isdigit() else None, expires_at)
+    with state.lock:
+      state.filter.add(payload['jti'])
+
+    now = state.clock()
+    if state.pruned_at is None or now - state.pruned_at >= current_app.config['JWT_REVOCATION_REBUILD_SECONDS']:
+      state.pruned_at = now
+      state.store.prune(utcnow())
+
+  def is_revoked(self, jti):
+    """jtiが無効化されているか。フィルターに含まれていなければストアには問い合わせない"""
+    state = self.state
+    self._sync(state)
+    state.stats['checks'] += 1
+    if jti not in state.filter:
+      return False
+    state.stats['filter_hits'] += 1
+    revoked = state.store.is_revoked(jti)
+    if revoked:
+      state.stats['revoked'] += 1
+    return revoked
+
+  def _sync(self, state):
+    config = current_app.config
+    now = state.clock()
+    if state.synced_at is not None and now - state.synced_at < config['JWT_REVOCATION_SYNC_SECONDS']:
+      return
+    # 同期中は他のリクエストを待たせず、今のフィルターで判定する（最初の同期だけは終わるのを待つ）
+    if not state.lock.acquire(blocking=state.synced_at is None):
+      return
+    try:
+      if (state.rebuilt_at is None or now - state.rebuilt_at >= config['JWT_REVOCATION_REBUILD_SECONDS']
+          or state.filter.count > state.filter.capacity):
+        self._rebuild(state, now)
+      else:
+        jtis, state.cursor = state.store.revoked_since(max(0, state.cursor - SYNC_OVERLAP))
+        for jti in jtis:
+          state.filter.add(jti)
+      state.synced_at = now
+    finally:
+      state.lock.release()
+
+  def _rebuild(self, state, now):
+    """ストアにある有効期限内のjtiでフィルターを作り直す"""
+    jtis, cursor = state.store.revoked_since(0)
+    bloom = BloomFilter(max(state.capacity, len(jtis) * 2), state.error_rate)
+    for jti in jtis:
+      bloom.add(jti)
+    state.filter, state.cursor, state.rebuilt_at = bloom, cursor, now
+
+token_blocklist = TokenBlocklist()
+
+@click.group('tokens')
+def tokens_cli():
+  """JWTの無効化リストの管理"""
+
+@tokens_cli.command('prune')
+@with_appcontext
+def prune_command():
+  """有効期限を過ぎたトークンを無効化リストから削除する"""
+  click.echo(f'{token_blocklist.store.prune(utcnow())}件の無効化済みトークンを削除しました')
@@ -1,14 +1,38 @@
-import os
-from flask import Blueprint, jsonify, request, current_app
-from werkzeug.utils import secure_filename
+from flask import Blueprint, jsonify, request, abort
 from marshmallow import ValidationError
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from .. import db
+from sqlalchemy.orm import joinedload
+from .. import db, image_pipeline
+from ..bulk import bulk_delete, bulk_toggle, bulk_update, delete_owned_item, selection_criteria, toggle_owned_item
+from ..cache import response_cache
+from ..images import ImageTooLargeError, InvalidImageError
 from ..models import Item
-from ..schemas import item_schema, items_schema
+from ..schemas import bulk_items_schema, bulk_selection_schema, bulk_update_schema, item_schema
+from ..pagination import InvalidCursorError, decode_cursor, paginate, parse_limit
+from ..search import apply_search, build_search_text
+from ..geo import bbox_filter, cluster_viewport, find_nearby, viewport_ranges
+from ..serializers import dump_item_row, dump_item_rows, image_url_base, item_rows_query, variant_widths
 
 bp = Blueprint('item_route', __name__, url_prefix='/api/v1/items')
 
+# 近くのアイテム検索で指定できる半径の上限（km）。広すぎる範囲は一覧APIを使ってもらう
+MAX_NEARBY_RADIUS_KM = 50
+# 地図表示でこのズームレベル以上なら、クラスタではなく個々のアイテムを返す
+MAP_ITEMS_MIN_ZOOM = 15
+# 地図表示で個々のアイテムを返すときの上限件数
+MAX_MAP_ITEMS = 500
+# 一括出品で1回に登録できる上限件数
+MAX_BULK_ITEMS = 500
+# 一括出品で受け付ける列（BulkItemSchema で読み込むもの）
+BULK_INSERT_COLUMNS = ('name', 'description', 'quantity', 'unit', 'expiration_date', 'location', 'is_available', 'img_url')
+
+# ItemSchema は出品者(user)をネストして返すため、Item.user を遅延ロードのままにすると
+# シリアライズ時にアイテム1件ごとに追加のSELECTが走る（N+1問題）
+# レスポンスを返す箇所では必ず出品者をJOINで同時に読み込む
+def _load_item_with_owner(item_id):
+  """出品者を同時に読み込んだItemを1クエリで取得する（コミット後の再取得にも使う）"""
+  return db.session.get(Item, item_id, options=[joinedload(Item.user)], populate_existing=True)
+
 @bp.route('/', methods=['POST'])
 @jwt_required()
 def create_item():
@@ -26,45 +50,218 @@ def create_item():
   
   # 画像ファイルの処理
   # フロントエンドからは 'image' というキーでファイルを送信することを想定
+  # 中身のチェックと一時保存だけをここで行い、EXIFの除去と縮小版の作成はバックグラウンドで行う（images.py参照）
   if 'image' in request.files:
     file = request.files['image']
     # ファイルが存在し、ファイル名が空でないことを確認
     if file and file.filename != '':
-      filename = secure_filename(file.filename)
-      save_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-      file.save(save_path)
-      new_item.img_url = filename # ファイル名をDBに保存
+      try:
+        new_item.img_url = image_pipeline.accept(file) # ファイル名をDBに保存
+      except ImageTooLargeError as err:
+        return jsonify({'message': str(err)}), 413
+      except InvalidImageError as err:
+        return jsonify({'message': '入力データが無効です', 'errors': {'image': [str(err)]}}), 422
 
   db.session.add(new_item)
+  db.session.flush() # コミット前にIDを確定させ、コミット後にIDを読むためだけのSELECTを避ける
+  item_id = new_item.id
   db.session.commit()
-  
+
+  new_item = _load_item_with_owner(item_id)
   return jsonify({'message': '食品が正常に出品されました', 'item': item_schema.dump(new_item)}), 201
   
+# --- アイテムの一括出品 ---
+# JSONの配列を受け取り、行ごとにバリデーションする。問題のない行だけを1つのINSERT文と1回のコミットで登録する
+# レスポンスの errors は {行番号: エラー内容}。全行成功なら201、一部失敗なら207、全行失敗なら422
+@bp.route('/bulk', methods=['POST'])
+@jwt_required()
+def bulk_create_items():
+  data = request.get_json(silent=True)
+  if not isinstance(data, list) or not data:
+    return jsonify({'message': 'アイテムの配列をJSONで送信してください'}), 400
+  if len(data) > MAX_BULK_ITEMS:
+    return jsonify({'message': f'一度に出品できるのは{MAX_BULK_ITEMS}件までです'}), 400
+
+  try:
+    rows = bulk_items_schema.load(data)
+    errors = {}
+  except ValidationError as err:
+    errors = err.messages
+    rows = err.valid_data
+  valid = [(index, row) for index, row in enumerate(rows) if index not in errors]
+
+  created = []
+  if valid:
+    current_user_id = int(get_jwt_identity())
+    # 全行の列を揃えておくと、SQLAlchemyが行を列の組み合わせごとに別のINSERT文に分けずに済む
+    values = [{
+      **{column: row.get(column) for column in BULK_INSERT_COLUMNS},
+      'user_id': current_user_id,
+      # ORMのbulk INSERTではモデルのイベント（before_insert）が動かないので、検索用の列をここで作る
+      'search_text': build_search_text(row.get('name'), row.get('description')),
+    } for _, row in valid]
+    # 複数行のVALUESをまとめた1つのINSERT文で登録する（render_nulls: Noneの列も省略せず、全行を同じ文にする）
+    # RETURNINGの行の順番は保証されないが、1文の中のIDは行の順番どおりに採番されるので、昇順に並べれば送られた順になる
+    # （sort_by_parameter_order=True はSQLiteでは1行ずつのINSERTに分解されてしまうため使わない）
+    item_ids = sorted(db.session.scalars(
+      db.insert(Item).returning(Item.id).execution_options(render_nulls=True), values
+    ).all())
+    db.session.commit()
+    # ORMを通さないINSERTなので、レスポンスキャッシュを明示的に無効にする
+    response_cache.invalidate('items')
+
+    rows_by_id = {row.id: row for row in item_rows_query(Item.query.filter(Item.id.in_(item_ids))).all()}
+    image_base, widths = image_url_base(), variant_widths()
+    created = [dump_item_row(rows_by_id[item_id], image_base, widths) for item_id in item_ids]
+
+  if not created:
+    return jsonify({'message': '入力データが無効です', 'items': [], 'errors': errors}), 422
+  status = 207 if errors else 201
+  return jsonify({
+    'message': f'{len(created)}件の食品を出品しました',
+    'items': created,
+    'errors': errors,
+  }), status
+
 # --- アイテムを1件のみ詳細取得 ---
+# 読み取り系のAPIは必要な列だけを取得して serializers.py の高速シリアライザで返す
 @bp.route('/<int:item_id>', methods=['GET'])
+@response_cache.cached('items')
 def get_item(item_id):
-  item = Item.query.get_or_404(item_id)
-  return jsonify({'item': item_schema.dump(item)}), 200
+  row = item_rows_query(Item.query.filter(Item.id == item_id)).first()
+  if row is None:
+    abort(404)
+  return jsonify({'item': dump_item_row(row, image_url_base(), variant_widths())}), 200
 
 # --- アイテム一覧表示・絞り込み機能 ---
+# limit と cursor によるキーセットページネーションに対応
+# レスポンスの next_cursor を次のリクエストの cursor に渡すと続きが取得できる（最後のページでは null）
 @bp.route('/', methods=['GET'])
+@response_cache.cached('items')
 def get_items():
-  query = Item.query
+  query = item_rows_query(Item.query)
 
   # 絞り込み条件をクエリパラメータから取得
   name = request.args.get('name')
   is_available = request.args.get('is_available')
+  user_id = request.args.get('user_id', type=int) # 出品者ごとの一覧
+  cursor = request.args.get('cursor')
+
+  try:
+    limit = parse_limit(request.args.get('limit'))
+    decoded_cursor = decode_cursor(cursor) if cursor else None
+  except InvalidCursorError as err:
+    return jsonify({'message': str(err)}), 400
+
+  if user_id is not None:
+    query = query.filter(Item.user_id == user_id)
 
   if name:
-    query = query.filter(Item.name.ilike(f'%{name}%'))
+    # 食品名・説明文の全文検索インデックスで絞り込む（並び順は新しい順のまま）
+    query = apply_search(query, Item, name)
   if is_available is not None:
     if is_available.lower() == 'true':
       query = query.filter(Item.is_available.is_(True))
     elif is_available.lower() == 'false':
       query = query.filter(Item.is_available.is_(False))
 
-  items = query.order_by(Item.created_at.desc()).all()
-  return jsonify({'items': items_schema.dump(items)}), 200
+  rows, next_cursor = paginate(query, Item.created_at, Item.id, decoded_cursor, limit)
+  return jsonify({'items': dump_item_rows(rows), 'next_cursor': next_cursor}), 200
+
+# --- アイテム検索（関連度順） ---
+# 食品名・説明文を全角/半角・カタカナ/ひらがなの違いを無視して検索し、関連度の高い順に返す
+@bp.route('/search', methods=['GET'])
+def search_items():
+  q = request.args.get('q', '').strip()
+  if not q:
+    return jsonify({'message': '検索キーワードを指定してください'}), 400
+
+  try:
+    limit = parse_limit(request.args.get('limit'))
+  except InvalidCursorError as err:
+    return jsonify({'message': str(err)}), 400
+
+  query = item_rows_query(Item.query.filter(Item.is_available.is_(True)))
+  rows = apply_search(query, Item, q, ranked=True).limit(limit).all()
+  return jsonify({'items': dump_item_rows(rows)}), 200
+
+# --- 近くのアイテム検索（距離順） ---
+# lat, lng を中心に radius_km 以内の出品中アイテムを近い順に返す
+@bp.route('/nearby', methods=['GET'])
+def get_nearby_items():
+  try:
+    lat = float(request.args['lat'])
+    lng = float(request.args['lng'])
+    radius_km = float(request.args.get('radius_km', 5))
+    limit = parse_limit(request.args.get('limit'))
+  except KeyError:
+    return jsonify({'message': '緯度(lat)と経度(lng)を指定してください'}), 400
+  except (ValueError, InvalidCursorError):
+    return jsonify({'message': 'パラメータの形式が正しくありません'}), 400
+
+  if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+    return jsonify({'message': '緯度・経度の範囲が正しくありません'}), 400
+  if not 0 < radius_km <= MAX_NEARBY_RADIUS_KM:
+    return jsonify({'message': f'半径は0より大きく{MAX_NEARBY_RADIUS_KM}km以下で指定してください'}), 400
+
+  hits = find_nearby(db.session, Item, lat, lng, radius_km, limit, Item.is_available.is_(True))
+
+  # 距離順に並んだIDの分だけ、出品者と一緒にまとめて読み込む
+  # 2つのクエリの間に削除・出品停止されたアイテムは読み込まれないので、結果から除く
+  rows_by_id = {
+    row.id: row
+    for row in item_rows_query(Item.query.filter(
+      Item.id.in_([item_id for item_id, _ in hits]), Item.is_available.is_(True)
+    ))
+  }
+  image_base, widths = image_url_base(), variant_widths()
+  results = []
+  for item_id, distance in hits:
+    if item_id not in rows_by_id:
+      continue
+    data = dump_item_row(rows_by_id[item_id], image_base, widths)
+    data['distance_km'] = round(distance, 3)
+    results.append(data)
+  return jsonify({'items': results}), 200
+
+# --- 地図表示（表示範囲内のクラスタ／アイテム） ---
+# south, west, north, east で地図の表示範囲、zoom でズームレベル(0〜22)を指定する
+# ズームが小さいときは格子ごとの件数と重心（clusters）を、大きいときは個々のアイテム（items）を返す
+@bp.route('/map', methods=['GET'])
+def get_map_items():
+  try:
+    south = float(request.args['south'])
+    west = float(request.args['west'])
+    north = float(request.args['north'])
+    east = float(request.args['east'])
+    zoom = int(request.args['zoom'])
+  except KeyError:
+    return jsonify({'message': '表示範囲(south, west, north, east)とズームレベル(zoom)を指定してください'}), 400
+  except ValueError:
+    return jsonify({'message': 'パラメータの形式が正しくありません'}), 400
+
+  if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+    return jsonify({'message': '表示範囲が正しくありません'}), 400
+  if not 0 <= zoom <= 22:
+    return jsonify({'message': 'ズームレベルは0〜22で指定してください'}), 400
+
+  lng_ranges = viewport_ranges(west, east)
+  available = Item.is_available.is_(True)
+
+  if zoom < MAP_ITEMS_MIN_ZOOM:
+    clusters = cluster_viewport(db.session, Item, south, north, lng_ranges, zoom, available)
+    return jsonify({'zoom': zoom, 'clusters': clusters, 'items': [], 'truncated': False}), 200
+
+  stmt = bbox_filter(db.select(Item.id), Item, db.engine.dialect.name, south, north, lng_ranges)
+  stmt = stmt.where(available).order_by(Item.id.desc()).limit(MAX_MAP_ITEMS + 1)
+  item_ids = db.session.scalars(stmt).all()
+  truncated = len(item_ids) > MAX_MAP_ITEMS
+  rows = (
+    item_rows_query(Item.query.filter(Item.id.in_(item_ids[:MAX_MAP_ITEMS])))
+    .order_by(Item.id.desc())
+    .all()
+  )
+  return jsonify({'zoom': zoom, 'clusters': [], 'items': dump_item_rows(rows), 'truncated': truncated}), 200
 
 # --- アイテム編集 ---
 @bp.route('/<int:item_id>', methods=['PUT', 'PATCH'])
@@ -86,35 +283,89 @@ def update_item(item_id): # この引数はURLから取得される
     setattr(item, key, value)
 
   db.session.commit()
+  item = _load_item_with_owner(item_id)
   return jsonify({'message': '食品情報を更新しました', 'item': item_schema.dump(item)}), 200
 
 # --- アイテム削除 ---
 @bp.route('/<int:item_id>', methods=['DELETE'])
 @jwt_required()
 def delete_item(item_id): # この引数はURLから取得される
-  item = Item.query.get_or_404(item_id)
-
   current_user_id = int(get_jwt_identity())
-  
-  if item.user_id != current_user_id:
-    return jsonify({'message': '権限がありません'}), 403
 
-  db.session.delete(item)
-  db.session.commit()
-  return jsonify({'message': '食品を削除しました'}), 200
+  # 読み込まずに「このIDで自分のもの」を条件にして1文で削除する
+  if delete_owned_item(item_id, current_user_id):
+    return jsonify({'message': '食品を削除しました'}), 200
+
+  # 削除できなかったときだけ、存在しないのか他人のものなのかを調べる
+  if db.session.get(Item, item_id) is None:
+    abort(404)
+  return jsonify({'message': '権限がありません'}), 403
 
 # --- 一時出品停止・出品再開 ---
 @bp.route('/<int:item_id>/toggle-availability', methods=['POST'])
 @jwt_required()
 def toggle_availability(item_id):
   current_user_id = int(get_jwt_identity())
-  item = Item.query.filter_by(id = item_id, user_id = current_user_id).first()
+  # UPDATE item SET is_available = NOT is_available WHERE id = :id AND user_id = :me RETURNING is_available
+  is_available = toggle_owned_item(item_id, current_user_id)
 
-  if not item:
+  if is_available is None:
     return jsonify({'success': False, 'message': '商品が見つかりません'}), 404
 
-  item.is_available = not item.is_available # ここでitemの'True|False'を切り替えて代入　※'is_available'が'boolean'
-  db.session.commit()
+  return jsonify({'success': True, 'is_available': is_available}), 200
+
+# --- 一括更新・一括出品停止/再開・一括削除 ---
+# 対象は {"ids": [...]} か {"filter": {...}} で指定する（schemas.BulkSelectionSchema）
+# 自分のアイテムだけが対象になるよう、所有者の条件もSQLのWHERE句に含めて1文で処理する（bulk.py参照）
+# レスポンスの ids は実際に対象になったID、skipped_ids は指定されたが対象にならなかった（存在しない・他人の）ID
+
+def _load_selection(schema):
+  """リクエストボディを読み込み、(読み込んだデータ, WHERE条件) を返す"""
+  data = schema.load(request.get_json(silent=True) or {})
+  criteria = selection_criteria(int(get_jwt_identity()), data.get('ids'), data.get('filter'))
+  return data, criteria
 
-  return jsonify({'success': True, 'is_available': item.is_available}), 200
+def _skipped(data, affected_ids):
+  if 'ids' not in data:
+    return []
+  affected = set(affected_ids)
+  return sorted({item_id for item_id in data['ids'] if item_id not in affected})
+
+@bp.route('/bulk', methods=['PATCH'])
+@jwt_required()
+def bulk_update_items():
+  try:
+    data, criteria = _load_selection(bulk_update_schema)
+  except ValidationError as err:
+    return jsonify({'message': '入力データが無効です', 'errors': err.messages}), 422
+
+  ids = bulk_update(criteria, data['changes'])
+  return jsonify({'message': f'{len(ids)}件の食品情報を更新しました', 'ids': ids, 'skipped_ids': _skipped(data, ids)}), 200
+
+@bp.route('/bulk/toggle-availability', methods=['POST'])
+@jwt_required()
+def bulk_toggle_availability():
+  try:
+    data, criteria = _load_selection(bulk_selection_schema)
+  except ValidationError as err:
+    return jsonify({'message': '入力データが無効です', 'errors': err.messages}), 422
+
+  toggled = bulk_toggle(criteria)
+  ids = [item_id for item_id, _ in toggled]
+  return jsonify({
+    'message': f'{len(ids)}件の出品状態を切り替えました',
+    'items': [{'id': item_id, 'is_available': is_available} for item_id, is_available in toggled],
+    'ids': ids,
+    'skipped_ids': _skipped(data, ids),
+  }), 200
+
+@bp.route('/bulk', methods=['DELETE'])
+@jwt_required()
+def bulk_delete_items():
+  try:
+    data, criteria = _load_selection(bulk_selection_schema)
+  except ValidationError as err:
+    return jsonify({'message': '入力データが無効です', 'errors': err.messages}), 422
 
+  ids = bulk_delete(criteria)
+  return jsonify({'message': f'{len(ids)}件の食品を削除しました', 'ids': ids, 'skipped_ids': _skipped(data, ids)}), 200
@@ -1,7 +1,8 @@
 from flask import Blueprint, jsonify, request
 from ..schemas import LoginSchema, user_schema
 from ..models import User
-from .. import bcrypt
+from .. import db
+from ..user_cache import user_cache
 from marshmallow import ValidationError
 from flask_jwt_extended import create_access_token, create_refresh_token
 
@@ -25,10 +26,17 @@ def login():
   if not user or not user.check_password(validated_data['password']):
     return jsonify({'message': 'メールアドレスまたはパスワードが正しくありません'}), 401
 
+  # check_password でハッシュし直した場合は保存する
+  if db.session.is_modified(user):
+    db.session.commit()
+
   # メールアドレスが認証済みかチェック
   if not user.is_verified:
     return jsonify({'message': 'メールアドレスが認証されていません。メールを確認してください。'}), 403 # 403 Forbidden
   
+  # 直後のリクエストで current_user をDBから読み直さなくて済むよう、キャッシュに入れておく
+  user_cache.prime(user)
+
   # emailとPWに問題なければJWTトークン生成
   access_token = create_access_token(identity=str(user.id))
   refresh_token = create_refresh_token(identity=str(user.id))
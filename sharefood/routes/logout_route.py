@@ -1,12 +1,30 @@
-from flask import Blueprint, jsonify
-from flask_jwt_extended import jwt_required
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity, decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+from ..revocation import token_blocklist
 
 bp = Blueprint('logout_route', __name__, url_prefix='/api/v1')
 
 # ユーザーログアウトAPI
+# 使ったアクセストークンを無効化リストに入れ、有効期限前でも使えなくする（revocation.py参照）
+# ボディに {"refresh_token": "..."} を付けると、リフレッシュトークンも一緒に無効にする
 @bp.route('/logout', methods=['POST'])
 @jwt_required() # ログインしている（有効なトークンを持っている）ユーザーのみアクセス可能
 def logout():
+  refresh_token = (request.get_json(silent=True) or {}).get('refresh_token')
+  refresh_payload = None
+  if refresh_token:
+    try:
+      refresh_payload = decode_token(refresh_token)
+    except (PyJWTError, JWTExtendedException):
+      return jsonify({'message': '無効なリフレッシュトークンです'}), 422
+    if refresh_payload.get('type') != 'refresh' or refresh_payload.get('sub') != get_jwt_identity():
+      return jsonify({'message': '無効なリフレッシュトークンです'}), 422
+
+  token_blocklist.revoke(get_jwt())
+  if refresh_payload is not None:
+    token_blocklist.revoke(refresh_payload)
   return jsonify({'message': 'ログアウトに成功しました'}), 200
 
-# 実際はReact側でJWTトークンを削除するコードを書くことによってログアウトが完了する
\ No newline at end of file
+# React側でもJWTトークンを削除すること
@@ -0,0 +1,17 @@
+import hmac
+from flask import Blueprint, Response, abort, current_app, request
+from ..metrics import collect, render
+
+bp = Blueprint('metrics_route', __name__)
+
+# Prometheusがスクレイプするメトリクス（metrics.py参照）
+# エンドポイントごとのアクセス数やSQLの時間が外から見えないよう、Authorization: Bearer <METRICS_AUTH_TOKEN> を付けたリクエストだけに返す
+# METRICS_AUTH_TOKEN が未設定なら集計はするが、/metrics は404にして公開しない
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+  token = current_app.config['METRICS_AUTH_TOKEN']
+  if 'metrics' not in current_app.extensions or not token:
+    abort(404)  # METRICS_ENABLED が偽か、トークンが未設定
+  if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+    return Response('unauthorized\n', status=401, mimetype='text/plain')
+  return Response(render(collect()), mimetype='text/plain; version=0.0.4; charset=utf-8')
@@ -1,7 +1,5 @@
 from flask import Blueprint, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from ..models import User
-from .. import db
+from flask_jwt_extended import jwt_required, current_user
 from ..schemas import user_schema
 
 bp = Blueprint('profile_route', __name__, url_prefix='/api/v1')
@@ -9,16 +7,10 @@ bp = Blueprint('profile_route', __name__, url_prefix='/api/v1')
 @bp.route('/me', methods=['GET'])
 @jwt_required() # ログインしている（有効なトークンを持っている）ユーザーのみアクセス可能
 def profile():
-  current_user_id = int(get_jwt_identity())
-  user = db.get_or_404(User, current_user_id, description='ユーザーが見つかりません')
-  # ↑このコードは
-  # user = User.query.get(current_user_id)
-  # if user is None:
-  #   abort(404, description='ユーザーが見つかりません')
-  # return user
-  # というコードを１行でまとめており、errorが返ってきた時のみdescriptionも実行される
-  
+  # current_user はトークンのユーザーIDから user_lookup_loader が引いたユーザー
+  # ワーカー内のキャッシュから返すので、通常はDBにアクセスしない（user_cache.py参照）
+  # ユーザーが存在しなければ、ここに来る前に404になる（__init__.py の user_lookup_error_loader）
   return jsonify({
     'message': 'プロフィールを取得しました',
-    'user': user_schema.dump(user)
-  }), 200
\ No newline at end of file
+    'user': user_schema.dump(current_user)
+  }), 200
@@ -1,10 +1,11 @@
 from flask import Blueprint, request, jsonify, current_app
 from marshmallow import ValidationError
 from ..models import User
-from .. import db, mail
+from .. import db
+from ..hashing import HashingBusyError
 from sqlalchemy.exc import IntegrityError
 from ..schemas import RegisterSchema
-from flask_mail import Message
+from ..mail_outbox import enqueue_mail
 import textwrap
 
 # Blueprintを作成
@@ -37,8 +38,8 @@ def register():
         existing_user.username = validated_data['username'] # 名前も更新したい場合
         existing_user.password = validated_data['password'] # パスワードも更新
         token = existing_user.generate_verification_token() # 新しいトークンを生成
+        send_verification_email(existing_user.email_address, token) # 認証メールを再送（送信箱に追加）
         db.session.commit()
-        send_verification_email(existing_user.email_address, token) # 認証メールを再送
         return jsonify({'message': 'このメールアドレスは登録済みですが、認証が完了していません。新しい認証メールを送信しました。'}), 200
 
     # 新しいユーザーのインスタンスを作成
@@ -53,9 +54,10 @@ def register():
     token = new_user.generate_verification_token()  # メアド認証用のトークン
 
     db.session.add(new_user)
-    db.session.commit()
-
+    # 認証メールは送信箱に追加するだけで、ユーザーと同じトランザクションでコミットする
+    # 実際の送信はバックグラウンドの送信処理が行うので、SMTPサーバーが遅くても登録APIは待たされない
     send_verification_email(new_user.email_address, token)
+    db.session.commit()
 
     return jsonify({'message': 'ユーザー登録が完了しました。登録されたメールアドレスに送られた認証メールを確認してください。'}), 201
 
@@ -64,27 +66,28 @@ def register():
   except IntegrityError:
     db.session.rollback()
     return jsonify({'message': 'このメールアドレスは既に使用されています'}), 409
+  except HashingBusyError:
+    # 共通のエラーハンドラで503を返す
+    db.session.rollback()
+    raise
   except Exception as e:
     db.session.rollback()
     current_app.logger.error(f"登録中に予期せぬエラーが発生: {e}", exc_info=True)
     return jsonify({'message': 'サーバー内部でエラーが発生しました。'}), 500
 
 # メール送信関数
+# 認証メールを送信箱(mail_outbox)に追加する。コミットは呼び出し側で行う
+# 送信の失敗時は送信処理が指数バックオフで再送する（mail_outbox.py参照）
 def send_verification_email(email, token):
-  try:
-    # config.pyで設定したFRONTEND_BASE_URLを使用
-    verification_link = f"{current_app.config.get('FRONTEND_BASE_URL')}/verify-email?token={token}"
+  # config.pyで設定したFRONTEND_BASE_URLを使用
+  verification_link = f"{current_app.config.get('FRONTEND_BASE_URL')}/verify-email?token={token}"
 
-    msg = Message('【ShareFood】アカウント認証のお願い', recipients=[email])
-    msg.body = textwrap.dedent(f"""\
-    この度はご登録いただきありがとうございます。
-    アカウントを認証するには、以下のリンクをクリックしてください:
-    {verification_link}
-    このリンクは有効期限が設定されています。
-    もしこのメールに心当たりがない場合は、無視してください。
-    """)
-    mail.send(msg)
-    current_app.logger.info(f"認証メールを {email} に送信しました。")
-  except Exception as e:
-    current_app.logger.error(f"認証メールの送信に失敗しました: {e}", exc_info=True)
-    # 本番環境では、メール送信失敗をユーザーに通知するか、再試行メカニズムを設定
\ No newline at end of file
+  body = textwrap.dedent(f"""\
+  この度はご登録いただきありがとうございます。
+  アカウントを認証するには、以下のリンクをクリックしてください:
+  {verification_link}
+  このリンクは有効期限が設定されています。
+  もしこのメールに心当たりがない場合は、無視してください。
+  """)
+  enqueue_mail(email, '【ShareFood】アカウント認証のお願い', body)
+  current_app.logger.info(f"認証メールを {email} 宛に送信箱へ追加しました。")
\ No newline at end of file
@@ -0,0 +1,59 @@
+from flask import Blueprint, request, jsonify
+from marshmallow import ValidationError
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from ..models import Reservation
+from ..reservations import ReservationError, cancel, confirm, reserve
+from ..schemas import reservation_schema, reservations_schema
+
+bp = Blueprint('reservation_route', __name__, url_prefix='/api/v1')
+
+# 一覧で返す自分の予約の件数
+MAX_RESERVATIONS = 100
+
+# --- アイテムの予約 ---
+# 数量は条件付きのUPDATE文1つで確保するので、同時に予約が来ても残りの数量を超えて予約されることはない（reservations.py参照）
+@bp.route('/items/<int:item_id>/reservations', methods=['POST'])
+@jwt_required()
+def create_reservation(item_id):
+  try:
+    data = reservation_schema.load(request.get_json(silent=True) or {})
+  except ValidationError as err:
+    return jsonify({'message': '入力データが無効です', 'errors': err.messages}), 422
+
+  try:
+    reservation = reserve(item_id, int(get_jwt_identity()), data['quantity'])
+  except ReservationError as err:
+    return jsonify({'message': err.message}), err.status_code
+
+  return jsonify({'message': '予約しました', 'reservation': reservation_schema.dump(reservation)}), 201
+
+# --- 自分の予約の一覧 ---
+@bp.route('/reservations', methods=['GET'])
+@jwt_required()
+def list_reservations():
+  reservations = (
+    Reservation.query
+    .filter_by(user_id=int(get_jwt_identity()))
+    .order_by(Reservation.created_at.desc(), Reservation.id.desc())
+    .limit(MAX_RESERVATIONS)
+    .all()
+  )
+  return jsonify({'reservations': reservations_schema.dump(reservations)}), 200
+
+# --- 受け渡しの確定（出品者） ---
+@bp.route('/reservations/<int:reservation_id>/confirm', methods=['POST'])
+@jwt_required()
+def confirm_reservation(reservation_id):
+  try:
+    confirm(reservation_id, int(get_jwt_identity()))
+  except ReservationError as err:
+    return jsonify({'message': err.message}), err.status_code
+  return jsonify({'message': '受け渡しを確定しました'}), 200
+
+# --- 予約の取り消し（予約した本人） ---
+@bp.route('/reservations/<int:reservation_id>', methods=['DELETE'])
+@jwt_required()
+def cancel_reservation(reservation_id):
+  if not cancel(reservation_id, int(get_jwt_identity())):
+    return jsonify({'message': '取り消せる予約が見つかりません'}), 404
+  return jsonify({'message': '予約を取り消しました'}), 200
@@ -1,6 +1,6 @@
-import os
-from flask import Blueprint, request, current_app, jsonify
-from werkzeug.utils import secure_filename
+from flask import Blueprint, request, jsonify
+from .. import image_pipeline
+from ..images import ImageTooLargeError, InvalidImageError
 
 bp = Blueprint('upload_route', __name__, url_prefix='/api/v1')
 
@@ -8,18 +8,18 @@ bp = Blueprint('upload_route', __name__, url_prefix='/api/v1')
 def upload_file():
   if 'images' not in request.files:
     return jsonify({'message': '画像ファイルがありません'}),400
-  
-  files = request.files.getlist('images')
+
+  files = [file for file in request.files.getlist('images') if file.filename != '']
   saved_files = []
-  
-  for file in files:
-    if file.filename == '':
-      continue
-    filename = secure_filename(file.filename)
-    save_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-    file.save(save_path)
-    saved_files.append(filename) # アップロードされたファイルを、安全に変換したファイル名 (filename)をリスト'saved_files'に追加
-    
-  return jsonify({'message': 'アップロード完了', 'files': saved_files}), 200
 
+  # 中身のチェックと一時保存だけをここで行い、EXIFの除去と縮小版の作成はバックグラウンドで行う（images.py参照）
+  for file in files:
+    try:
+      filename = image_pipeline.accept(file)
+    except ImageTooLargeError as err:
+      return jsonify({'message': str(err), 'file': file.filename}), 413
+    except InvalidImageError as err:
+      return jsonify({'message': str(err), 'file': file.filename}), 400
+    saved_files.append(filename) # アップロードされたファイルを、保存したファイル名 (filename)をリスト'saved_files'に追加
 
+  return jsonify({'message': 'アップロード完了', 'files': saved_files}), 200
@@ -1,8 +1,37 @@
-import os
-from flask import Blueprint, send_from_directory, current_app, abort
+from flask import Blueprint, current_app, abort
+from ..static_assets import DEFAULT_IMMUTABLE_PATTERN, build_manifest, send_asset, send_upload
+from ..storage import is_content_addressed
 
 bp = Blueprint('view_route', __name__)
 
+# アップロード画像のURL（url_for('static', filename='uploads/...')）の先頭
+UPLOADS_PREFIX = 'uploads/'
+
+@bp.record_once
+def setup(state):
+  """起動時に静的ファイルのマニフェストを作り、staticエンドポイントもこのBlueprintで処理する"""
+  app = state.app
+  app.config.setdefault('STATIC_IMMUTABLE_PATTERN', DEFAULT_IMMUTABLE_PATTERN)
+  app.config.setdefault('STATIC_SENDFILE_MODE', None)
+  app.config.setdefault('STATIC_ACCEL_PREFIX', '/_static/')
+  app.config.setdefault('UPLOADS_ACCEL_PREFIX', '/_uploads/')
+  if app.config['STATIC_SENDFILE_MODE'] == 'x-sendfile':
+    app.config['USE_X_SENDFILE'] = True
+  app.extensions['asset_manifest'] = build_manifest(app.config['STATIC_FOLDER'], app.config['STATIC_IMMUTABLE_PATTERN'])
+  # アプリは static_folder=None で作るので、url_for('static', filename=...) 用のstaticエンドポイントをここで登録する
+  # （URLはこのBlueprintの /<path:path> と同じ形で、処理も同じ）
+  app.add_url_rule('/<path:filename>', endpoint='static', view_func=static)
+
+def _manifest():
+  if current_app.debug:
+    # 開発中はビルドし直したファイルをすぐ反映する
+    return build_manifest(current_app.config['STATIC_FOLDER'], current_app.config['STATIC_IMMUTABLE_PATTERN'])
+  return current_app.extensions['asset_manifest']
+
+def static(filename):
+  """staticエンドポイント（/<filename>）。SPAのルートと同じ処理で返す"""
+  return serve_react_app(filename)
+
 # このルートは、APIルート以外のすべてのGETリクエストを捕捉します。
 # これにより、React RouterのようなクライアントサイドルーターがURLの制御を行えるようになります。
 @bp.route('/', defaults={'path': ''})
@@ -13,13 +42,23 @@ def serve_react_app(path):
   if path.startswith('api/'):
     abort(404)
 
-  # __init__.pyで設定した静的フォルダの場所を取得します。
-  static_folder = current_app.static_folder
+  # アップロード画像。内容のハッシュをファイル名にしたもの（storage.py参照）は中身が変わらないのでimmutableにする
+  if path.startswith(UPLOADS_PREFIX):
+    relative = path[len(UPLOADS_PREFIX):]
+    return send_upload(relative, immutable=is_content_addressed(relative))
+
+  manifest = _manifest()
+  accel_prefix = current_app.config['STATIC_ACCEL_PREFIX']
 
   # リクエストされたパスが実在するファイル（例: favicon.ico）なら、それを返します。
-  if path != "" and os.path.exists(os.path.join(static_folder, path)):
-    return send_from_directory(static_folder, path)
-  else:
-    # それ以外（/login, /registerなど）の場合は、Reactアプリ本体である index.html を返します。
-    # これでホール係（React）に仕事が引き渡されます。
-    return send_from_directory(static_folder, 'index.html')
\ No newline at end of file
+  # 起動時に作ったマニフェストを引くだけなので、ファイルシステムにはアクセスしません。
+  asset = manifest.get(path) if path != '' else None
+  if asset is not None:
+    return send_asset(asset, path, accel_prefix)
+
+  # それ以外（/login, /registerなど）の場合は、Reactアプリ本体である index.html を返します。
+  # これでホール係（React）に仕事が引き渡されます。
+  index = manifest.get('index.html')
+  if index is None:
+    abort(404)
+  return send_asset(index, 'index.html', accel_prefix)
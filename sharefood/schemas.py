@@ -1,6 +1,7 @@
 import re
-from marshmallow import Schema, fields, validate, ValidationError, validates, pre_load
+from marshmallow import Schema, fields, validate, ValidationError, validates, validates_schema, pre_load
 from flask import url_for
+from .storage import CONTENT_FILENAME_PATTERN
 
 # UserとItemのインスタンスのみをここで生成してるのはほかの場所で使いまわすから
 # RegisterとLoginは使う場所が限定されてるのでそのスコープ内でインスタンスを生成する
@@ -66,6 +67,8 @@ class ItemSchema(Schema):
   # image_urlはDBに保存されたファイル名(obj.img_url)から完全なURLを動的に生成する
   # このフィールドはレスポンス(dump)専用
   image_url = fields.Method("get_image_url", dump_only=True)
+  # 縮小版（幅ごとのJPEGとWebP）のURL。一覧ではここから表示サイズに合うものを選んでもらう
+  image_variants = fields.Method("get_image_variants", dump_only=True)
 
   # 書き込み・読み取り可能フィールド（バリデーションルールも設定）
   name = fields.Str(required=True, validate=validate.Length(min=1, max=50, error="食品名は1文字以上50文字以下で入力してください。"))
@@ -83,7 +86,7 @@ class ItemSchema(Schema):
   @pre_load
   def preprocess_data(self, data, **kwargs):
     """バリデーション前にデータを前処理する。空文字をNoneに変換する。"""
-    if data:
+    if isinstance(data, dict):
       for key, value in data.items():
         if value == '':
           data[key] = None
@@ -95,7 +98,83 @@ class ItemSchema(Schema):
       return url_for('static', filename=f'uploads/{obj.img_url}', _external=True)
     return None
 
+  def get_image_variants(self, obj):
+    # 循環インポートを避けるため、ここでインポートする
+    from .serializers import image_url_base, image_variants, variant_widths
+    return image_variants(obj.img_url, image_url_base(), variant_widths())
+
 # 単一のItemオブジェクトを扱うためのスキーマインスタンス
 item_schema = ItemSchema()
 # 複数のItemオブジェクト（リスト）を扱うためのスキーマインスタンス
-items_schema = ItemSchema(many=True)
\ No newline at end of file
+items_schema = ItemSchema(many=True)
+
+# --- 一括出品のスキーマ ---
+# 画像は /api/v1/upload で先にアップロードし、返ってきたファイル名を 'image' に指定する（省略可）
+class BulkItemSchema(ItemSchema):
+  img_url = fields.Str(
+    data_key='image', load_only=True, allow_none=True,
+    validate=validate.Regexp(CONTENT_FILENAME_PATTERN, error="画像は /upload で返されたファイル名を指定してください。")
+  )
+
+  @validates("img_url")
+  def validate_image_exists(self, value, data_key=None):
+    # 形式が正しくても、アップロードされていない（GCで削除された）画像を参照する行は登録しない
+    # 循環インポートを避けるため、ここでインポートする
+    from . import image_pipeline
+    if value is not None and not image_pipeline.is_accepted(value):
+      raise ValidationError("画像が見つかりません。/upload でアップロードし直してください。")
+
+# 一括出品用のスキーマインスタンス（JSONの配列を受け取る）
+bulk_items_schema = BulkItemSchema(many=True)
+
+# --- 一括更新・出品停止・削除の対象指定のスキーマ ---
+# ids（IDのリスト）か filter（絞り込み条件）のどちらか一方で対象を指定する
+class BulkFilterSchema(Schema):
+  is_available = fields.Bool()
+  expired = fields.Bool()             # 賞味期限切れかどうか
+  expires_before = fields.Date()      # この日より前に賞味期限が切れるもの
+
+  @validates_schema
+  def validate_not_empty(self, data, **kwargs):
+    if not data:
+      raise ValidationError("絞り込み条件を1つ以上指定してください。")
+
+class BulkSelectionSchema(Schema):
+  ids = fields.List(
+    fields.Int(strict=True), validate=validate.Length(min=1, max=500, error="IDは1件以上500件以下で指定してください。")
+  )
+  filter = fields.Nested(BulkFilterSchema)
+
+  @validates_schema
+  def validate_selection(self, data, **kwargs):
+    if ('ids' in data) == ('filter' in data):
+      raise ValidationError("ids と filter のどちらか一方を指定してください。")
+
+# 一括更新では、対象に加えて変更内容（changes）を受け取る
+# 食品名と説明文は検索用の列（search_text）をアイテムごとに作り直す必要があるため、一括更新では変更できない
+class BulkUpdateSchema(BulkSelectionSchema):
+  changes = fields.Nested(
+    ItemSchema(partial=True, only=('quantity', 'unit', 'expiration_date', 'location', 'is_available')),
+    required=True
+  )
+
+  @validates_schema
+  def validate_changes(self, data, **kwargs):
+    if 'changes' in data and not data['changes']:
+      raise ValidationError("変更内容を1つ以上指定してください。", "changes")
+
+bulk_selection_schema = BulkSelectionSchema()
+bulk_update_schema = BulkUpdateSchema()
+
+# --- 予約のスキーマ ---
+class ReservationSchema(Schema):
+  id = fields.Int(dump_only=True)
+  item_id = fields.Int(dump_only=True)
+  quantity = fields.Int(load_default=1, validate=validate.Range(min=1, error="数量は1以上で入力してください。"))
+  status = fields.Str(dump_only=True)
+  created_at = fields.DateTime(dump_only=True, format='%Y-%m-%dT%H:%M:%S')
+  expires_at = fields.DateTime(dump_only=True, format='%Y-%m-%dT%H:%M:%S')
+  confirmed_at = fields.DateTime(dump_only=True, format='%Y-%m-%dT%H:%M:%S')
+
+reservation_schema = ReservationSchema()
+reservations_schema = ReservationSchema(many=True)
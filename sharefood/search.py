@@ -0,0 +1,132 @@
+import re
+import unicodedata
+from sqlalchemy import DDL, column, event, func, literal_column, select, table
+
+# 食品名・説明文の全文検索
+# ilike('%...%') は先頭ワイルドカードのためインデックスが使えず全件スキャンになる
+# そこで Item.search_text（name + description を正規化した文字列）を索引対象にして、
+#   - SQLite     : FTS5 (trigram トークナイザ) の外部コンテンツテーブル item_search
+#   - PostgreSQL : pg_trgm の GIN インデックス
+# で部分一致検索を行う。どちらもトリグラム（3文字単位）なので日本語の分かち書きは不要
+#
+# 正規化はPython側で行い、その結果を search_text に保存しておく（DB側の関数に依存しない）
+# item_search への反映は item テーブルのトリガーで行うので、ORMを通さない一括INSERT/UPDATE/DELETEでも同期される
+
+# トリグラムの最小文字数。これより短い検索語はインデックスを使えないので LIKE で探す
+MIN_TRIGRAM_LENGTH = 3
+
+_KATAKANA_START = ord('ァ')
+_KATAKANA_END = ord('ヶ')
+_KANA_OFFSET = ord('ァ') - ord('ぁ')
+_WHITESPACE = re.compile(r'\s+')
+
+def normalize(text):
+  """
+  検索用に文字列を正規化する
+  - NFKC で全角英数字・半角カナを揃える（ＡＢＣ→abc、ﾘﾝｺﾞ→リンゴ）
+  - カタカナをひらがなに揃える（リンゴ→りんご）
+  - 大文字小文字と連続する空白を揃える
+  """
+  if not text:
+    return ''
+  text = unicodedata.normalize('NFKC', text).casefold()
+  text = ''.join(
+    chr(ord(char) - _KANA_OFFSET) if _KATAKANA_START <= ord(char) <= _KATAKANA_END else char
+    for char in text
+  )
+  return _WHITESPACE.sub(' ', text).strip()
+
+def build_search_text(name, description):
+  """Item.search_text に保存する索引用の文字列を作る"""
+  return normalize(' '.join(part for part in (name, description) if part))
+
+def split_terms(query_text):
+  """検索文字列を正規化して空白区切りの検索語リストにする"""
+  normalized = normalize(query_text)
+  return normalized.split(' ') if normalized else []
+
+# --- SQLite (FTS5) ---
+item_search = table('item_search', column('rowid'), column('rank'), column('search_text'))
+
+_SQLITE_DDL = [
+  "CREATE VIRTUAL TABLE IF NOT EXISTS item_search USING fts5("
+  "search_text, content='item', content_rowid='id', tokenize='trigram')",
+  "CREATE TRIGGER IF NOT EXISTS item_search_ai AFTER INSERT ON item BEGIN "
+  "INSERT INTO item_search(rowid, search_text) VALUES (new.id, new.search_text); END",
+  "CREATE TRIGGER IF NOT EXISTS item_search_ad AFTER DELETE ON item BEGIN "
+  "INSERT INTO item_search(item_search, rowid, search_text) VALUES ('delete', old.id, old.search_text); END",
+  "CREATE TRIGGER IF NOT EXISTS item_search_au AFTER UPDATE OF search_text ON item BEGIN "
+  "INSERT INTO item_search(item_search, rowid, search_text) VALUES ('delete', old.id, old.search_text); "
+  "INSERT INTO item_search(rowid, search_text) VALUES (new.id, new.search_text); END",
+]
+_SQLITE_DROP_DDL = ["DROP TABLE IF EXISTS item_search"]
+
+# --- PostgreSQL (pg_trgm) ---
+_POSTGRES_DDL = [
+  "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+  "CREATE INDEX IF NOT EXISTS ix_item_search_text_trgm ON item USING gin (search_text gin_trgm_ops)",
+]
+
+def sqlite_ddl():
+  """マイグレーションからも使う、SQLite用の索引作成DDL"""
+  return list(_SQLITE_DDL)
+
+def postgres_ddl():
+  """マイグレーションからも使う、PostgreSQL用の索引作成DDL"""
+  return list(_POSTGRES_DDL)
+
+def register_search_index(item_table):
+  """db.create_all() でitemテーブルが作られたときに、検索用の索引も一緒に作る"""
+  for statement in _SQLITE_DDL:
+    event.listen(item_table, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+  for statement in _SQLITE_DROP_DDL:
+    event.listen(item_table, 'before_drop', DDL(statement).execute_if(dialect='sqlite'))
+  for statement in _POSTGRES_DDL:
+    event.listen(item_table, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+
+def _fts_phrase(term):
+  """FTS5のMATCH構文で、検索語をそのまま部分一致するフレーズとして扱えるようにクォートする"""
+  return '"' + term.replace('"', '""') + '"'
+
+def _escape_like(term):
+  return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _substring_conditions(search_text_col, terms):
+  return [search_text_col.like(f'%{_escape_like(term)}%', escape='\\') for term in terms]
+
+def apply_search(query, model, query_text, ranked=False):
+  """
+  クエリに全文検索の絞り込みを追加する
+  ranked=True のときは関連度の高い順に並べる（False のときは並び順に触らない）
+  """
+  terms = split_terms(query_text)
+  if not terms:
+    return query
+
+  dialect = query.session.get_bind().dialect.name
+  long_terms = [term for term in terms if len(term) >= MIN_TRIGRAM_LENGTH]
+  short_terms = [term for term in terms if len(term) < MIN_TRIGRAM_LENGTH]
+
+  if dialect == 'sqlite' and long_terms:
+    match = ' AND '.join(_fts_phrase(term) for term in long_terms)
+    hits = (
+      select(item_search.c.rowid.label('item_id'), item_search.c.rank.label('rank'))
+      .where(literal_column('item_search').op('MATCH')(match))
+      .subquery()
+    )
+    query = query.join(hits, hits.c.item_id == model.id)
+    if ranked:
+      # FTS5のrankはbm25で、小さいほど関連度が高い
+      query = query.order_by(hits.c.rank, model.id.desc())
+    # トリグラムで引けない短い検索語は、候補を絞った後の行に対してだけ LIKE で確認する
+    return query.filter(*_substring_conditions(model.search_text, short_terms))
+
+  # PostgreSQL は pg_trgm のGINインデックスが LIKE をそのまま高速化する
+  # 短い検索語しかない場合（SQLite含む）は索引が使えないので LIKE で全件を確認する
+  query = query.filter(*_substring_conditions(model.search_text, terms))
+  if ranked:
+    if dialect == 'postgresql':
+      query = query.order_by(func.similarity(model.search_text, ' '.join(terms)).desc(), model.id.desc())
+    else:
+      query = query.order_by(model.created_at.desc(), model.id.desc())
+  return query
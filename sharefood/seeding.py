@@ -0,0 +1,442 @@
+import calendar
+import random
+import time
+from bisect import bisect
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, insert, select
+from .clock import utcnow
+
+# ベンチマーク・ステージング用の大量データの投入（flask seed）
+#
+# ORMで1件ずつ db.session.add すると数十万件で何時間もかかり、bcryptでパスワードを1人ずつハッシュ化するとさらに遅い。
+# そこで
+#   - パスワードのハッシュは1回だけ計算して全員に使い回す（--password-hash で計算済みのものも渡せる）
+#   - SQLiteでは、行をPythonで1行ずつ作らず、乱数で選んだ数千件の雛形（アイテムの食品・説明・受け渡し場所、ユーザーの姓名）を
+#     一時テーブルに入れ、INSERT ... SELECT の1文で、再帰CTEの連番から雛形・出品者・日時・座標のずれを選んで作る
+#     （Pythonで作って executemany で入れる場合の数倍速い）
+#     それ以外のDBでは、同じ分布の行をPythonのタプルで作り、chunk_size 件ずつ executemany でINSERTする
+#   - アイテムは作成日時の順に並べて入れる（実際のデータと同じく、IDと作成日時の順番が揃う）
+#   - SQLiteではitemテーブルのインデックスと、全文検索（FTS5）・位置検索（R*Tree）の索引を更新するトリガーを外して入れ、
+#     最後にインデックスを作り直し、追加した範囲だけをまとめて索引に入れてからトリガーを戻す
+# 全体を1つのトランザクションで行うので、途中で失敗してもトリガーを含めて元に戻る
+#
+#   flask seed --users 100000 --items 1000000
+#   flask seed --users 100000 --items 1000000 --defer-indexes && flask seed reindex
+# ユーザーのメールアドレスは user<ID>@example.com、パスワードは --password（既定は password）
+#
+# 時間の大半は索引の作成（特にR*Tree）にかかる。--defer-indexes を付けると、itemテーブルのインデックスと索引を作らず、
+# トリガーも外したままで終える。その間は検索・近くの検索に追加したアイテムが出ず、一覧も遅いので、
+# 使う前に flask seed reindex で作ること（続けて何回か seed してから、最後に1回だけ reindex してもよい）
+
+DEFAULT_PASSWORD = 'password'
+
+# 姓・名（ユーザー名に使う）
+FAMILY_NAMES = ['佐藤', '鈴木', '高橋', '田中', '伊藤', '渡辺', '山本', '中村', '小林', '加藤', '吉田', '山田', '佐々木', '松本', '井上']
+GIVEN_NAMES = ['翔', '蓮', '大翔', '陽翔', '悠真', '湊', '陽葵', '凛', '結菜', '葵', '花子', '太郎', '美咲', '健太', 'さくら']
+
+# (食品名, 単位, 作成日から賞味期限までの日数の範囲)
+FOODS = [
+  ('りんご', '個', (7, 30)), ('みかん', '個', (7, 21)), ('バナナ', '房', (3, 7)), ('キャベツ', '玉', (5, 14)),
+  ('にんじん', '本', (7, 21)), ('じゃがいも', '個', (14, 60)), ('玉ねぎ', '個', (14, 60)), ('トマト', '個', (3, 10)),
+  ('食パン', '袋', (2, 5)), ('牛乳', '本', (3, 10)), ('ヨーグルト', '個', (7, 14)), ('卵', 'パック', (7, 14)),
+  ('豆腐', '丁', (3, 7)), ('納豆', 'パック', (5, 10)), ('お米', '袋', (90, 365)), ('パスタ', '袋', (180, 720)),
+  ('カップ麺', '個', (90, 180)), ('ツナ缶', '缶', (365, 1095)), ('レトルトカレー', '個', (180, 540)), ('お茶', '本', (90, 270)),
+]
+PREFIXES = ['', '', '', '国産', '有機', '訳あり', '業務用', '北海道産', '手作り', '大容量']
+DESCRIPTIONS = [
+  None, '未開封です。', '買いすぎてしまったのでお譲りします。', '賞味期限が近いので早めに取りに来られる方。',
+  '家庭菜園で採れました。', '箱ごとお渡しできます。', '少し傷がありますが問題なく食べられます。',
+]
+
+# (地域, 緯度, 経度, 重み, 受け渡し場所)。アイテムは受け渡し場所の周り（標準偏差 SPREAD_DEGREES）に散らばる
+CITIES = [
+  ('東京', 35.681236, 139.767125, 35, ['東京駅', '渋谷駅', '新宿駅', '池袋駅', '上野駅']),
+  ('大阪', 34.702485, 135.495951, 18, ['梅田駅', '難波駅', '天王寺駅']),
+  ('名古屋', 35.170915, 136.881537, 10, ['名古屋駅', '栄駅']),
+  ('札幌', 43.068661, 141.350755, 8, ['札幌駅', '大通駅']),
+  ('福岡', 33.589886, 130.420629, 8, ['博多駅', '天神駅']),
+  ('仙台', 38.260132, 140.882438, 6, ['仙台駅']),
+  ('広島', 34.385203, 132.455293, 6, ['広島駅']),
+  ('那覇', 26.212401, 127.680932, 4, ['県庁前駅']),
+]
+SPREAD_DEGREES = 0.03
+JITTER_DEGREES = 0.005   # SQLiteで雛形から作るときに、行ごとに座標をずらす幅（±）
+TEMPLATE_COUNT = 8192    # SQLiteで使うアイテムの雛形の数（32768の約数にする）
+NO_LOCATION_RATE = 0.03  # 位置情報のないアイテムの割合
+
+USER_COLUMNS = ('id', 'username', 'email_address', 'password_hash', 'is_verified')
+ITEM_COLUMNS = (
+  'name', 'description', 'quantity', 'unit', 'expiration_date', 'location', 'created_at', 'is_available',
+  'latitude', 'longitude', 'user_id', 'search_text',
+)
+QUANTITIES = (1, 1, 1, 2, 2, 3, 5)
+
+def generate_users(rng, first_id, count, password_hash):
+  """ユーザーの行（USER_COLUMNS の順のタプル）を作る"""
+  return [
+    (user_id, f'{rng.choice(FAMILY_NAMES)} {rng.choice(GIVEN_NAMES)}', f'user{user_id}@example.com', password_hash, True)
+    for user_id in range(first_id, first_id + count)
+  ]
+
+def _item_picker(rng):
+  """
+  アイテムの内容を乱数で選ぶ関数を返す
+  選ぶ関数は (name, description, unit, min_days, max_days, location, latitude, longitude, search_text) を返す
+  """
+  from .search import build_search_text
+  random, gauss = rng.random, rng.gauss
+  search_texts = {}  # 名前と説明の組み合わせは限られているので、正規化の結果を使い回す
+  spots = [(lat, lng, spot) for _, lat, lng, _, names in CITIES for spot in names]
+  cumulative = list(accumulate(weight / len(names) for _, _, _, weight, names in CITIES for _ in names))
+  # 1行に何度も乱数で選ぶので、rng.choice の代わりに添字を直接計算する
+  n_foods, n_prefixes, n_descriptions = len(FOODS), len(PREFIXES), len(DESCRIPTIONS)
+
+  def pick():
+    food, unit, (min_days, max_days) = FOODS[int(random() * n_foods)]
+    name = PREFIXES[int(random() * n_prefixes)] + food
+    description = DESCRIPTIONS[int(random() * n_descriptions)]
+    search_text = search_texts.get((name, description))
+    if search_text is None:
+      search_text = search_texts[(name, description)] = build_search_text(name, description)
+    if random() < NO_LOCATION_RATE:
+      latitude = longitude = location = None
+    else:
+      lat, lng, location = spots[bisect(cumulative, random() * cumulative[-1])]
+      latitude, longitude = gauss(lat, SPREAD_DEGREES), gauss(lng, SPREAD_DEGREES)
+    return name, description, unit, min_days, max_days, location, latitude, longitude, search_text
+  return pick
+
+def generate_items(rng, count, user_ids, now, days=90, chunk_size=50_000):
+  """
+  アイテムの行（ITEM_COLUMNS の順のタプル）を作成日時の古い順に作り、chunk_size 件ずつのリストで返すジェネレーター
+  （全件を一度にメモリに載せない）。SQLite以外のDBで使う
+  """
+  random, pick = rng.random, _item_picker(rng)
+  n_quantities, n_users = len(QUANTITIES), len(user_ids)
+  span = days * 24 * 3600
+  today = now.date()
+
+  rows = []
+  for offset in sorted((int(random() * span) for _ in range(count)), reverse=True):
+    created_at = now - timedelta(seconds=offset)
+    name, description, unit, min_days, max_days, location, latitude, longitude, search_text = pick()
+    expiration_date = created_at.date() + timedelta(days=min_days + int(random() * (max_days - min_days + 1)))
+    # 期限切れのものは受け渡しを停止していることが多い
+    is_available = random() < (0.9 if expiration_date >= today else 0.3)
+    rows.append((
+      name, description, QUANTITIES[int(random() * n_quantities)], unit, expiration_date, location, created_at,
+      is_available, latitude, longitude, user_ids[int(random() * n_users)], search_text,
+    ))
+    if len(rows) == chunk_size:
+      yield rows
+      rows = []
+  if rows:
+    yield rows
+
+def _chunks(rows, size):
+  for start in range(0, len(rows), size):
+    yield rows[start:start + size]
+
+def _write(conn, table, columns, chunks):
+  """行のリストを1つずつ executemany でINSERTする（SQLite以外のDB）"""
+  for rows in chunks:
+    conn.execute(insert(table), [dict(zip(columns, row)) for row in rows])
+
+# --- SQLite: 雛形からINSERT ... SELECTで作る ---
+# 連番 n ごとに、4つの線形合同法（31bit）で乱数 a, b, c, d を進め、その上位のビットで
+#   a: 雛形  b: 賞味期限までの日数  c: 作成日時の端数・出品者・経度のずれ  d: 出品状態・緯度のずれ
+# を選ぶ（同じ --seed なら同じデータになる）。作成日時は n の順に並ぶ
+# 日時はUNIX時刻（日付はその日数）で計算し、文字列にする datetime() / date() は1行に1回ずつだけ呼ぶ
+_RANDOM_SEQUENCE = """
+WITH RECURSIVE seq(n, a, b, c, d) AS (
+  SELECT 0, :a, :b, :c, :d
+  UNION ALL
+  SELECT n + 1,
+    (a * 1103515245 + 12345) % 2147483648, (b * 22695477 + 1) % 2147483648,
+    (c * 134775813 + 1) % 2147483648, (d * 214013 + 2531011) % 2147483648
+  FROM seq WHERE n < :count - 1
+)
+"""
+
+_USERS_FROM_NAMES = _RANDOM_SEQUENCE + """
+INSERT INTO user (id, username, email_address, password_hash, is_verified)
+SELECT :first_id + n, name, 'user' || (:first_id + n) || '@example.com', :password_hash, 1
+FROM seq JOIN temp.seed_name ON seed_name.id = (a / 65536) % :names
+"""
+
+_ITEMS_FROM_TEMPLATES = _RANDOM_SEQUENCE + """
+INSERT INTO item (name, description, quantity, unit, expiration_date, location, created_at, is_available,
+                  latitude, longitude, user_id, search_text)
+SELECT t.name, t.description, t.quantity, t.unit,
+  date((s.created / 86400 + t.min_days + (s.b / 65536) % t.day_span) * 86400, 'unixepoch'),
+  t.location, datetime(s.created, 'unixepoch'),
+  -- 期限切れのものは受け渡しを停止していることが多い
+  (s.d / 8) % 10 < CASE WHEN s.created / 86400 + t.min_days + (s.b / 65536) % t.day_span >= :today THEN 9 ELSE 3 END,
+  t.latitude + ((s.d / 65536) % 2001 - 1000) * :jitter, t.longitude + ((s.c / 65536) % 2001 - 1000) * :jitter,
+  {user_id}, t.search_text
+FROM (SELECT n, a, b, c, d, :start + (n * :span + c % :span) / :count AS created FROM seq) s
+JOIN temp.seed_item_template t ON t.id = (s.a / 65536) % :templates
+{user_join}
+"""
+# 出品者のIDが連番なら計算で選び、そうでなければ一時テーブル（rowidが1からの連番）から引く
+_USER_BY_RANGE = ('{min_id} + (s.c / 8) % :users', '')
+_USER_BY_TABLE = ('u.id', 'JOIN temp.seed_user u ON u.rowid = 1 + (s.c / 8) % :users')
+
+def _random_seeds(rng):
+  return {name: rng.randrange(2 ** 31) for name in 'abcd'}
+
+def generate_item_templates(rng, count=TEMPLATE_COUNT):
+  """
+  SQLiteで使うアイテムの雛形
+  (id, name, description, quantity, unit, min_days, day_span, location, latitude, longitude, search_text) を作る
+  """
+  pick = _item_picker(rng)
+  templates = []
+  for template_id in range(count):
+    name, description, unit, min_days, max_days, location, latitude, longitude, search_text = pick()
+    templates.append((
+      template_id, name, description, rng.choice(QUANTITIES), unit, min_days, max_days - min_days + 1,
+      location, latitude, longitude, search_text,
+    ))
+  return templates
+
+def _insert_users_sqlite(conn, rng, first_id, count, password_hash):
+  """姓名の組み合わせの一時テーブルを作り、INSERT ... SELECT の1文でユーザーを入れる"""
+  names = [f'{family} {given}' for family in FAMILY_NAMES for given in GIVEN_NAMES]
+  conn.exec_driver_sql('CREATE TEMP TABLE seed_name (id INTEGER PRIMARY KEY, name)')
+  conn.exec_driver_sql('INSERT INTO temp.seed_name VALUES (?, ?)', list(enumerate(names)))
+  conn.exec_driver_sql(_USERS_FROM_NAMES, {
+    **_random_seeds(rng), 'count': count, 'first_id': first_id, 'password_hash': password_hash, 'names': len(names),
+  })
+  conn.exec_driver_sql('DROP TABLE temp.seed_name')
+
+def _insert_items_sqlite(conn, rng, count, now, days):
+  """雛形の一時テーブルを作り、INSERT ... SELECT の1文でアイテムを入れる"""
+  # 出品者は既存のユーザーと今回追加したユーザーから選ぶ
+  min_id, max_id, users = conn.exec_driver_sql('SELECT min(id), max(id), count(*) FROM user').one()
+  if not users:
+    raise ValueError('アイテムを作るにはユーザーが必要です（--users を指定してください）')
+  if max_id - min_id + 1 == users:
+    user_id, user_join = _USER_BY_RANGE[0].format(min_id=int(min_id)), _USER_BY_RANGE[1]
+  else:
+    conn.exec_driver_sql('CREATE TEMP TABLE seed_user AS SELECT id FROM main.user ORDER BY id')
+    user_id, user_join = _USER_BY_TABLE
+
+  conn.exec_driver_sql(
+    'CREATE TEMP TABLE seed_item_template (id INTEGER PRIMARY KEY, name, description, quantity, unit, '
+    'min_days, day_span, location, latitude, longitude, search_text)'
+  )
+  conn.exec_driver_sql(
+    'INSERT INTO temp.seed_item_template VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', generate_item_templates(rng)
+  )
+  span = days * 24 * 3600
+  # 日時はタイムゾーンなしのUTCで保存するので、そのままの値をUNIX時刻として扱う
+  end = calendar.timegm(now.timetuple())
+  conn.exec_driver_sql(_ITEMS_FROM_TEMPLATES.format(user_id=user_id, user_join=user_join), {
+    **_random_seeds(rng), 'count': count, 'templates': TEMPLATE_COUNT, 'users': users,
+    'span': span, 'start': end - span, 'today': end // 86400, 'jitter': JITTER_DEGREES / 1000,
+  })
+  conn.exec_driver_sql('DROP TABLE temp.seed_item_template')
+  if user_join:
+    conn.exec_driver_sql('DROP TABLE temp.seed_user')
+
+# --- SQLite: インデックスと索引を外して入れる ---
+# 追加した範囲（id > ?）をまとめて索引に入れるSQL（1行ずつ入れる AFTER INSERT トリガーの代わり）
+_INDEX_FILLS = {
+  'item_search_ai': "INSERT INTO item_search(rowid, search_text) SELECT id, search_text FROM item WHERE id > ?",
+  'item_geo_ai': (
+    "INSERT INTO item_geo SELECT id, latitude, latitude, longitude, longitude FROM item "
+    "WHERE id > ? AND latitude IS NOT NULL AND longitude IS NOT NULL"
+  ),
+}
+
+def _drop_item_indexes(conn):
+  """
+  itemテーブルのインデックス（B-tree）と、FTS5・R*Treeを更新するトリガーを外し、戻すためのCREATE文を返す
+  1行ずつ索引に追加するより、入れ終わってからまとめて作るほうが速い。
+  削除・更新のトリガーも外すのは、索引に入っていない行を FTS5 の 'delete' に渡すと索引が壊れるため（--defer-indexes）
+  """
+  rows = conn.exec_driver_sql(
+    "SELECT type, name, sql FROM sqlite_master WHERE tbl_name = 'item' AND sql IS NOT NULL "
+    "AND (type = 'index' OR (type = 'trigger' AND (name LIKE 'item_search_%' OR name LIKE 'item_geo_%')))"
+  ).all()
+  for kind, name, _ in rows:
+    conn.exec_driver_sql(f'DROP {kind.upper()} {name}')
+  return rows
+
+def _restore_item_indexes(conn, dropped, after_id):
+  for kind, name, create_sql in dropped:
+    if name in _INDEX_FILLS:
+      conn.exec_driver_sql(_INDEX_FILLS[name], (after_id,))
+    conn.exec_driver_sql(create_sql)
+
+def _indexes_pending(conn):
+  """--defer-indexes で外したままのトリガーがあるか（flask seed reindex が必要か）"""
+  return conn.exec_driver_sql(
+    "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name = 'item_search_ai'"
+  ).scalar() == 0
+
+@contextmanager
+def _bulk_transaction():
+  """
+  一括処理用の接続を1つのトランザクションの中で返す
+  SQLiteでは一時的に大きめのページキャッシュを使い、接続をプールに戻す前に元に戻す
+  """
+  from . import db
+  with db.engine.connect() as conn:
+    sqlite = conn.dialect.name == 'sqlite'
+    if sqlite:
+      cache_size = conn.exec_driver_sql('PRAGMA cache_size').scalar()
+      conn.exec_driver_sql('PRAGMA cache_size = -262144')
+      conn.commit()
+    try:
+      with conn.begin():
+        if sqlite and not conn.connection.dbapi_connection.in_transaction:
+          # sqlite3モジュールはDMLの前にしかBEGINを出さず、DROP INDEX などのDDLがその場で確定してしまうので、明示的に始める
+          conn.exec_driver_sql('BEGIN')
+        yield conn
+    finally:
+      if sqlite:
+        conn.exec_driver_sql(f'PRAGMA cache_size = {cache_size}')
+
+def seed_database(users=0, items=0, password=DEFAULT_PASSWORD, password_hash=None, chunk_size=50_000,
+                  rng=None, now=None, days=90, defer_indexes=False):
+  """
+  ユーザーとアイテムを一括で追加し、件数・各段階の秒数・reindex が必要か（indexes_pending）を返す
+  アイテムの出品者は、既存のユーザーと今回追加したユーザーから選ぶ
+  defer_indexes=True なら（SQLiteでは）インデックスと索引を作らずに終える。後で reindex_database() を呼ぶこと
+  """
+  from . import password_hasher
+  from .models import Item, User
+  rng = rng or random.Random()
+  now = (now or utcnow()).replace(microsecond=0)
+  timings = {}
+
+  started = time.perf_counter()
+  if users and password_hash is None:
+    password_hash = password_hasher.hash(password)
+  timings['hash'] = time.perf_counter() - started
+
+  with _bulk_transaction() as conn:
+    sqlite = conn.dialect.name == 'sqlite'
+    first_user_id = (conn.execute(select(func.max(User.id))).scalar() or 0) + 1
+    last_item_id = conn.execute(select(func.max(Item.id))).scalar() or 0
+
+    started = time.perf_counter()
+    if sqlite and users:
+      _insert_users_sqlite(conn, rng, first_user_id, users, password_hash)
+    else:
+      user_rows = generate_users(rng, first_user_id, users, password_hash)
+      _write(conn, User.__table__, USER_COLUMNS, _chunks(user_rows, chunk_size))
+    timings['users'] = time.perf_counter() - started
+
+    if items and sqlite:
+      started = time.perf_counter()
+      dropped = _drop_item_indexes(conn)
+      _insert_items_sqlite(conn, rng, items, now, days)
+      timings['items'] = time.perf_counter() - started
+      if not defer_indexes:
+        started = time.perf_counter()
+        _restore_item_indexes(conn, dropped, last_item_id)
+        timings['indexes'] = time.perf_counter() - started
+    elif items:
+      started = time.perf_counter()
+      user_ids = conn.execute(select(User.id)).scalars().all()
+      if not user_ids:
+        raise ValueError('アイテムを作るにはユーザーが必要です（--users を指定してください）')
+      _write(conn, Item.__table__, ITEM_COLUMNS, generate_items(rng, items, user_ids, now, days, chunk_size))
+      timings['items'] = time.perf_counter() - started
+    indexes_pending = sqlite and _indexes_pending(conn)
+
+  if items:
+    from .cache import response_cache
+    response_cache.invalidate('items')
+  return {'users': users, 'items': items, 'timings': timings, 'indexes_pending': indexes_pending}
+
+def reindex_database():
+  """
+  itemテーブルのインデックスと、全文検索・位置検索の索引とトリガーを作り、各段階の秒数を返す（SQLiteのみ）
+  --defer-indexes で後回しにしたものを作る。索引の中身は全件から入れ直すので、何回実行してもよい
+  """
+  from . import geo, search
+  from .models import Item
+  timings = {}
+  with _bulk_transaction() as conn:
+    if conn.dialect.name != 'sqlite':
+      raise ValueError('reindex はSQLiteでのみ必要です（他のDBでは seed が索引を外しません）')
+    started = time.perf_counter()
+    for index in Item.__table__.indexes:
+      index.create(conn, checkfirst=True)
+    timings['indexes'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    conn.exec_driver_sql("INSERT INTO item_search(item_search) VALUES ('rebuild')")
+    timings['search'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    conn.exec_driver_sql('DELETE FROM item_geo')
+    conn.exec_driver_sql(_INDEX_FILLS['item_geo_ai'], (0,))
+    timings['geo'] = time.perf_counter() - started
+
+    # トリガーを戻す（残っているものはそのまま）
+    for statement in search.sqlite_ddl() + geo.sqlite_ddl():
+      conn.exec_driver_sql(statement)
+
+  from .cache import response_cache
+  response_cache.invalidate('items')
+  return timings
+
+def init_app(app):
+  app.cli.add_command(seed_command)
+
+def _format_timings(timings):
+  return '  ' + ' '.join(f'{name}={seconds:.2f}s' for name, seconds in timings.items())
+
+@click.group('seed', invoke_without_command=True)
+@click.option('--users', type=int, default=1000, show_default=True, help='追加するユーザー数')
+@click.option('--items', type=int, default=10_000, show_default=True, help='追加するアイテム数')
+@click.option('--password', default=DEFAULT_PASSWORD, show_default=True, help='全ユーザー共通のパスワード')
+@click.option('--password-hash', default=None, help='計算済みのパスワードハッシュ（指定するとbcryptの計算もしない）')
+@click.option('--chunk-size', type=int, default=50_000, show_default=True, help='1回のexecutemanyで入れる行数（SQLite以外）')
+@click.option('--days', type=int, default=90, show_default=True, help='作成日時を散らばらせる日数')
+@click.option('--seed', 'random_seed', type=int, default=None, help='乱数のシード（同じ値なら同じデータになる）')
+@click.option('--defer-indexes', is_flag=True, help='インデックスと検索・位置の索引を作らずに終える（後で flask seed reindex を実行する）')
+@click.pass_context
+def seed_command(ctx, users, items, password, password_hash, chunk_size, days, random_seed, defer_indexes):
+  """ベンチマーク・ステージング用のユーザーとアイテムを一括で追加する"""
+  if ctx.invoked_subcommand is not None:
+    return
+  ctx.invoke(_seed, users, items, password, password_hash, chunk_size, days, random_seed, defer_indexes)
+
+@with_appcontext
+def _seed(users, items, password, password_hash, chunk_size, days, random_seed, defer_indexes):
+  started = time.perf_counter()
+  try:
+    result = seed_database(
+      users, items, password, password_hash, chunk_size, random.Random(random_seed), days=days,
+      defer_indexes=defer_indexes,
+    )
+  except ValueError as err:
+    raise click.UsageError(str(err)) from err
+  elapsed = time.perf_counter() - started
+  rows = users + items
+  click.echo(f'{users}人のユーザーと{items}件のアイテムを{elapsed:.1f}秒で追加しました（{rows / elapsed:,.0f}行/秒）')
+  click.echo(_format_timings(result['timings']))
+  if result['indexes_pending']:
+    click.echo('インデックスと検索・位置の索引はまだ作られていません。使う前に flask seed reindex を実行してください')
+
+@seed_command.command('reindex')
+@with_appcontext
+def reindex_command():
+  """--defer-indexes で後回しにしたインデックスと検索・位置の索引を作る"""
+  started = time.perf_counter()
+  try:
+    timings = reindex_database()
+  except ValueError as err:
+    raise click.UsageError(str(err)) from err
+  click.echo(f'インデックスと検索・位置の索引を{time.perf_counter() - started:.1f}秒で作りました')
+  click.echo(_format_timings(timings))
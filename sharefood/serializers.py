@@ -0,0 +1,79 @@
+from urllib.parse import quote
+from flask import current_app, url_for
+from .images import variant_filenames
+from .models import Item, User
+
+# 一覧・詳細レスポンス用の高速シリアライザ
+# items_schema.dump() はORMオブジェクトを1件ずつ組み立て、フィールドごとにmarshmallowの処理を通すため、
+# 件数が多いとそれだけで一覧APIの大半の時間を使ってしまう
+# ここでは必要な列だけを行タプルとして取得し、辞書を直接組み立てる
+# 出力は ItemSchema（schemas.py）と完全に同じJSONになるようにしているので、
+# ItemSchema にフィールドを追加・変更したときはこちらも合わせて変更すること（tests/test_serializers.py で比較している）
+
+# ItemSchema.created_at と同じ書式
+CREATED_AT_FORMAT = '%Y-%m-%dT%H:%M:%S'
+# werkzeugがURLのパス部分を組み立てるときと同じ、エスケープしない文字
+_PATH_SAFE = "!$&'()*+,/:;=@"
+
+# 取得する列（出品者の列は Item の列と名前がぶつからないようにラベルを付ける）
+ITEM_ROW_COLUMNS = (
+  Item.id, Item.created_at, Item.img_url, Item.name, Item.description, Item.quantity,
+  Item.unit, Item.expiration_date, Item.location, Item.is_available,
+  User.id.label('owner_id'), User.username.label('owner_username'),
+)
+
+def item_rows_query(query):
+  """Itemのクエリを、シリアライズに必要な列だけを返すクエリに変える（出品者はJOINで同時に取得）"""
+  # LEFT JOIN にしておくと、SQLiteが item 側のインデックスを使う結合順を崩さない
+  return query.with_entities(*ITEM_ROW_COLUMNS).outerjoin(User, Item.user_id == User.id)
+
+def image_url_base():
+  """画像URLの共通部分。url_for はリクエストごとに1回だけ呼ぶ"""
+  return url_for('static', filename='uploads/', _external=True)
+
+def variant_widths():
+  """縮小版の幅（小さい順）。image_url_base() と同じく、設定の読み込みと並べ替えはリクエストごとに1回だけ行う"""
+  return sorted(current_app.config['IMAGE_VARIANT_WIDTHS'])
+
+def image_variants(img_url, image_base, widths):
+  """
+  画像の縮小版のURLを幅の小さい順に返す（ItemSchema.image_variants と共通。widths は variant_widths() の値）
+  クライアントは表示サイズ以上で一番小さいものを選べばよい
+  """
+  if not img_url:
+    return []
+  # 縮小版の名前は元の名前の拡張子を付け替えたものなので、エスケープは元の名前に1回だけ行う（'.' はエスケープされない）
+  path = image_base + quote(img_url, safe=_PATH_SAFE)
+  variants = []
+  for width in widths:
+    jpeg_url, webp_url = variant_filenames(path, width)
+    variants.append({'width': width, 'url': jpeg_url, 'webp_url': webp_url})
+  return variants
+
+def dump_item_row(row, image_base, widths):
+  """行タプル1件を ItemSchema.dump() と同じ辞書にする（image_base と widths はリクエストごとに1回作って渡す）"""
+  # 列の名前で引くより、ITEM_ROW_COLUMNS の順番で一度に取り出すほうが速い
+  (
+    item_id, created_at, img_url, name, description, quantity,
+    unit, expiration_date, location, is_available, owner_id, owner_username,
+  ) = row
+  return {
+    'id': item_id,
+    # CREATED_AT_FORMAT と同じ文字列になる（strftime より速い）
+    'created_at': created_at.isoformat(timespec='seconds') if created_at is not None else None,
+    'image_url': image_base + quote(img_url, safe=_PATH_SAFE) if img_url else None,
+    'image_variants': image_variants(img_url, image_base, widths),
+    'name': name,
+    'description': description,
+    'quantity': quantity,
+    'unit': unit,
+    'expiration_date': expiration_date.isoformat() if expiration_date is not None else None,
+    'location': location,
+    'is_available': is_available,
+    'user': {'id': owner_id, 'username': owner_username},
+  }
+
+def dump_item_rows(rows):
+  """行タプルのリストを items_schema.dump() と同じリストにする"""
+  image_base, widths = image_url_base(), variant_widths()
+  return [dump_item_row(row, image_base, widths) for row in rows]
@@ -0,0 +1,254 @@
+import json
+import re
+import threading
+import time
+from datetime import datetime, timezone
+import click
+from flask import current_app, has_request_context, request
+from flask.cli import with_appcontext
+from sqlalchemy import event
+from .metrics import BACKGROUND, UNMATCHED, read_snapshots
+
+# 遅いSQLの記録（スロークエリログ）
+#
+# SLOW_QUERY_THRESHOLD_MS より時間のかかったSQL文を、次の情報と一緒にアプリのログ（WARNING）に出す
+#   - 正規化したSQL（リテラルを ? に、IN (?, ?, ...) を IN (?...) にまとめ、空白を詰めたもの）
+#   - バインドパラメータの形（型だけ。値にはメールアドレスなどが含まれるので記録しない）
+#   - そのSQLを発行したルート（Blueprint名.関数名、リクエストの外なら "(background)"）
+#   - 実行計画（SQLiteは EXPLAIN QUERY PLAN、それ以外は EXPLAIN）。同じ文につき最初に遅かったときの1回だけ取る
+#
+# 正規化したSQLが同じものは1行にまとめ、回数・合計時間・最大時間を数える。
+# 表の大きさは SLOW_QUERY_MAX_ENTRIES までで、あふれたら合計時間の一番小さいものを捨てる
+#   flask slow-queries dump : 表を合計時間の大きい順に表示する
+# 表はプロセスごとのメモリにあるので、dump を使うにはサーバーとCLIに同じ METRICS_DIR を設定しておく。
+# 各ワーカーの表がメトリクスと一緒に書き出され（metrics.py参照）、dump でまとめて見られる（未設定ならエラーになる）
+
+MAX_ROUTES = 10  # 1つの文について記録するルートの数
+MAX_SHAPES = 5   # 1つの文について記録するパラメータの形の数
+EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT')
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+def normalize(statement):
+  """リテラルと IN の要素数の違いを除いて、同じ形の文が同じ文字列になるようにする"""
+  statement = _STRING_LITERAL.sub('?', statement)
+  statement = _NUMBER_LITERAL.sub('?', statement)
+  statement = _IN_LIST.sub('IN (?...)', statement)
+  return _WHITESPACE.sub(' ', statement).strip()
+
+def _type_names(values):
+  return ', '.join(type(value).__name__ for value in values)
+
+def parameter_shape(parameters, executemany=False):
+  """バインドパラメータの値を除いた形（型の並び）"""
+  if executemany:
+    rows = list(parameters or ())
+    return f'{len(rows)} x {parameter_shape(rows[0]) if rows else "()"}'
+  if isinstance(parameters, dict):
+    return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in parameters.items()) + '}'
+  return f'({_type_names(parameters or ())})'
+
+def _current_route():
+  if not has_request_context():
+    return BACKGROUND
+  return request.endpoint or UNMATCHED
+
+def _format_plan(dialect_name, rows):
+  if dialect_name == 'sqlite':
+    # (id, parent, notused, detail) の detail だけを並べる
+    return '\n'.join(str(row[-1]) for row in rows)
+  return '\n'.join(' | '.join(str(value) for value in row) for row in rows)
+
+def explain(connection, statement, parameters, executemany=False):
+  """
+  実行計画を文字列で返す。取れなかったときはエラーの説明を返す
+  実行中のカーソルの結果を壊さないよう、同じDBAPI接続の別のカーソルで実行する（エンジンのイベントも発生しない）
+  """
+  if not statement.lstrip().upper().startswith(EXPLAINABLE):
+    return None
+  if executemany:
+    parameters = next(iter(parameters or ()), ())
+  dialect_name = connection.dialect.name
+  prefix = 'EXPLAIN QUERY PLAN ' if dialect_name == 'sqlite' else 'EXPLAIN '
+  cursor = connection.connection.cursor()
+  try:
+    if dialect_name != 'sqlite':
+      # PostgreSQLではエラーになるとトランザクション全体が使えなくなるので、セーブポイントの中で実行する
+      cursor.execute('SAVEPOINT sharefood_explain')
+    try:
+      cursor.execute(prefix + statement, parameters)
+      plan = _format_plan(dialect_name, cursor.fetchall())
+    except Exception as err:
+      plan = f'(実行計画を取得できませんでした: {err})'
+    if dialect_name != 'sqlite':
+      cursor.execute('ROLLBACK TO SAVEPOINT sharefood_explain')
+      cursor.execute('RELEASE SAVEPOINT sharefood_explain')
+    return plan
+  finally:
+    cursor.close()
+
+class SlowQueryLog:
+  """正規化したSQLごとに遅かった回数などをまとめる、大きさに上限のある表（スレッドセーフ）"""
+
+  def __init__(self, max_entries=256):
+    self.max_entries = max_entries
+    self.entries = {}  # 正規化したSQL -> 集計
+    self.lock = threading.Lock()
+
+  def record(self, sql, elapsed_ms, route, shape):
+    """
+    1回分を記録し、（この文の実行計画をまだ取っていなければ）それを取る役目になったかを返す
+    実行計画を取るのは同じ文につき1回だけ（取った結果は set_plan で渡す）
+    """
+    with self.lock:
+      entry = self.entries.get(sql)
+      if entry is None:
+        if len(self.entries) >= self.max_entries:
+          del self.entries[min(self.entries, key=lambda key: self.entries[key]['total_ms'])]
+        entry = self.entries[sql] = {
+          'sql': sql, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'last_seen': None,
+          'routes': {}, 'shapes': [], 'plan': None, 'explained': False,
+        }
+      entry['count'] += 1
+      entry['total_ms'] += elapsed_ms
+      entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+      entry['last_seen'] = time.time()
+      if route in entry['routes'] or len(entry['routes']) < MAX_ROUTES:
+        entry['routes'][route] = entry['routes'].get(route, 0) + 1
+      if shape not in entry['shapes'] and len(entry['shapes']) < MAX_SHAPES:
+        entry['shapes'].append(shape)
+      claimed = not entry['explained']
+      entry['explained'] = True
+      return claimed
+
+  def set_plan(self, sql, plan):
+    with self.lock:
+      entry = self.entries.get(sql)
+      if entry is not None:
+        entry['plan'] = plan
+
+  def snapshot(self):
+    """JSONにできる形の表"""
+    with self.lock:
+      return [
+        {**{key: value for key, value in entry.items() if key != 'explained'},
+         'routes': dict(entry['routes']), 'shapes': list(entry['shapes'])}
+        for entry in self.entries.values()
+      ]
+
+def merge_entries(tables):
+  """複数プロセスの表をまとめ、合計時間の大きい順に並べる"""
+  merged = {}
+  for table in tables:
+    for entry in table:
+      current = merged.get(entry['sql'])
+      if current is None:
+        merged[entry['sql']] = {**entry, 'routes': dict(entry['routes']), 'shapes': list(entry['shapes'])}
+        continue
+      current['count'] += entry['count']
+      current['total_ms'] += entry['total_ms']
+      current['max_ms'] = max(current['max_ms'], entry['max_ms'])
+      current['last_seen'] = max(current['last_seen'], entry['last_seen'])
+      for route, count in entry['routes'].items():
+        current['routes'][route] = current['routes'].get(route, 0) + count
+      current['shapes'] += [shape for shape in entry['shapes'] if shape not in current['shapes']]
+      current['plan'] = current['plan'] or entry['plan']
+  return sorted(merged.values(), key=lambda entry: entry['total_ms'], reverse=True)
+
+def _listen(app, engine, log):
+  threshold_ms = app.config['SLOW_QUERY_THRESHOLD_MS']
+  capture_plan = app.config['SLOW_QUERY_EXPLAIN']
+  logger = app.logger
+
+  @event.listens_for(engine, 'before_cursor_execute')
+  def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._slow_query_started = time.perf_counter()
+
+  @event.listens_for(engine, 'after_cursor_execute')
+  def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - context._slow_query_started) * 1000
+    if elapsed_ms < threshold_ms:
+      return
+    sql = normalize(statement)
+    route = _current_route()
+    shape = parameter_shape(parameters, executemany)
+    plan = None
+    if log.record(sql, elapsed_ms, route, shape) and capture_plan:
+      plan = explain(conn, statement, parameters, executemany)
+      log.set_plan(sql, plan)
+    message = f"遅いSQL（{elapsed_ms:.1f}ms, {route}）: {sql} パラメータ: {shape}"
+    if plan:
+      message += f"\n実行計画:\n{plan}"
+    logger.warning(message)
+
+def init_app(app):
+  """SLOW_QUERY_THRESHOLD_MS が設定されていれば記録を始める（metrics.init_app の後に呼ぶ）"""
+  app.config.setdefault('SLOW_QUERY_THRESHOLD_MS', 0)
+  app.config.setdefault('SLOW_QUERY_MAX_ENTRIES', 256)
+  app.config.setdefault('SLOW_QUERY_EXPLAIN', True)
+  app.cli.add_command(slow_queries_cli)
+  if not app.config['SLOW_QUERY_THRESHOLD_MS']:
+    return
+
+  from . import db
+  log = SlowQueryLog(app.config['SLOW_QUERY_MAX_ENTRIES'])
+  app.extensions['slow_query_log'] = log
+  with app.app_context():
+    for engine in db.engines.values():
+      _listen(app, engine, log)
+  # METRICS_DIR があれば、プロセスごとのメトリクスのファイルに表も一緒に書き出す
+  if 'metrics' in app.extensions:
+    app.extensions['metrics'].add_section('slow_queries', log.snapshot)
+
+def collect_entries(app):
+  """このプロセス（と、METRICS_DIR があれば他のプロセス）の表をまとめて返す"""
+  snapshots = read_snapshots(app)
+  if snapshots:
+    return merge_entries(snapshot.get('slow_queries', []) for snapshot in snapshots)
+  log = app.extensions.get('slow_query_log')
+  return merge_entries([log.snapshot()] if log is not None else [])
+
+@click.group('slow-queries')
+def slow_queries_cli():
+  """遅いSQLの記録"""
+
+@slow_queries_cli.command('dump')
+@click.option('--limit', type=int, default=20, help='表示する文の数')
+@click.option('--json', 'as_json', is_flag=True, help='JSONで出力する')
+@with_appcontext
+def dump_command(limit, as_json):
+  """記録した遅いSQLを、合計時間の大きい順に表示する"""
+  app = current_app._get_current_object()
+  if not app.config['SLOW_QUERY_THRESHOLD_MS']:
+    click.echo('SLOW_QUERY_THRESHOLD_MS が設定されていないため、記録していません')
+    return
+  # 表は各サーバープロセスのメモリにあり、このCLIのプロセスからは METRICS_DIR に書き出されたものしか読めない
+  if not app.config.get('METRICS_DIR') or 'metrics_flusher' not in app.extensions:
+    raise click.ClickException(
+      'METRICS_DIR が設定されていないため、サーバーのプロセスが記録した表を読めません'
+      '（サーバーとこのコマンドの両方に同じ METRICS_DIR を設定してください）'
+    )
+  entries = merge_entries(snapshot.get('slow_queries', []) for snapshot in read_snapshots(app))[:limit]
+  if as_json:
+    click.echo(json.dumps(entries, ensure_ascii=False, indent=2))
+    return
+  if not entries:
+    click.echo('記録された遅いSQLはありません')
+    return
+  for entry in entries:
+    last_seen = datetime.fromtimestamp(entry['last_seen'], timezone.utc).isoformat(timespec='seconds')
+    click.echo(
+      f"{entry['count']}回 合計{entry['total_ms']:.1f}ms 平均{entry['total_ms'] / entry['count']:.1f}ms "
+      f"最大{entry['max_ms']:.1f}ms 最終{last_seen}"
+    )
+    click.echo(f"  SQL: {entry['sql']}")
+    click.echo(f"  ルート: {', '.join(f'{route}({count})' for route, count in entry['routes'].items())}")
+    click.echo(f"  パラメータ: {' / '.join(entry['shapes'])}")
+    if entry['plan']:
+      click.echo('  実行計画:')
+      for line in entry['plan'].splitlines():
+        click.echo(f'    {line}')
+    click.echo('')
@@ -0,0 +1,141 @@
+import hashlib
+import mimetypes
+import os
+import re
+import stat as stat_module
+from flask import Response, current_app, request, send_file
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+# フロントエンドのビルド成果物（静的ファイル）の配信
+#
+# 起動時に静的フォルダを1回だけ走査してマニフェスト（パス → ファイル情報）を作り、
+# リクエストごとのファイル存在チェック（os.path.exists）をなくす。index.html は中身ごとメモリに持つ
+#
+# - ビルド時に作った圧縮済みファイル（main.js.br / main.js.gz）があれば、Accept-Encoding に応じてそちらを返す
+# - ファイル名にハッシュを含むもの（main.3f2a1b9c.js など）は中身が変わると名前も変わるので、
+#   1年間のimmutableキャッシュを付ける。それ以外（index.html など）は毎回ETagで確認させる
+# - STATIC_SENDFILE_MODE を設定すると、ファイルの中身の送信を前段のプロキシに任せる
+#     'x-sendfile'       : X-Sendfile ヘッダー（Apache, lighttpd）
+#     'x-accel-redirect' : X-Accel-Redirect ヘッダー（nginx。STATIC_ACCEL_PREFIX / UPLOADS_ACCEL_PREFIX を internal な location にする）
+#
+# ビルドし直したファイルを反映するにはアプリの再起動が必要（DEBUG時はリクエストごとに作り直す）
+
+# 圧縮形式と拡張子（優先する順）
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+IMMUTABLE_CACHE_CONTROL = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+# ハッシュ付きのファイル名（main.3f2a1b9c.js, index-B4x9Kq2z.css など。ハッシュ部分に数字を1つ以上含む）
+DEFAULT_IMMUTABLE_PATTERN = r'[.-](?=[A-Za-z0-9_]*\d)[A-Za-z0-9_]{8,}\.\w+$'
+
+class Asset:
+  """マニフェストの1ファイル分の情報"""
+  __slots__ = ('path', 'mimetype', 'etag', 'immutable', 'encodings', 'data')
+
+  def __init__(self, path, mimetype, etag, immutable, encodings, data=None):
+    self.path = path             # 元ファイルの絶対パス
+    self.mimetype = mimetype
+    self.etag = etag
+    self.immutable = immutable
+    self.encodings = encodings   # {'br': 圧縮済みファイルのパス, ...}
+    self.data = data             # メモリに持つ場合の中身 {None: 元の中身, 'br': ..., 'gzip': ...}
+
+def _file_etag(stat):
+  return hashlib.sha1(f'{stat.st_mtime_ns}-{stat.st_size}'.encode()).hexdigest()
+
+def build_manifest(static_folder, immutable_pattern=DEFAULT_IMMUTABLE_PATTERN, in_memory=('index.html',)):
+  """静的フォルダを走査して {相対パス: Asset} を作る（圧縮済みファイル自体も通常のファイルとして含める）"""
+  manifest = {}
+  if not static_folder or not os.path.isdir(static_folder):
+    return manifest
+  pattern = re.compile(immutable_pattern)
+
+  for root, _, files in os.walk(static_folder):
+    names = set(files)
+    for name in files:
+      path = os.path.join(root, name)
+      relative = os.path.relpath(path, static_folder).replace(os.sep, '/')
+      stat = os.stat(path)
+      mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+      encodings = {
+        encoding: os.path.join(root, name + suffix)
+        for encoding, suffix in ENCODINGS if name + suffix in names
+      }
+      asset = Asset(path, mimetype, _file_etag(stat), bool(pattern.search(name)), encodings)
+      if relative in in_memory:
+        asset.data = {None: _read(path)}
+        asset.data.update({encoding: _read(encoded) for encoding, encoded in encodings.items()})
+        asset.etag = hashlib.sha1(asset.data[None]).hexdigest()
+      manifest[relative] = asset
+  return manifest
+
+def _read(path):
+  with open(path, 'rb') as f:
+    return f.read()
+
+def choose_encoding(asset):
+  """クライアントが受け取れる圧縮形式のうち、圧縮済みファイルがあるものを返す（なければNone）"""
+  if not asset.encodings:
+    return None
+  accepted = request.accept_encodings
+  for encoding, _ in ENCODINGS:
+    if encoding in asset.encodings and accepted[encoding] > 0:
+      return encoding
+  return None
+
+def _cache_control(response, immutable):
+  if immutable:
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+  else:
+    # 毎回ETagで更新を確認させる（変わっていなければ304）
+    response.headers['Cache-Control'] = 'no-cache'
+  return response
+
+def send_asset(asset, relative, accel_prefix):
+  """マニフェストのファイルを返す（圧縮済みファイル・キャッシュヘッダー・sendfileに対応）"""
+  encoding = choose_encoding(asset)
+  etag = f'{asset.etag}-{encoding}' if encoding else asset.etag
+
+  if asset.data is not None:
+    response = Response(asset.data[encoding], mimetype=asset.mimetype)
+    response.set_etag(etag)
+    response = response.make_conditional(request)
+  else:
+    path = asset.encodings[encoding] if encoding else asset.path
+    suffix = dict(ENCODINGS)[encoding] if encoding else ''
+    response = send_path(path, relative + suffix, asset.mimetype, etag, accel_prefix)
+
+  if asset.encodings:
+    response.vary.add('Accept-Encoding')
+    if encoding:
+      response.headers['Content-Encoding'] = encoding
+  return _cache_control(response, asset.immutable)
+
+def send_path(path, relative, mimetype, etag, accel_prefix):
+  """
+  ファイルを返す。STATIC_SENDFILE_MODE が 'x-accel-redirect' なら、中身は送らずにnginxの内部URLを返す
+  （'x-sendfile' は Flask の USE_X_SENDFILE で send_file が X-Sendfile ヘッダーを付ける）
+  """
+  if current_app.config.get('STATIC_SENDFILE_MODE') == 'x-accel-redirect':
+    response = Response(mimetype=mimetype)
+    response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + relative
+    response.set_etag(etag)
+    return response.make_conditional(request)
+  return send_file(path, mimetype=mimetype, etag=etag, conditional=True, max_age=None)
+
+def send_upload(relative, immutable):
+  """UPLOAD_FOLDER の画像を返す（アップロードは起動後に増えるのでマニフェストには含めない）"""
+  upload_folder = current_app.config['UPLOAD_FOLDER']
+  path = safe_join(upload_folder, relative)
+  if path is None:
+    raise NotFound()
+  try:
+    stat = os.stat(path)
+  except (FileNotFoundError, NotADirectoryError):
+    raise NotFound()
+  # /uploads/ab のようなシャードのディレクトリなど、通常のファイル以外は返さない
+  if not stat_module.S_ISREG(stat.st_mode):
+    raise NotFound()
+  mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+  response = send_path(path, relative, mimetype, _file_etag(stat), current_app.config['UPLOADS_ACCEL_PREFIX'])
+  return _cache_control(response, immutable)
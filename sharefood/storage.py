@@ -0,0 +1,330 @@
+import hashlib
+import os
+import re
+import shutil
+import time
+import uuid
+from collections import namedtuple
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import update
+from .workers import PeriodicWorker
+
+# アップロード画像の保存場所（コンテンツアドレス方式）
+# ファイル名はアップロードされたバイト列のSHA-256から決め、先頭の文字でサブディレクトリに振り分ける
+#   例) 3f/a2/3fa2c9...e1.jpg
+# - 別々のユーザーが同じ名前（IMG_0001.jpg など）でアップロードしても上書きし合わない
+# - まったく同じ画像が再度アップロードされたら、既存のファイルをそのまま使う（重複排除）
+# - 1つのディレクトリのファイル数が増えすぎないので、一覧やバックアップが遅くならない
+#
+# この方式より前にアップロードされた画像（UPLOAD_FOLDER直下のファイル）は
+#   flask uploads migrate
+# で新しい保存場所に移し、Item.img_url を書き換える
+#
+# どのアイテムからも参照されなくなった画像（削除されたアイテムの画像や、/upload だけされた画像）は
+#   flask uploads gc
+# で削除（または隔離）する。UPLOAD_GC_INTERVAL_SECONDS を設定すると、アプリ内のスレッドで定期的に実行する
+
+# サブディレクトリの階層数と、1階層あたりの文字数（16進2文字 → 256ディレクトリ）
+SHARD_DEPTH = 2
+SHARD_WIDTH = 2
+# ハッシュを計算しながら書き込むときの1回の読み込みサイズ
+CHUNK_SIZE = 64 * 1024
+
+# content_filename() が返すファイル名の形式（クライアントから受け取ったファイル名の検証用）
+CONTENT_FILENAME_PATTERN = r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.(?:jpg|png|gif)$'
+
+def content_filename(digest, extension):
+  """ハッシュ値と拡張子から、UPLOAD_FOLDERからの相対パスを返す"""
+  shards = [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_DEPTH)]
+  return '/'.join(shards + [f'{digest}.{extension}'])
+
+def is_content_addressed(filename):
+  """img_url がこの方式で保存されたファイルか（直下の旧ファイルでないか）"""
+  return '/' in filename
+
+def save_hashed(stream, folder):
+  """
+  streamをfolderの一時ファイルに書き込みながらSHA-256を計算し、(ハッシュ値, 一時ファイルのパス) を返す
+  書き込みと同時にハッシュを計算するので、ファイルを2回読まずに済む
+  """
+  os.makedirs(folder, exist_ok=True)
+  path = os.path.join(folder, f'{uuid.uuid4().hex}.upload')
+  digest = hashlib.sha256()
+  try:
+    with open(path, 'wb') as out:
+      while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+          break
+        digest.update(chunk)
+        out.write(chunk)
+  except BaseException:
+    os.remove(path)
+    raise
+  return digest.hexdigest(), path
+
+def file_digest(path):
+  """既存ファイルのSHA-256"""
+  digest = hashlib.sha256()
+  with open(path, 'rb') as src:
+    for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+# --- 参照されなくなったファイルの削除（GC） ---
+
+# 縮小版のファイル名（images.variant_filenames）から、元画像の名前を取り出す
+_VARIANT_PATTERN = re.compile(r'^(?P<stem>.+)_w\d+\.(?:jpg|webp)$')
+# 元画像として保存されうる拡張子（images.EXTENSIONS_BY_FORMAT の値）
+_ORIGINAL_EXTENSIONS = ('jpg', 'png', 'gif')
+# 1回のSELECTで参照を確認するファイル数
+GC_BATCH_SIZE = 500
+
+GCReport = namedtuple('GCReport', ['scanned', 'removed', 'reclaimed_bytes'])
+
+def referenced_candidates(filename):
+  """このファイルを参照しているとみなせる img_url の候補（縮小版なら元画像の名前）"""
+  candidates = [filename]
+  match = _VARIANT_PATTERN.match(filename)
+  if match:
+    candidates.extend(f"{match.group('stem')}.{ext}" for ext in _ORIGINAL_EXTENSIONS)
+  return candidates
+
+def touch(folder, filenames):
+  """
+  ファイルの更新時刻を今にする
+  重複排除で既存のファイルを使い回すときに呼び、GCの猶予期間中に消されないようにする
+  """
+  for name in filenames:
+    try:
+      os.utime(os.path.join(folder, name))
+    except FileNotFoundError:
+      pass
+
+def iter_files(folder):
+  """folder以下のファイルを (相対パス, os.DirEntry) として1件ずつ返す（全件をメモリに載せない）"""
+  stack = ['']
+  while stack:
+    relative_dir = stack.pop()
+    try:
+      with os.scandir(os.path.join(folder, relative_dir)) as entries:
+        for entry in entries:
+          relative = f'{relative_dir}/{entry.name}' if relative_dir else entry.name
+          if entry.is_dir(follow_symlinks=False):
+            stack.append(relative)
+          elif entry.is_file(follow_symlinks=False):
+            yield relative, entry
+    except FileNotFoundError:
+      continue
+
+def _batched(iterable, size):
+  batch = []
+  for value in iterable:
+    batch.append(value)
+    if len(batch) == size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+def _referenced(session, names):
+  """namesのうち、いずれかのアイテムの img_url になっているもの"""
+  from .models import Item
+  if not names:
+    return set()
+  return {name for (name,) in session.query(Item.img_url).filter(Item.img_url.in_(names)).distinct()}
+
+def _discard(folder, relative, quarantine_folder):
+  path = os.path.join(folder, relative)
+  if quarantine_folder:
+    destination = os.path.join(quarantine_folder, relative)
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    shutil.move(path, destination)
+  else:
+    os.remove(path)
+
+def collect_garbage(session, upload_folder, grace_seconds, quarantine_folder=None, dry_run=False, log=None):
+  """
+  upload_folder のうち、どのアイテムからも参照されておらず、grace_seconds より前に更新されたファイルを
+  削除する（quarantine_folder を指定したら、同じ相対パスで隔離する）。GCReport を返す
+
+  ファイルは GC_BATCH_SIZE 件ずつ読みながら、そのバッチの名前だけをDBに問い合わせるので、
+  ファイル数やアイテム数が多くてもメモリ使用量は一定（img_url のインデックスで引く）
+  猶予期間があるので、アップロード直後でまだアイテムに紐付いていないファイルや、処理中のファイルは消さない
+  """
+  cutoff = time.time() - grace_seconds
+  scanned = removed = reclaimed = 0
+
+  for batch in _batched(iter_files(upload_folder), GC_BATCH_SIZE):
+    scanned += len(batch)
+    stat_by_name = {}
+    for relative, entry in batch:
+      try:
+        stat_by_name[relative] = entry.stat(follow_symlinks=False)
+      except FileNotFoundError:
+        continue
+    old_names = [name for name, stat in stat_by_name.items() if stat.st_mtime < cutoff]
+    candidates = {name: referenced_candidates(name) for name in old_names}
+    referenced = _referenced(session, sorted({c for names in candidates.values() for c in names}))
+
+    for name in old_names:
+      if any(candidate in referenced for candidate in candidates[name]):
+        continue
+      path = os.path.join(upload_folder, name)
+      try:
+        # 問い合わせの間に使い回された（touchされた）ファイルは消さない
+        if os.stat(path).st_mtime >= cutoff:
+          continue
+        if not dry_run:
+          _discard(upload_folder, name, quarantine_folder)
+      except FileNotFoundError:
+        continue
+      removed += 1
+      reclaimed += stat_by_name[name].st_size
+      if log:
+        log(name)
+    # バッチごとに読み取りトランザクションを終わらせ、長時間ロックを持たない
+    session.rollback()
+
+  return GCReport(scanned, removed, reclaimed)
+
+def collect_spool_garbage(spool_folder, grace_seconds, dry_run=False):
+  """処理の途中で止まって残った一時ファイルを消す。(件数, バイト数) を返す"""
+  cutoff = time.time() - grace_seconds
+  removed = reclaimed = 0
+  for _, entry in iter_files(spool_folder):
+    try:
+      stat = entry.stat(follow_symlinks=False)
+      if stat.st_mtime >= cutoff:
+        continue
+      if not dry_run:
+        os.remove(entry.path)
+    except FileNotFoundError:
+      continue
+    removed += 1
+    reclaimed += stat.st_size
+  return removed, reclaimed
+
+def run_gc(app, dry_run=False, log=None):
+  """アプリの設定でアップロード画像と一時ファイルのGCを行い、GCReport を返す"""
+  from . import db
+  config = app.config
+  grace = config['UPLOAD_GC_GRACE_SECONDS']
+  report = collect_garbage(
+    db.session, config['UPLOAD_FOLDER'], grace,
+    quarantine_folder=config.get('UPLOAD_QUARANTINE_FOLDER'), dry_run=dry_run, log=log,
+  )
+  spool_removed, spool_bytes = collect_spool_garbage(config['IMAGE_SPOOL_FOLDER'], grace, dry_run=dry_run)
+  return GCReport(report.scanned, report.removed + spool_removed, report.reclaimed_bytes + spool_bytes)
+
+def format_bytes(size):
+  """バイト数を読みやすい単位の文字列にする"""
+  for unit in ('B', 'KB', 'MB', 'GB'):
+    if size < 1024 or unit == 'GB':
+      return f'{size:.1f}{unit}' if unit != 'B' else f'{size}B'
+    size /= 1024
+
+class UploadCollector(PeriodicWorker):
+  """アプリと同じプロセス内でGCを定期的に動かすスレッド"""
+
+  thread_name = 'upload-gc'
+  interval_setting = 'UPLOAD_GC_INTERVAL_SECONDS'
+  label = 'アップロード画像のGC'
+
+  def run_once(self):
+    report = run_gc(self.app)
+    self.app.logger.info(
+      f"アップロード画像のGC: {report.removed}件を削除 ({format_bytes(report.reclaimed_bytes)}を解放)"
+    )
+
+def init_app(app):
+  """CLIコマンドと、（UPLOAD_GC_INTERVAL_SECONDS が設定されていれば）定期GCのスレッドを登録する"""
+  app.cli.add_command(uploads_cli)
+  if app.config.get('UPLOAD_GC_INTERVAL_SECONDS'):
+    collector = UploadCollector(app)
+    app.extensions['upload_collector'] = collector
+    collector.start()
+
+@click.group('uploads')
+def uploads_cli():
+  """アップロード画像の管理"""
+
+@uploads_cli.command('migrate')
+@click.option('--dry-run', is_flag=True, help='移動せず、対象のファイルを表示するだけにする')
+@with_appcontext
+def migrate_command(dry_run):
+  """UPLOAD_FOLDER直下の旧形式の画像を新しい保存場所に移し、Item.img_url を書き換える"""
+  # 循環インポートを避けるため、ここでインポートする
+  from . import db
+  from .cache import response_cache
+  from .images import EXTENSIONS_BY_FORMAT, InvalidImageError, process_image, sniff_image
+  from .models import Item
+
+  config = current_app.config
+  upload_folder = config['UPLOAD_FOLDER']
+  legacy_names = [name for (name,) in db.session.query(Item.img_url).filter(Item.img_url.isnot(None)).distinct()
+                  if not is_content_addressed(name)]
+
+  moved = skipped = 0
+  for name in legacy_names:
+    path = os.path.join(upload_folder, name)
+    if not os.path.isfile(path):
+      click.echo(f'見つかりません: {name}')
+      skipped += 1
+      continue
+    try:
+      with open(path, 'rb') as src:
+        image_format, _, _ = sniff_image(src, config['ALLOWED_EXTENSIONS'], float('inf'), config['IMAGE_MAX_PIXELS'])
+    except InvalidImageError as err:
+      click.echo(f'画像として読めません: {name} ({err})')
+      skipped += 1
+      continue
+
+    new_name = content_filename(file_digest(path), EXTENSIONS_BY_FORMAT[image_format])
+    click.echo(f'{name} -> {new_name}')
+    if dry_run:
+      continue
+
+    # 新しい方式の保存と同じく、EXIFを除いた元画像と縮小版を作る
+    if not os.path.exists(os.path.join(upload_folder, new_name)):
+      spool_path = os.path.join(config['IMAGE_SPOOL_FOLDER'], f'{uuid.uuid4().hex}.upload')
+      shutil.copyfile(path, spool_path)
+      try:
+        process_image(spool_path, upload_folder, new_name, config['IMAGE_VARIANT_WIDTHS'], config['IMAGE_QUALITY'])
+      finally:
+        os.remove(spool_path)
+    db.session.execute(
+      update(Item).where(Item.img_url == name).values(img_url=new_name).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    # 旧ファイルはDBの書き換えをコミットしてから消す（途中で止まっても画像が失われない）
+    os.remove(path)
+    moved += 1
+
+  if moved:
+    # ORMを通さないUPDATEなので、レスポンスキャッシュを明示的に無効にする
+    response_cache.invalidate('items')
+  click.echo(f'{moved}件を移動しました（スキップ: {skipped}件）')
+
+@uploads_cli.command('gc')
+@click.option('--dry-run', is_flag=True, help='削除せず、対象のファイルを表示するだけにする')
+@click.option('--grace-hours', type=float, default=None, help='この時間より新しいファイルは消さない（既定は UPLOAD_GC_GRACE_SECONDS）')
+@click.option('--quarantine', type=click.Path(file_okay=False), default=None, help='削除せずにこのフォルダへ移す')
+@click.option('--verbose', is_flag=True, help='対象のファイル名を表示する')
+@with_appcontext
+def gc_command(dry_run, grace_hours, quarantine, verbose):
+  """どのアイテムからも参照されていないアップロード画像を削除する"""
+  app = current_app._get_current_object()
+  if grace_hours is not None:
+    app.config['UPLOAD_GC_GRACE_SECONDS'] = grace_hours * 3600
+  if quarantine:
+    app.config['UPLOAD_QUARANTINE_FOLDER'] = quarantine
+  report = run_gc(app, dry_run=dry_run, log=click.echo if verbose or dry_run else None)
+  size = format_bytes(report.reclaimed_bytes)
+  if dry_run:
+    click.echo(f'{report.scanned}件を確認し、{report.removed}件が削除対象です（{size}）')
+    return
+  action = '隔離' if app.config.get('UPLOAD_QUARANTINE_FOLDER') else '削除'
+  click.echo(f'{report.scanned}件を確認し、{report.removed}件を{action}しました（{size}）')
@@ -0,0 +1,105 @@
+import threading
+from collections import namedtuple
+from flask import current_app, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, select
+from .cache import LRUCache
+
+# JWTで認証したユーザー（flask_jwt_extended の current_user）のキャッシュ
+#
+# user_lookup_loader（__init__.py）から load() を呼び、トークンのユーザーIDからユーザーを引く。
+# 結果はワーカー内で共有するTTL付きのLRUに入れるので、同じユーザーの2回目以降のリクエストではDBにアクセスしない
+#
+# キャッシュするのはORMオブジェクトではなく、レスポンスや権限の確認に使う列だけを持つ読み取り専用の値（CachedUser）。
+# ORMオブジェクトはセッション（リクエスト）ごとのものなので、リクエストをまたいで使い回せない
+#
+# Userを変更・削除してコミットしたら、そのユーザーのエントリを消す（下の after_flush / after_commit）。
+# ORMを通さないUPDATE/DELETE文でUserを書き換えた場合は user_cache.invalidate() を明示的に呼ぶこと
+# 他のワーカーのキャッシュは消せないので、古い値が残るのは最大で JWT_USER_CACHE_TTL 秒
+
+CachedUser = namedtuple('CachedUser', ['id', 'username', 'email_address', 'is_verified'])
+
+class _UserCacheState:
+  def __init__(self, max_entries):
+    self.cache = LRUCache(max_entries=max_entries)
+    self.hits = 0
+    self.misses = 0
+    self.invalidations = 0
+    self.lock = threading.Lock()
+
+class UserCache:
+  """認証済みユーザーのキャッシュ（__init__.py で init_app する）"""
+
+  def init_app(self, app):
+    app.config.setdefault('JWT_USER_CACHE_TTL', 30)
+    app.config.setdefault('JWT_USER_CACHE_MAX_ENTRIES', 10_000)
+    app.extensions['user_cache'] = _UserCacheState(app.config['JWT_USER_CACHE_MAX_ENTRIES'])
+
+  @property
+  def state(self):
+    return current_app.extensions['user_cache']
+
+  def _columns(self):
+    from .models import User
+    return [getattr(User, name) for name in CachedUser._fields]
+
+  def load(self, user_id):
+    """ユーザーIDから CachedUser を返す（存在しなければ None）"""
+    state = self.state
+    user = state.cache.get(user_id)
+    with state.lock:
+      if user is not None:
+        state.hits += 1
+        return user
+      state.misses += 1
+
+    # 循環インポートを避けるため、ここでインポートする
+    from . import db
+    from .models import User
+    row = db.session.execute(select(*self._columns()).where(User.id == user_id)).first()
+    if row is None:
+      return None  # 存在しないユーザーはキャッシュしない
+    user = CachedUser(*row)
+    state.cache.set(user_id, user, current_app.config['JWT_USER_CACHE_TTL'])
+    return user
+
+  def prime(self, user):
+    """読み込み済みのUser（ログイン時など）をキャッシュに入れる"""
+    cached = CachedUser(*(getattr(user, name) for name in CachedUser._fields))
+    self.state.cache.set(user.id, cached, current_app.config['JWT_USER_CACHE_TTL'])
+
+  def invalidate(self, user_id):
+    state = self.state
+    state.cache.delete(user_id)
+    with state.lock:
+      state.invalidations += 1
+
+  def stats(self):
+    """ヒット数・ミス数・無効化した回数・現在のエントリ数"""
+    state = self.state
+    with state.lock:
+      return {
+        'hits': state.hits, 'misses': state.misses,
+        'invalidations': state.invalidations, 'entries': len(state.cache),
+      }
+
+user_cache = UserCache()
+
+# --- ORMでのUserの変更を検知して自動で無効化する ---
+@event.listens_for(Session, 'after_flush')
+def _record_user_changes(session, flush_context):
+  from .models import User
+  changed = {obj.id for obj in (*session.dirty, *session.deleted) if isinstance(obj, User) and obj.id is not None}
+  if changed:
+    session.info.setdefault('changed_user_ids', set()).update(changed)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+  changed = session.info.pop('changed_user_ids', None)
+  if changed and has_app_context() and 'user_cache' in current_app.extensions:
+    for user_id in changed:
+      user_cache.invalidate(user_id)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+  session.info.pop('changed_user_ids', None)
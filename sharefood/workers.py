@@ -0,0 +1,65 @@
+import threading
+
+# アプリと同じプロセス内で、一定の間隔で処理を繰り返すバックグラウンドスレッド
+# メールの送信処理・アップロード画像のGC・予約の期限切れ処理・メトリクスの書き出しが使う
+#
+# 1回分の処理はアプリコンテキストの中で動かし、例外が出てもスレッドは止めずにログだけ残して次の回に進む
+# （途中で失敗したトランザクションはロールバックし、毎回セッションを返してコネクションを持ち続けない）
+
+class PeriodicWorker(threading.Thread):
+  """
+  interval_setting の設定値（秒）ごとに run_once() を呼ぶスレッドの基底クラス
+  サブクラスは thread_name / interval_setting / label を決めて run_once() を実装する
+  """
+
+  thread_name = 'periodic-worker'
+  interval_setting = None  # 間隔（秒）を持つ設定の名前
+  label = '定期処理'       # エラーのログに出す処理の名前
+  run_at_start = False     # Trueなら起動した直後にも1回動かす（Falseなら最初の間隔が過ぎてから）
+
+  def __init__(self, app):
+    super().__init__(name=self.thread_name, daemon=True)
+    self.app = app
+    self.stopped = threading.Event()
+    self.active = False
+    self.lock = threading.Lock()
+
+  def start_once(self):
+    """
+    まだ動いていなければスレッドを開始する
+    app.before_request に登録すると、flask db upgrade などCLIのプロセスではスレッドが動かず、
+    gunicorn の --preload でも fork した後の各ワーカーで動き出す
+    （before_request は値を返すとそれがレスポンスになるので、何も返さない）
+    """
+    if self.active:
+      return
+    with self.lock:
+      if self.active:
+        return
+      self.active = True
+    self.start()
+
+  def run_once(self):
+    raise NotImplementedError
+
+  def run(self):
+    interval = self.app.config[self.interval_setting]
+    if self.run_at_start and not self.stopped.is_set():
+      self._tick()
+    while not self.stopped.wait(interval):
+      self._tick()
+
+  def _tick(self):
+    # storage は __init__.py で db を作る前に読み込まれるので、ここでインポートする
+    from . import db
+    with self.app.app_context():
+      try:
+        self.run_once()
+      except Exception as err:
+        db.session.rollback()
+        self.app.logger.error(f"{self.label}でエラーが発生しました: {err}", exc_info=True)
+      finally:
+        db.session.remove()
+
+  def stop(self):
+    self.stopped.set()
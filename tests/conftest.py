@@ -2,6 +2,7 @@ import pytest
 from flask import jsonify
 from sharefood import create_app, db
 from sharefood.config import TestingConfig
+from .helpers import create_test_user, get_auth_header
 
 @pytest.fixture(scope='function')
 def client():
@@ -19,4 +20,24 @@ def client():
     yield client
     with app.app_context():
       db.session.remove()
-      db.drop_all()
\ No newline at end of file
+      db.drop_all()
+
+@pytest.fixture
+def image_client(tmp_path):
+  """画像の保存先を一時ディレクトリにしたクライアントと、ログイン済みユーザーの認証ヘッダーを返すフィクスチャ"""
+  class ImageConfig(TestingConfig):
+    UPLOAD_FOLDER = str(tmp_path / 'uploads')
+    IMAGE_SPOOL_FOLDER = str(tmp_path / 'spool')
+    IMAGE_VARIANT_WIDTHS = (160, 480)
+    IMAGE_MAX_BYTES = 200 * 1024
+
+  app = create_app(config_class=ImageConfig)
+  with app.app_context():
+    db.create_all()
+    user = create_test_user()
+    auth_header = get_auth_header(user.id)
+  client = app.test_client()
+  yield client, auth_header
+  with app.app_context():
+    db.session.remove()
+    db.drop_all()
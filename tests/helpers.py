@@ -1,6 +1,14 @@
+import hashlib
+import io
+import socketserver
+import threading
+from contextlib import contextmanager
+from sqlalchemy import event
 from sharefood import db
 from sharefood.models import User, Item
 from flask_jwt_extended import create_access_token
+from PIL import Image
+from sharefood.storage import content_filename
 
 def create_test_user(username="testuser", email="test@example.com", password="password", is_verified=True):
   """テスト用のユーザーをDBに作成するヘルパー関数"""
@@ -10,9 +18,9 @@ def create_test_user(username="testuser", email="test@example.com", password="pa
   db.session.commit()
   return user
 
-def create_test_item(user, name="テスト商品", description="テスト説明", quantity=5):
-  """テスト用のアイテムをDBに作成するヘルパー関数"""
-  item = Item(name=name, description=description, quantity=quantity, user_id=user.id)
+def create_test_item(user, name="テスト商品", description="テスト説明", quantity=5, **fields):
+  """テスト用のアイテムをDBに作成するヘルパー関数（緯度経度などはキーワード引数で追加指定できる）"""
+  item = Item(name=name, description=description, quantity=quantity, user_id=user.id, **fields)
   db.session.add(item)
   db.session.commit()
   return item
@@ -20,4 +28,119 @@ def create_test_item(user, name="テスト商品", description="テスト説明"
 def get_auth_header(user_id):
   """指定されたユーザーIDで認証ヘッダーを生成するヘルパー関数"""
   access_token = create_access_token(identity=str(user_id))
-  return {"Authorization": f"Bearer {access_token}"}
\ No newline at end of file
+  return {"Authorization": f"Bearer {access_token}"}
+
+@contextmanager
+def count_queries(app):
+  """ブロック内で発行されたSQL文を記録するヘルパー（N+1の回帰テスト用）"""
+  statements = []
+
+  def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+
+  with app.app_context():
+    engine = db.engine
+  event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+  try:
+    yield statements
+  finally:
+    event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+class LocalSMTPServer:
+  """
+  テスト用のローカルSMTPサーバー（送られたメールをメモリに記録するだけ）
+  reject に含まれる宛先には一時エラー(451)を返す
+  """
+
+  def __init__(self, reject=()):
+    self.messages = []      # (宛先リスト, 本文バイト列)
+    self.connections = 0    # 受け付けた接続数
+    self.reject = set(reject)
+    server = self
+
+    class Handler(socketserver.StreamRequestHandler):
+      def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+      def handle(self):
+        server.connections += 1
+        recipients = []
+        self.reply('220 localhost ESMTP test')
+        while True:
+          line = self.rfile.readline()
+          if not line:
+            return
+          command = line.decode().strip()
+          verb = command.split(' ', 1)[0].upper()
+          if verb in ('EHLO', 'HELO'):
+            self.reply('250 localhost')
+          elif verb == 'MAIL':
+            recipients = []
+            self.reply('250 OK')
+          elif verb == 'RCPT':
+            address = command.split(':', 1)[1].strip().strip('<>')
+            if address in server.reject:
+              self.reply('451 Try again later')
+            else:
+              recipients.append(address)
+              self.reply('250 OK')
+          elif verb == 'DATA':
+            self.reply('354 End data with <CR><LF>.<CR><LF>')
+            data = b''
+            while (chunk := self.rfile.readline()) not in (b'.\r\n', b''):
+              data += chunk
+            server.messages.append((recipients, data))
+            self.reply('250 OK')
+          elif verb in ('RSET', 'NOOP'):
+            self.reply('250 OK')
+          elif verb == 'QUIT':
+            self.reply('221 Bye')
+            return
+          else:
+            self.reply('502 Command not implemented')
+
+    self._server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+    self._server.daemon_threads = True
+    self.port = self._server.server_address[1]
+
+  def __enter__(self):
+    threading.Thread(target=self._server.serve_forever, daemon=True).start()
+    return self
+
+  def __exit__(self, *exc_info):
+    self._server.shutdown()
+    self._server.server_close()
+
+# --- 画像のテスト用（test_images.py / test_storage.py） ---
+GPS_TAG = 0x8825
+ORIENTATION_TAG = 0x0112
+
+def make_jpeg(width=800, height=600, orientation=None):
+  """GPS情報（と回転情報）を含むJPEGのバイト列を作る"""
+  image = Image.new('RGB', (width, height), (200, 30, 30))
+  exif = Image.Exif()
+  exif[GPS_TAG] = {1: 'N', 2: (35.0, 39.0, 29.0)}
+  if orientation:
+    exif[ORIENTATION_TAG] = orientation
+  buffer = io.BytesIO()
+  image.save(buffer, format='JPEG', exif=exif)
+  return buffer.getvalue()
+
+def make_png(width=300, height=200):
+  """半透明のPNGのバイト列を作る"""
+  buffer = io.BytesIO()
+  Image.new('RGBA', (width, height), (0, 0, 255, 128)).save(buffer, format='PNG')
+  return buffer.getvalue()
+
+def stored_name(data, extension):
+  """アップロードした内容から決まる保存先（拡張子なし）"""
+  return content_filename(hashlib.sha256(data).hexdigest(), extension)[:-len(extension) - 1]
+
+def post_item(client, auth_header, data, filename):
+  """画像付きで出品するヘルパー関数"""
+  return client.post(
+    '/api/v1/items/',
+    data={'name': 'りんご', 'quantity': 1, 'image': (io.BytesIO(data), filename)},
+    headers=auth_header,
+    content_type='multipart/form-data'
+  )
@@ -0,0 +1,201 @@
+import os
+from datetime import date, timedelta
+from sharefood import db
+from sharefood.models import Item
+from .helpers import create_test_user, create_test_item, get_auth_header, count_queries
+
+# ----------------------------------------------
+#      <<-- テストの要件 -->>
+
+# 一括出品で全行が登録され、送った順番どおりに返るか
+# 不正な行は行番号ごとのエラーになり、正しい行だけが登録されるか（全行不正なら422）
+# 件数によらず、INSERT文1つとコミット1回で登録されるか
+# 画像のファイル名は省略でき、指定する場合は /upload の形式で、アップロード済みのものだけ受け付けるか
+# 一括出品したアイテムが検索できるか
+# 一括更新・出品状態の切り替え・削除が、所有者の条件を含むSQL文1つで行われ、対象になったIDが返るか
+# 他人のアイテムや存在しないIDは対象にならず skipped_ids に入るか
+# ----------------------------------------------
+
+IMAGE = 'ab/cd/' + 'abcd' * 16 + '.jpg'
+MISSING_IMAGE = 'ef/01/' + 'ef01' * 16 + '.jpg'
+
+def use_upload_folder(client, tmp_path):
+  """UPLOAD_FOLDERを一時ディレクトリにして、IMAGE だけアップロード済みにする"""
+  upload_folder = tmp_path / 'uploads'
+  client.application.config['UPLOAD_FOLDER'] = str(upload_folder)
+  os.makedirs(upload_folder / os.path.dirname(IMAGE))
+  (upload_folder / IMAGE).write_bytes(b'jpeg')
+
+def make_user(client):
+  with client.application.app_context():
+    user = create_test_user()
+    return user.id, get_auth_header(user.id)
+
+
+def test_bulk_create_all_valid(client, tmp_path):
+  use_upload_folder(client, tmp_path)
+  user_id, auth_header = make_user(client)
+  payload = [
+    {'name': f'りんご{i}', 'quantity': i + 1, 'description': '産地直送', 'expiration_date': '2026-12-31'}
+    for i in range(30)
+  ]
+  payload[3]['image'] = IMAGE
+
+  response = client.post('/api/v1/items/bulk', json=payload, headers=auth_header)
+  assert response.status_code == 201
+  data = response.get_json()
+  assert data['errors'] == {}
+  assert [item['name'] for item in data['items']] == [f'りんご{i}' for i in range(30)]
+  assert all(item['user']['id'] == user_id for item in data['items'])
+  assert data['items'][3]['image_url'].endswith(f'/uploads/{IMAGE}')
+  assert data['items'][0]['image_url'] is None
+  assert data['items'][0]['expiration_date'] == '2026-12-31'
+
+  with client.application.app_context():
+    assert Item.query.count() == 30
+
+  found = client.get('/api/v1/items/search?q=りんご7').get_json()['items']
+  assert [item['name'] for item in found] == ['りんご7']
+
+
+def test_bulk_create_partial_errors(client, tmp_path):
+  use_upload_folder(client, tmp_path)
+  _, auth_header = make_user(client)
+  payload = [
+    {'name': 'みかん', 'quantity': 1},
+    {'name': '', 'quantity': 0},
+    {'name': 'ぶどう', 'quantity': 2, 'image': '../../etc/passwd'},
+    'not an object',
+    {'name': 'もも', 'quantity': 3, 'unit': '箱'},
+    # 形式は正しいがアップロードされていない画像
+    {'name': 'なし', 'quantity': 1, 'image': MISSING_IMAGE},
+    {'name': 'かき', 'quantity': 1, 'image': IMAGE},
+  ]
+  response = client.post('/api/v1/items/bulk', json=payload, headers=auth_header)
+  assert response.status_code == 207
+  data = response.get_json()
+  assert sorted(data['errors']) == ['1', '2', '3', '5']
+  assert 'image' in data['errors']['2']
+  assert data['errors']['5'] == {'image': ['画像が見つかりません。/upload でアップロードし直してください。']}
+  assert [item['name'] for item in data['items']] == ['みかん', 'もも', 'かき']
+  assert data['items'][1]['unit'] == '箱'
+  assert data['items'][2]['image_url'].endswith(f'/uploads/{IMAGE}')
+
+  # 画像が見つからない行だけなら422
+  response = client.post('/api/v1/items/bulk', json=payload[5:6], headers=auth_header)
+  assert response.status_code == 422
+  assert 'image' in response.get_json()['errors']['0']
+
+
+def test_bulk_create_rejects_invalid_payloads(client):
+  _, auth_header = make_user(client)
+  response = client.post('/api/v1/items/bulk', json=[{'name': ''}], headers=auth_header)
+  assert response.status_code == 422
+
+  assert client.post('/api/v1/items/bulk', json={'name': 'りんご'}, headers=auth_header).status_code == 400
+  assert client.post('/api/v1/items/bulk', json=[], headers=auth_header).status_code == 400
+  too_many = [{'name': 'りんご', 'quantity': 1}] * 501
+  assert client.post('/api/v1/items/bulk', json=too_many, headers=auth_header).status_code == 400
+  assert client.post('/api/v1/items/bulk', json=[{'name': 'りんご', 'quantity': 1}]).status_code == 401
+
+  with client.application.app_context():
+    assert Item.query.count() == 0
+
+
+def test_bulk_create_uses_single_insert(client):
+  _, auth_header = make_user(client)
+  payload = [{'name': f'食品{i}', 'quantity': 1} for i in range(200)]
+  payload[10]['description'] = '説明あり'  # 列が揃っていない行があっても1文になる
+
+  with count_queries(client.application) as statements:
+    response = client.post('/api/v1/items/bulk', json=payload, headers=auth_header)
+  assert response.status_code == 201
+
+  inserts = [s for s in statements if s.lstrip().upper().startswith('INSERT INTO ITEM ')]
+  assert len(inserts) == 1
+  with client.application.app_context():
+    assert db.session.query(Item).count() == 200
+
+
+def setup_owned_items(client):
+  """自分のアイテム4件（うち2件は期限切れ）と他人のアイテム1件を作る"""
+  today = date.today()
+  with client.application.app_context():
+    me = create_test_user()
+    other = create_test_user(username='other', email='other@example.com')
+    mine = [
+      create_test_item(me, name='期限切れ1', expiration_date=today - timedelta(days=3)).id,
+      create_test_item(me, name='期限切れ2', expiration_date=today - timedelta(days=1)).id,
+      create_test_item(me, name='まだ大丈夫', expiration_date=today + timedelta(days=5)).id,
+      create_test_item(me, name='期限なし').id,
+    ]
+    others = create_test_item(other, name='他人の', expiration_date=today - timedelta(days=3)).id
+    return mine, others, get_auth_header(me.id)
+
+
+def test_bulk_update_by_ids_checks_owner_in_sql(client):
+  mine, others, auth_header = setup_owned_items(client)
+  with count_queries(client.application) as statements:
+    response = client.patch('/api/v1/items/bulk', json={
+      'ids': [mine[0], mine[2], others, 9999], 'changes': {'quantity': 7, 'location': '駅前'}
+    }, headers=auth_header)
+  assert response.status_code == 200
+  data = response.get_json()
+  assert data['ids'] == [mine[0], mine[2]]
+  assert data['skipped_ids'] == sorted([others, 9999])
+
+  updates = [s for s in statements if s.lstrip().upper().startswith('UPDATE')]
+  assert len(updates) == 1
+  assert 'user_id' in updates[0]
+
+  with client.application.app_context():
+    assert db.session.get(Item, mine[0]).quantity == 7
+    assert db.session.get(Item, mine[1]).quantity == 5
+    assert db.session.get(Item, others).quantity == 5
+
+
+def test_bulk_update_rejects_invalid_requests(client):
+  mine, _, auth_header = setup_owned_items(client)
+  for body in [
+    {'ids': mine, 'changes': {'name': '改名'}},      # 食品名は一括では変えられない
+    {'ids': mine, 'changes': {}},
+    {'ids': mine, 'filter': {'expired': True}, 'changes': {'quantity': 1}},
+    {'filter': {}, 'changes': {'quantity': 1}},
+    {'ids': [], 'changes': {'quantity': 1}},
+    {'changes': {'quantity': 0}, 'ids': mine},
+  ]:
+    assert client.patch('/api/v1/items/bulk', json=body, headers=auth_header).status_code == 422
+
+
+def test_bulk_toggle_by_filter(client):
+  mine, others, auth_header = setup_owned_items(client)
+  response = client.post('/api/v1/items/bulk/toggle-availability', json={'filter': {'expired': True}}, headers=auth_header)
+  assert response.status_code == 200
+  data = response.get_json()
+  assert data['items'] == [{'id': mine[0], 'is_available': False}, {'id': mine[1], 'is_available': False}]
+  assert data['skipped_ids'] == []
+
+  response = client.post('/api/v1/items/bulk/toggle-availability', json={'ids': [mine[0], mine[3]]}, headers=auth_header)
+  assert response.get_json()['items'] == [{'id': mine[0], 'is_available': True}, {'id': mine[3], 'is_available': False}]
+
+  with client.application.app_context():
+    assert db.session.get(Item, others).is_available is True
+
+
+def test_bulk_delete_expired(client):
+  mine, others, auth_header = setup_owned_items(client)
+  list_etag = client.get('/api/v1/items/').headers['ETag']
+
+  with count_queries(client.application) as statements:
+    response = client.delete('/api/v1/items/bulk', json={'filter': {'expired': True}}, headers=auth_header)
+  assert response.status_code == 200
+  assert response.get_json()['ids'] == [mine[0], mine[1]]
+  assert len([s for s in statements if s.lstrip().upper().startswith('DELETE FROM ITEM')]) == 1
+
+  with client.application.app_context():
+    assert sorted(item.id for item in Item.query.all()) == sorted([mine[2], mine[3], others])
+  assert client.get('/api/v1/items/').headers['ETag'] != list_etag
+
+  response = client.delete('/api/v1/items/bulk', json={'ids': [others]}, headers=auth_header)
+  assert response.get_json() == {'message': '0件の食品を削除しました', 'ids': [], 'skipped_ids': [others]}
+  assert client.delete('/api/v1/items/bulk', json={'ids': [mine[2]]}).status_code == 401
@@ -0,0 +1,150 @@
+import pytest
+from sharefood import create_app, db
+from sharefood.cache import LRUCache, RedisCache
+from sharefood.config import TestingConfig
+from sharefood.models import Item
+from .helpers import create_test_user, create_test_item, get_auth_header, count_queries
+
+# ----------------------------------------------
+#      <<-- テストの要件 -->>
+
+# 一覧・詳細にETagが付き、If-None-Matchが一致すれば304が返るか
+# キャッシュが効いているときはSQLを発行しないか
+# 作成・更新・削除・出品停止でキャッシュが無効になるか
+# LRUのTTLと容量上限が効くか
+# Redis互換バックエンドでも同じように動くか
+# ----------------------------------------------
+
+class FakeRedis:
+  """テスト用のRedisの代わり（redis-py と同じく値をbytesで返す）"""
+
+  def __init__(self):
+    self.data = {}
+
+  def get(self, key):
+    return self.data.get(key)
+
+  def set(self, key, value, ex=None):
+    self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+
+  def incr(self, key):
+    value = int(self.data.get(key, b'0')) + 1
+    self.data[key] = str(value).encode()
+    return value
+
+
+def make_client(backend):
+  class CacheConfig(TestingConfig):
+    CACHE_BACKEND = backend
+
+  app = create_app(config_class=CacheConfig)
+  with app.app_context():
+    db.create_all()
+  return app.test_client()
+
+
+@pytest.fixture(params=['lru', 'redis'])
+def cached_client(request):
+  backend = 'lru' if request.param == 'lru' else RedisCache(FakeRedis())
+  client = make_client(backend)
+  yield client
+  with client.application.app_context():
+    db.session.remove()
+    db.drop_all()
+
+
+def test_etag_and_not_modified(cached_client):
+  client = cached_client
+  with client.application.app_context():
+    user = create_test_user()
+    item_id = create_test_item(user).id
+
+  for url in ['/api/v1/items/', f'/api/v1/items/{item_id}']:
+    response = client.get(url)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert etag.startswith('"')  # 弱いETag(W/)ではない
+
+    with count_queries(client.application) as statements:
+      response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert statements == []
+
+    with count_queries(client.application) as statements:
+      response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers['ETag'] == etag
+    assert statements == []
+
+
+def test_cache_key_includes_query_string(cached_client):
+  client = cached_client
+  with client.application.app_context():
+    user = create_test_user()
+    create_test_item(user, name="りんご")
+    create_test_item(user, name="みかん")
+
+  assert len(client.get('/api/v1/items/').get_json()['items']) == 2
+  assert len(client.get('/api/v1/items/?limit=1').get_json()['items']) == 1
+
+
+def test_writes_invalidate_cache(cached_client):
+  client = cached_client
+  with client.application.app_context():
+    user = create_test_user()
+    item_id = create_test_item(user, name="りんご").id
+    auth_header = get_auth_header(user.id)
+
+  def list_etag():
+    return client.get('/api/v1/items/').headers['ETag']
+
+  etag = list_etag()
+  client.post('/api/v1/items/', data={"name": "みかん", "quantity": 1}, headers=auth_header)
+  assert list_etag() != etag
+
+  etag = list_etag()
+  detail_etag = client.get(f'/api/v1/items/{item_id}').headers['ETag']
+  client.put(f'/api/v1/items/{item_id}', json={"name": "青りんご"}, headers=auth_header)
+  assert list_etag() != etag
+  response = client.get(f'/api/v1/items/{item_id}', headers={'If-None-Match': detail_etag})
+  assert response.status_code == 200
+  assert response.get_json()['item']['name'] == "青りんご"
+
+  etag = list_etag()
+  client.post(f'/api/v1/items/{item_id}/toggle-availability', headers=auth_header)
+  assert list_etag() != etag
+
+  etag = list_etag()
+  client.delete(f'/api/v1/items/{item_id}', headers=auth_header)
+  assert list_etag() != etag
+  assert client.get(f'/api/v1/items/{item_id}').status_code == 404
+
+
+def test_direct_orm_changes_invalidate_cache(cached_client):
+  client = cached_client
+  with client.application.app_context():
+    user = create_test_user()
+    item_id = create_test_item(user, name="りんご").id
+
+  assert client.get(f'/api/v1/items/{item_id}').get_json()['item']['name'] == "りんご"
+  with client.application.app_context():
+    db.session.get(Item, item_id).name = "なし"
+    db.session.commit()
+  assert client.get(f'/api/v1/items/{item_id}').get_json()['item']['name'] == "なし"
+
+
+def test_lru_cache_ttl_and_capacity():
+  now = [0.0]
+  cache = LRUCache(max_entries=2, clock=lambda: now[0])
+  cache.set('a', b'1', ttl=10)
+  cache.set('b', b'2', ttl=10)
+  assert cache.get('a') == b'1'   # aを使ったので、次に追い出されるのはb
+  cache.set('c', b'3', ttl=10)
+  assert cache.get('b') is None
+  assert cache.get('a') == b'1'
+
+  now[0] = 11
+  assert cache.get('a') is None
+  # 世代番号は容量上限やTTLで消えない
+  assert cache.incr('items:generation') == 1
+  assert cache.get_counter('items:generation') == 1
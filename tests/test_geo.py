@@ -0,0 +1,176 @@
+import pytest
+from sharefood import db
+from sharefood.routes import item_route
+from sharefood.models import Item
+from sharefood.geo import bounding_box, haversine_km
+from .helpers import create_test_user, create_test_item, get_auth_header
+
+# ----------------------------------------------
+#      <<-- テストの要件 -->>
+
+# ハバーサイン距離と検索矩形が正しく計算されるか
+# 半径内のアイテムだけが距離順に返るか
+# 近い順のIDを取った後に削除・出品停止されたアイテムは、エラーにならず結果から除かれるか
+# 位置情報の更新・削除が空間インデックスに反映されるか
+# パラメータが不正なら400が返るか
+# ----------------------------------------------
+
+# 東京駅を中心にした座標
+TOKYO = (35.681236, 139.767125)
+SHINJUKU = (35.690921, 139.700258)   # 約6.1km
+YOKOHAMA = (35.465798, 139.622314)   # 約27km
+OSAKA = (34.702485, 135.495951)      # 約400km
+
+
+def test_haversine_km():
+  assert haversine_km(*TOKYO, *TOKYO) == 0
+  assert haversine_km(*TOKYO, *OSAKA) == pytest.approx(403, abs=2)
+
+
+def test_bounding_box_contains_circle():
+  south, north, lng_ranges = bounding_box(*TOKYO, 10)
+  assert south < TOKYO[0] < north
+  assert len(lng_ranges) == 1
+  # 日付変更線をまたぐと経度の範囲が2つに分かれる
+  _, _, lng_ranges = bounding_box(0, 179.99, 10)
+  assert len(lng_ranges) == 2
+
+
+def test_get_nearby_items(client):
+  with client.application.app_context():
+    user = create_test_user()
+    create_test_item(user, name="新宿", latitude=SHINJUKU[0], longitude=SHINJUKU[1])
+    create_test_item(user, name="横浜", latitude=YOKOHAMA[0], longitude=YOKOHAMA[1])
+    create_test_item(user, name="大阪", latitude=OSAKA[0], longitude=OSAKA[1])
+    create_test_item(user, name="東京", latitude=TOKYO[0], longitude=TOKYO[1])
+    create_test_item(user, name="位置なし")
+    stopped = create_test_item(user, name="停止中", latitude=TOKYO[0], longitude=TOKYO[1])
+    stopped.is_available = False
+    db.session.commit()
+
+  response = client.get(f'/api/v1/items/nearby?lat={TOKYO[0]}&lng={TOKYO[1]}&radius_km=30')
+  data = response.get_json()
+  assert response.status_code == 200
+  assert [item['name'] for item in data['items']] == ["東京", "新宿", "横浜"]
+  assert data['items'][0]['distance_km'] == 0
+  assert data['items'][1]['distance_km'] == pytest.approx(6.1, abs=0.2)
+
+  response = client.get(f'/api/v1/items/nearby?lat={TOKYO[0]}&lng={TOKYO[1]}&radius_km=10&limit=1')
+  assert [item['name'] for item in response.get_json()['items']] == ["東京"]
+
+
+def test_nearby_skips_items_changed_between_queries(client, monkeypatch):
+  with client.application.app_context():
+    user = create_test_user()
+    ids = [
+      create_test_item(user, name=name, latitude=point[0], longitude=point[1]).id
+      for name, point in [("東京", TOKYO), ("新宿", SHINJUKU), ("横浜", YOKOHAMA)]
+    ]
+
+  find_nearby = item_route.find_nearby
+  def find_then_change(*args, **kwargs):
+    # 近い順のIDを取った直後に、別のリクエストで削除・出品停止されたことにする
+    hits = find_nearby(*args, **kwargs)
+    db.session.execute(db.delete(Item).where(Item.id == ids[0]))
+    db.session.execute(db.update(Item).where(Item.id == ids[1]).values(is_available=False))
+    db.session.commit()
+    return hits
+  monkeypatch.setattr(item_route, 'find_nearby', find_then_change)
+
+  response = client.get(f'/api/v1/items/nearby?lat={TOKYO[0]}&lng={TOKYO[1]}&radius_km=30')
+  assert response.status_code == 200
+  assert [item['name'] for item in response.get_json()['items']] == ["横浜"]
+
+
+def test_nearby_index_stays_in_sync(client):
+  with client.application.app_context():
+    user = create_test_user()
+    item = create_test_item(user, name="移動", latitude=OSAKA[0], longitude=OSAKA[1])
+    auth_header = get_auth_header(user.id)
+    item_id = item.id
+
+  url = f'/api/v1/items/nearby?lat={TOKYO[0]}&lng={TOKYO[1]}&radius_km=5'
+  assert client.get(url).get_json()['items'] == []
+
+  with client.application.app_context():
+    item = db.session.get(Item, item_id)
+    item.latitude, item.longitude = TOKYO
+    db.session.commit()
+  assert [item['name'] for item in client.get(url).get_json()['items']] == ["移動"]
+
+  client.delete(f'/api/v1/items/{item_id}', headers=auth_header)
+  assert client.get(url).get_json()['items'] == []
+  with client.application.app_context():
+    assert db.session.execute(db.text("SELECT count(*) FROM item_geo")).scalar() == 0
+
+
+@pytest.mark.parametrize('query', [
+  'lng=139.7',
+  'lat=abc&lng=139.7',
+  'lat=95&lng=139.7',
+  'lat=35.6&lng=139.7&radius_km=0',
+  'lat=35.6&lng=139.7&radius_km=500',
+])
+def test_get_nearby_items_invalid_params(client, query):
+  response = client.get(f'/api/v1/items/nearby?{query}')
+  assert response.status_code == 400
+
+
+def test_get_map_clusters_at_low_zoom(client):
+  with client.application.app_context():
+    user = create_test_user()
+    for _ in range(3):
+      create_test_item(user, latitude=TOKYO[0], longitude=TOKYO[1])
+    create_test_item(user, latitude=SHINJUKU[0], longitude=SHINJUKU[1])
+    create_test_item(user, latitude=OSAKA[0], longitude=OSAKA[1])
+
+  # 関東だけを表示（大阪は範囲外）
+  viewport = 'south=35.0&west=139.0&north=36.5&east=140.5'
+  response = client.get(f'/api/v1/items/map?{viewport}&zoom=5')
+  data = response.get_json()
+  assert response.status_code == 200
+  assert data['items'] == []
+  # ズーム5では東京と新宿は同じセルにまとまる
+  assert len(data['clusters']) == 1
+  cluster = data['clusters'][0]
+  assert cluster['count'] == 4
+  assert cluster['latitude'] == pytest.approx((TOKYO[0] * 3 + SHINJUKU[0]) / 4)
+
+  # ズーム12では別々のセルになる
+  data = client.get(f'/api/v1/items/map?{viewport}&zoom=12').get_json()
+  assert sorted(cluster['count'] for cluster in data['clusters']) == [1, 3]
+
+
+def test_get_map_items_at_high_zoom(client):
+  with client.application.app_context():
+    user = create_test_user()
+    create_test_item(user, name="東京", latitude=TOKYO[0], longitude=TOKYO[1])
+    create_test_item(user, name="新宿", latitude=SHINJUKU[0], longitude=SHINJUKU[1])
+
+  response = client.get('/api/v1/items/map?south=35.67&west=139.75&north=35.69&east=139.78&zoom=16')
+  data = response.get_json()
+  assert data['clusters'] == []
+  assert [item['name'] for item in data['items']] == ["東京"]
+  assert data['truncated'] is False
+
+
+def test_get_map_crossing_date_line(client):
+  with client.application.app_context():
+    user = create_test_user()
+    create_test_item(user, latitude=0, longitude=179.5)
+    create_test_item(user, latitude=0, longitude=-179.5)
+    create_test_item(user, latitude=0, longitude=0)
+
+  data = client.get('/api/v1/items/map?south=-1&west=179&north=1&east=-179&zoom=3').get_json()
+  assert sum(cluster['count'] for cluster in data['clusters']) == 2
+
+
+@pytest.mark.parametrize('query', [
+  'south=35&west=139&north=36&east=140',
+  'south=36&west=139&north=35&east=140&zoom=5',
+  'south=35&west=139&north=36&east=140&zoom=30',
+  'south=35&west=139&north=36&east=140&zoom=x',
+])
+def test_get_map_invalid_params(client, query):
+  response = client.get(f'/api/v1/items/map?{query}')
+  assert response.status_code == 400
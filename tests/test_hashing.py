@@ -0,0 +1,122 @@
+import json
+import threading
+import bcrypt
+from sharefood import create_app, db, password_hasher
+from sharefood.config import TestingConfig
+from sharefood.hashing import HashingBusyError, hash_cost
+from sharefood.models import User
+from .helpers import create_test_user
+
+# ----------------------------------------------
+#      <<-- テストの要件 -->>
+
+# 設定したcostでハッシュ化されるか
+# costの違う既存ハッシュでもログインでき、ログイン成功時に新しいcostでハッシュし直されるか
+# ログインに失敗したときはハッシュし直さないか
+# ハッシュし直す計算が混み合っていても、正しいパスワードならログインでき、次回にハッシュし直されるか
+# ハッシュ計算の待ちがいっぱいのとき、/login と /register が503とRetry-Afterを返すか
+# ----------------------------------------------
+
+def login(client, password='password'):
+  return client.post(
+    '/api/v1/login',
+    data=json.dumps({'email_address': 'test@example.com', 'password': password}),
+    content_type='application/json'
+  )
+
+
+def test_hash_uses_configured_cost(client):
+  with client.application.app_context():
+    user = create_test_user()
+    assert hash_cost(user.password_hash) == TestingConfig.BCRYPT_LOG_ROUNDS
+    assert user.check_password('password')
+    assert not user.check_password('wrong')
+
+
+def test_login_rehashes_when_cost_differs(client):
+  with client.application.app_context():
+    user = create_test_user()
+    user.password_hash = bcrypt.hashpw(b'password', bcrypt.gensalt(5)).decode('utf-8')
+    db.session.commit()
+    user_id = user.id
+
+  assert login(client, 'wrong').status_code == 401
+  with client.application.app_context():
+    assert hash_cost(db.session.get(User, user_id).password_hash) == 5
+
+  assert login(client).status_code == 200
+  with client.application.app_context():
+    password_hash = db.session.get(User, user_id).password_hash
+    assert hash_cost(password_hash) == TestingConfig.BCRYPT_LOG_ROUNDS
+    assert bcrypt.checkpw(b'password', password_hash.encode('utf-8'))
+
+
+def test_login_succeeds_when_rehash_is_busy(client, monkeypatch):
+  with client.application.app_context():
+    user = create_test_user()
+    user.password_hash = bcrypt.hashpw(b'password', bcrypt.gensalt(5)).decode('utf-8')
+    db.session.commit()
+    user_id = user.id
+
+  def busy_hash(password):
+    raise HashingBusyError(1)
+  # 照合は通り、ハッシュし直す計算だけが混み合っている
+  with monkeypatch.context() as patch:
+    patch.setattr(password_hasher, 'hash', busy_hash)
+    assert login(client).status_code == 200
+  with client.application.app_context():
+    assert hash_cost(db.session.get(User, user_id).password_hash) == 5
+
+  assert login(client).status_code == 200
+  with client.application.app_context():
+    assert hash_cost(db.session.get(User, user_id).password_hash) == TestingConfig.BCRYPT_LOG_ROUNDS
+
+
+def test_busy_hasher_returns_503():
+  class BusyConfig(TestingConfig):
+    PASSWORD_HASH_WORKERS = 1
+    PASSWORD_HASH_QUEUE_SIZE = 0
+    PASSWORD_HASH_RETRY_AFTER = 3
+
+  app = create_app(config_class=BusyConfig)
+  client = app.test_client()
+  with app.app_context():
+    db.create_all()
+    create_test_user()
+
+  # 唯一のワーカーを塞いでおく
+  release = threading.Event()
+  started = threading.Event()
+
+  def block():
+    started.set()
+    release.wait(5)
+
+  def occupy():
+    with app.app_context():
+      password_hasher.run(block)
+
+  blocker = threading.Thread(target=occupy)
+  blocker.start()
+  started.wait(5)
+  try:
+    response = login(client)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '3'
+
+    response = client.post(
+      '/api/v1/register',
+      data=json.dumps({'username': 'newuser', 'email_address': 'new@example.com', 'password': 'Password123'}),
+      content_type='application/json'
+    )
+    assert response.status_code == 503
+  finally:
+    release.set()
+    blocker.join()
+
+  # 空けば通常どおり処理される
+  assert login(client).status_code == 200
+  with app.app_context():
+    assert User.query.filter_by(email_address='new@example.com').first() is None
+    db.session.remove()
+    db.drop_all()
@@ -0,0 +1,106 @@
+import io
+import os
+from PIL import Image
+from sharefood import image_pipeline
+from .helpers import GPS_TAG, ORIENTATION_TAG, make_jpeg, make_png, post_item, stored_name
+
+# ----------------------------------------------
+#      <<-- テストの要件 -->>
+
+# 画像付きで出品すると、EXIFを除いた元画像と、幅ごとのJPEG・WebPの縮小版が作られるか
+# EXIFの回転情報どおりに向きが直るか
+# レスポンスに縮小版のURLが含まれるか
+# 拡張子だけ画像に見せかけたファイルや、大きすぎるファイルが弾かれるか
+# /upload でも同じ処理が行われるか
+# ----------------------------------------------
+
+def test_upload_strips_exif_and_creates_variants(image_client):
+  client, auth_header = image_client
+  # 回転情報6（時計回りに90度）なので、正しい向きは縦長になる
+  data = make_jpeg(800, 600, orientation=6)
+  stem = stored_name(data, 'jpg')
+  response = post_item(client, auth_header, data, 'photo.jpeg')
+  assert response.status_code == 201
+  item = response.get_json()['item']
+  assert item['image_url'].endswith(f'/uploads/{stem}.jpg')
+  assert [variant['width'] for variant in item['image_variants']] == [160, 480]
+  assert item['image_variants'][0]['url'].endswith(f'/uploads/{stem}_w160.jpg')
+  assert item['image_variants'][0]['webp_url'].endswith(f'/uploads/{stem}_w160.webp')
+
+  app = client.application
+  with app.app_context():
+    image_pipeline.wait(timeout=10)
+  upload_folder = app.config['UPLOAD_FOLDER']
+  assert os.listdir(app.config['IMAGE_SPOOL_FOLDER']) == []
+
+  with Image.open(os.path.join(upload_folder, f'{stem}.jpg')) as original:
+    assert original.size == (600, 800)
+    assert GPS_TAG not in original.getexif()
+    assert ORIENTATION_TAG not in original.getexif()
+
+  for width in (160, 480):
+    with Image.open(os.path.join(upload_folder, f'{stem}_w{width}.jpg')) as variant:
+      assert variant.format == 'JPEG'
+      assert variant.width == width
+      assert len(variant.getexif()) == 0
+    with Image.open(os.path.join(upload_folder, f'{stem}_w{width}.webp')) as variant:
+      assert variant.format == 'WEBP'
+      assert variant.width == width
+
+  # 一覧でも同じ縮小版のURLが返る
+  listed = client.get('/api/v1/items/').get_json()['items'][0]
+  assert listed['image_variants'] == item['image_variants']
+
+
+def test_extension_follows_content(image_client):
+  client, auth_header = image_client
+  # 中身はPNGなので、拡張子は .png で保存される
+  data = make_png()
+  stem = stored_name(data, 'png')
+  response = post_item(client, auth_header, data, 'picture.jpg')
+  assert response.status_code == 201
+  assert response.get_json()['item']['image_url'].endswith(f'/uploads/{stem}.png')
+
+  with client.application.app_context():
+    image_pipeline.wait(timeout=10)
+  # 元より大きい幅には拡大しない
+  with Image.open(os.path.join(client.application.config['UPLOAD_FOLDER'], f'{stem}_w480.webp')) as variant:
+    assert variant.width == 300
+
+
+def test_rejects_fake_and_oversized_images(image_client):
+  client, auth_header = image_client
+  response = post_item(client, auth_header, b'<?php echo "hello"; ?>', 'evil.jpg')
+  assert response.status_code == 422
+  assert 'image' in response.get_json()['errors']
+
+  response = post_item(client, auth_header, make_jpeg() + b'\0' * (200 * 1024), 'big.jpg')
+  assert response.status_code == 413
+
+  assert client.get('/api/v1/items/').get_json()['items'] == []
+
+
+def test_upload_route_uses_pipeline(image_client):
+  client, _ = image_client
+  jpeg, png = make_jpeg(), make_png()
+  response = client.post(
+    '/api/v1/upload',
+    data={'images': [(io.BytesIO(jpeg), 'a.jpg'), (io.BytesIO(png), 'b.png')]},
+    content_type='multipart/form-data'
+  )
+  assert response.status_code == 200
+  jpeg_stem, png_stem = stored_name(jpeg, 'jpg'), stored_name(png, 'png')
+  assert response.get_json()['files'] == [f'{jpeg_stem}.jpg', f'{png_stem}.png']
+
+  with client.application.app_context():
+    image_pipeline.wait(timeout=10)
+  upload_folder = client.application.config['UPLOAD_FOLDER']
+  for name in [f'{jpeg_stem}.jpg', f'{jpeg_stem}_w160.webp', f'{png_stem}.png', f'{png_stem}_w480.jpg']:
+    assert os.path.isfile(os.path.join(upload_folder, name))
+
+  response = client.post(
+    '/api/v1/upload',
+    data={'images': [(io.BytesIO(b'not an image'), 'c.gif')]},
+    content_type='multipart/form-data'
+  )
+  assert response.status_code == 400
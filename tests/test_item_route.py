@@ -1,5 +1,7 @@
-from sharefood import db
-from .helpers import create_test_user, get_auth_header, create_test_item
+import threading
+from sharefood import bulk, create_app, db
+from sharefood.config import TestingConfig
+from .helpers import create_test_user, get_auth_header, create_test_item, count_queries
 from sharefood.models import Item
 
 # --- POST /items のテスト ---
@@ -90,6 +92,108 @@ def test_get_items(client):
   assert "みかん" in names
 
 
+def test_get_items_pagination(client):
+  with client.application.app_context():
+    user = create_test_user()
+    for i in range(5):
+      create_test_item(user, name=f"商品{i}")
+
+  # 1ページ目（新しい順・同時刻ならid降順）
+  response = client.get('/api/v1/items/?limit=2')
+  data = response.get_json()
+  assert response.status_code == 200
+  assert [item['name'] for item in data['items']] == ["商品4", "商品3"]
+  assert data['next_cursor'] is not None
+
+  # next_cursorを渡すと続きが取得できる
+  seen = [item['name'] for item in data['items']]
+  cursor = data['next_cursor']
+  for _ in range(5): # カーソルが進まない不具合で無限ループにならないよう回数を制限
+    if not cursor:
+      break
+    data = client.get(f'/api/v1/items/?limit=2&cursor={cursor}').get_json()
+    seen += [item['name'] for item in data['items']]
+    cursor = data['next_cursor']
+  assert seen == ["商品4", "商品3", "商品2", "商品1", "商品0"]
+
+
+def test_get_items_pagination_with_filters(client):
+  with client.application.app_context():
+    user = create_test_user()
+    for i in range(4):
+      item = create_test_item(user, name=f"りんご{i}")
+      item.is_available = i % 2 == 0
+    create_test_item(user, name="バナナ")
+    db.session.commit()
+
+  response = client.get('/api/v1/items/?name=りんご&is_available=true&limit=1')
+  data = response.get_json()
+  assert [item['name'] for item in data['items']] == ["りんご2"]
+
+  response = client.get(f"/api/v1/items/?name=りんご&is_available=true&limit=1&cursor={data['next_cursor']}")
+  data = response.get_json()
+  assert [item['name'] for item in data['items']] == ["りんご0"]
+  assert data['next_cursor'] is None
+
+
+def test_get_items_invalid_cursor(client):
+  response = client.get('/api/v1/items/?cursor=invalid')
+  assert response.status_code == 400
+
+  response = client.get('/api/v1/items/?limit=0')
+  assert response.status_code == 400
+
+
+def test_get_items_query_count_is_constant(client):
+  """一覧取得のSQL発行数がアイテム件数に比例しない（N+1が起きていない）ことを確認"""
+  app = client.application
+  with app.app_context():
+    for i in range(3):
+      user = create_test_user(f"user{i}", f"user{i}@example.com")
+      create_test_item(user)
+
+  with count_queries(app) as few:
+    response = client.get('/api/v1/items/')
+  assert len(response.get_json()['items']) == 3
+
+  with app.app_context():
+    for i in range(3, 10):
+      user = create_test_user(f"user{i}", f"user{i}@example.com")
+      create_test_item(user)
+
+  with count_queries(app) as many:
+    response = client.get('/api/v1/items/')
+  assert len(response.get_json()['items']) == 10
+  assert len(many) == len(few) == 1
+
+
+def test_item_detail_and_write_query_count(client):
+  """詳細・作成・更新のレスポンスでも出品者の追加SELECTが発生しないことを確認"""
+  app = client.application
+  with app.app_context():
+    user = create_test_user()
+    item = create_test_item(user)
+    auth_header = get_auth_header(user.id)
+    item_id = item.id
+
+  with count_queries(app) as statements:
+    response = client.get(f'/api/v1/items/{item_id}')
+  assert response.get_json()['item']['user']['username'] == "testuser"
+  assert len(statements) == 1
+
+  # 認証ユーザーの読み込みはワーカー内でキャッシュされる（user_cache.py）ので、先に1回認証しておく
+  client.get('/api/v1/me', headers=auth_header)
+  with count_queries(app) as statements:
+    response = client.post('/api/v1/items/', data={"name": "リンゴ", "quantity": 1}, headers=auth_header)
+  assert response.get_json()['item']['user']['username'] == "testuser"
+  assert not [sql for sql in statements if sql.lstrip().startswith('SELECT user.')]
+
+  with count_queries(app) as statements:
+    response = client.put(f'/api/v1/items/{item_id}', json={"name": "更新"}, headers=auth_header)
+  assert response.get_json()['item']['user']['username'] == "testuser"
+  assert not [sql for sql in statements if sql.lstrip().startswith('SELECT user.')]
+
+
 # --- PUT /items/<id> のテスト ---
 def test_update_item_success(client):
   with client.application.app_context():
@@ -160,3 +264,107 @@ def test_delete_item_not_found(client):
 
   response = client.delete('/api/v1/items/99999', headers=auth_header)
   assert response.status_code == 404
+
+
+
+def test_delete_item_is_single_statement(client):
+  """読み込まずに、所有者の条件付きのDELETE文1つで削除することを確認"""
+  with client.application.app_context():
+    user = create_test_user()
+    item_id = create_test_item(user).id
+    auth_header = get_auth_header(user.id)
+
+  with count_queries(client.application) as statements:
+    response = client.delete(f'/api/v1/items/{item_id}', headers=auth_header)
+  assert response.status_code == 200
+  assert not [sql for sql in statements if sql.lstrip().startswith('SELECT') and 'FROM item' in sql]
+  deletes = [sql for sql in statements if sql.lstrip().startswith('DELETE FROM item')]
+  assert len(deletes) == 1 and 'user_id' in deletes[0]
+
+
+# --- POST /items/<id>/toggle-availability のテスト ---
+def test_toggle_availability(client):
+  with client.application.app_context():
+    owner = create_test_user("owner", "owner@test.com")
+    other = create_test_user("other", "other@test.com")
+    item_id = create_test_item(owner).id
+    auth_header = get_auth_header(owner.id)
+    other_header = get_auth_header(other.id)
+
+  with count_queries(client.application) as statements:
+    response = client.post(f'/api/v1/items/{item_id}/toggle-availability', headers=auth_header)
+  assert response.get_json() == {'success': True, 'is_available': False}
+  assert not [sql for sql in statements if sql.lstrip().startswith('SELECT') and 'FROM item' in sql]
+  assert len([sql for sql in statements if sql.lstrip().startswith('UPDATE item')]) == 1
+
+  response = client.post(f'/api/v1/items/{item_id}/toggle-availability', headers=auth_header)
+  assert response.get_json()['is_available'] is True
+
+  # 他人のアイテム・存在しないアイテムは404
+  assert client.post(f'/api/v1/items/{item_id}/toggle-availability', headers=other_header).status_code == 404
+  assert client.post('/api/v1/items/99999/toggle-availability', headers=auth_header).status_code == 404
+  with client.application.app_context():
+    assert db.session.get(Item, item_id).is_available is True
+
+
+def test_toggle_and_delete_without_returning(client, monkeypatch):
+  """RETURNINGが使えないDBでも同じ結果になることを確認"""
+  monkeypatch.setattr(bulk, 'supports_returning', lambda kind: False)
+  with client.application.app_context():
+    owner = create_test_user("owner", "owner@test.com")
+    other = create_test_user("other", "other@test.com")
+    item_id = create_test_item(owner).id
+    auth_header = get_auth_header(owner.id)
+    other_header = get_auth_header(other.id)
+
+  response = client.post(f'/api/v1/items/{item_id}/toggle-availability', headers=auth_header)
+  assert response.get_json() == {'success': True, 'is_available': False}
+  assert client.post(f'/api/v1/items/{item_id}/toggle-availability', headers=other_header).status_code == 404
+
+  assert client.delete(f'/api/v1/items/{item_id}', headers=other_header).status_code == 403
+  assert client.delete(f'/api/v1/items/{item_id}', headers=auth_header).status_code == 200
+  assert client.delete(f'/api/v1/items/{item_id}', headers=auth_header).status_code == 404
+
+
+def test_concurrent_toggles_are_not_lost(tmp_path):
+  """
+  複数スレッドから同じアイテムを同時に切り替えても、変更が失われないことを確認
+  切り替えがDB上で1つずつ順番に適用されていれば、返ってくる値は False, True, False, ... と交互になるので、
+  偶数回切り替えたあとは元の状態に戻り、False と True を返した回数も同じになる
+  """
+  class FileDBConfig(TestingConfig):
+    SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'toggle.db'}"
+
+  app = create_app(config_class=FileDBConfig)
+  with app.app_context():
+    db.create_all()
+    user = create_test_user()
+    item_id = create_test_item(user).id
+    auth_header = get_auth_header(user.id)
+
+  threads_count, toggles_per_thread = 8, 25
+  results, errors = [], []
+  start = threading.Barrier(threads_count)
+
+  def hammer():
+    client = app.test_client()
+    start.wait()
+    for _ in range(toggles_per_thread):
+      response = client.post(f'/api/v1/items/{item_id}/toggle-availability', headers=auth_header)
+      if response.status_code == 200:
+        results.append(response.get_json()['is_available'])
+      else:
+        errors.append(response.status_code)
+
+  threads = [threading.Thread(target=hammer) for _ in range(threads_count)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+  assert errors == []
+  assert len(results) == threads_count * toggles_per_thread
+  assert results.count(True) == results.count(False)
+  with app.app_context():
+    assert db.session.get(Item, item_id).is_available is True
+    db.engine.dispose()
@@ -0,0 +1,95 @@
+import logging
+import pytest
+from flask import jsonify
+from sharefood import create_app, db
+from sharefood.config import TestingConfig
+from sharefood.lazy_loads import NPlusOneError, lazy_loads
+from sharefood.models import Item
+from sharefood.schemas import items_schema
+from .helpers import create_test_user, create_test_item
+
+# ----------------------------------------------
+#      <<-- テストの要件 -->>
+
+# リクエストの中の遅延ロードが数えられ、同じリレーションの繰り返しで NPlusOneError になるか（TestingConfig）
+# LAZY_LOAD_RAISE が偽なら、起きた場所と一緒にWARNINGが出るだけでレスポンスは返るか
+# 1回だけの遅延ロードや、joinedloadで前もって読み込んだ場合は問題にならないか
+# リクエストの外（テストのコードなど）の遅延ロードは対象外か
+# ----------------------------------------------
+
+def make_app(**config):
+  app = create_app(config_class=type('LazyLoadConfig', (TestingConfig,), config))
+
+  # ItemSchema の Nested(user) で出品者を遅延ロードする（N+1になる）ルート
+  @app.route('/test/items-n-plus-one')
+  def items_n_plus_one():
+    items = items_schema.dump(Item.query.order_by(Item.id).all())
+    return jsonify({'items': items, 'lazy_loads': lazy_loads()})
+
+  @app.route('/test/items-joined')
+  def items_joined():
+    query = Item.query.options(db.joinedload(Item.user)).order_by(Item.id)
+    return jsonify({'items': items_schema.dump(query.all()), 'lazy_loads': lazy_loads()})
+
+  with app.app_context():
+    db.create_all()
+  return app
+
+def add_items(app, count):
+  with app.app_context():
+    for i in range(count):
+      create_test_item(create_test_user(f'user{i}', f'user{i}@example.com'))
+
+
+def test_n_plus_one_raises_under_testing_config():
+  app = make_app()
+  add_items(app, 3)
+  with pytest.raises(NPlusOneError, match='Item.user'):
+    app.test_client().get('/test/items-n-plus-one')
+
+
+def test_warning_only_when_raise_is_disabled(caplog):
+  app = make_app(LAZY_LOAD_RAISE=False)
+  add_items(app, 3)
+  with caplog.at_level(logging.WARNING, logger=app.logger.name):
+    response = app.test_client().get('/test/items-n-plus-one')
+
+  assert response.status_code == 200
+  assert response.get_json()['lazy_loads'] == {'Item.user': 3}
+  warnings = [record.getMessage() for record in caplog.records if 'N+1' in record.getMessage()]
+  # 閾値に達したときに1回だけ、ルートと起きた場所を出す
+  assert len(warnings) == 1
+  assert 'Item.user' in warnings[0] and 'items_n_plus_one' in warnings[0]
+  assert 'tests/test_lazy_loads.py' in warnings[0]
+
+
+def test_single_and_eager_loads_are_allowed():
+  app = make_app()
+  add_items(app, 1)
+  client = app.test_client()
+  assert client.get('/test/items-n-plus-one').get_json()['lazy_loads'] == {'Item.user': 1}
+
+  app = make_app()
+  add_items(app, 5)
+  response = app.test_client().get('/test/items-joined')
+  assert response.status_code == 200
+  assert response.get_json()['lazy_loads'] == {}
+
+
+def test_threshold_and_disabled_detection():
+  app = make_app(LAZY_LOAD_THRESHOLD=4)
+  add_items(app, 3)
+  assert app.test_client().get('/test/items-n-plus-one').status_code == 200
+
+  app = make_app(LAZY_LOAD_DETECTION=False)
+  add_items(app, 3)
+  response = app.test_client().get('/test/items-n-plus-one')
+  assert response.status_code == 200 and response.get_json()['lazy_loads'] == {}
+
+
+def test_loads_outside_requests_are_ignored(client):
+  app = client.application
+  add_items(app, 3)
+  client.get('/api/v1/items/')
+  # テストクライアントが残したリクエストコンテキストの中でも、リクエストの処理は終わっているので数えない
+  assert [item.user.username for item in Item.query.order_by(Item.id)] == ['user0', 'user1', 'user2']
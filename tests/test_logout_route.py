@@ -1,3 +1,4 @@
+from flask_jwt_extended import create_refresh_token
 from .helpers import create_test_user, get_auth_header
 
 # ----------------------------------------------
@@ -6,6 +7,8 @@ from .helpers import create_test_user, get_auth_header
 # 正常にログアウト出来たら200が返ってくるか
 # トークン無しだと拒否されるか
 # 無効なトークンだと拒否されるか
+# ログアウトしたトークンは、有効期限内でも使えなくなるか（他のトークンは使えるか）
+# リフレッシュトークンも渡せば一緒に無効になるか（他人のものは受け付けないか）
 # ----------------------------------------------
   
 def test_logout_success(client):
@@ -36,4 +39,40 @@ def test_logout_with_invalid_token(client):
   )
   data = response.get_json()
   assert response.status_code == 422
-  assert data['message'] == '無効な認証トークンです'
\ No newline at end of file
+  assert data['message'] == '無効な認証トークンです'
+
+def test_logged_out_token_is_rejected(client):
+  """ログアウトしたアクセストークンは使えなくなり、同じユーザーの別のトークンは使えることをテスト"""
+  with client.application.app_context():
+    user = create_test_user()
+    auth_header = get_auth_header(user.id)
+    other_header = get_auth_header(user.id)
+
+  assert client.get('/api/v1/me', headers=auth_header).status_code == 200
+  assert client.post('/api/v1/logout', headers=auth_header).status_code == 200
+
+  response = client.get('/api/v1/me', headers=auth_header)
+  assert response.status_code == 401
+  assert response.get_json()['message'] == 'このトークンは無効になっています。もう一度ログインしてください'
+  assert client.post('/api/v1/logout', headers=auth_header).status_code == 401
+  assert client.get('/api/v1/me', headers=other_header).status_code == 200
+
+def test_logout_revokes_refresh_token(client):
+  """リフレッシュトークンを渡すと、リフレッシュもできなくなることをテスト"""
+  with client.application.app_context():
+    user = create_test_user()
+    other = create_test_user('other', 'other@example.com')
+    auth_header = get_auth_header(user.id)
+    refresh_token = create_refresh_token(identity=str(user.id))
+    others_refresh_token = create_refresh_token(identity=str(other.id))
+
+  # 他人のリフレッシュトークンや壊れたトークンは受け付けない（アクセストークンも無効にしない）
+  response = client.post('/api/v1/logout', json={'refresh_token': others_refresh_token}, headers=auth_header)
+  assert response.status_code == 422
+  response = client.post('/api/v1/logout', json={'refresh_token': 'broken'}, headers=auth_header)
+  assert response.status_code == 422
+
+  response = client.post('/api/v1/logout', json={'refresh_token': refresh_token}, headers=auth_header)
+  assert response.status_code == 200
+  assert client.post('/api/v1/refresh', headers={'Authorization': f'Bearer {refresh_token}'}).status_code == 401
+  assert client.post('/api/v1/refresh', headers={'Authorization': f'Bearer {others_refresh_token}'}).status_code == 200
@@ -0,0 +1,150 @@
+import json
+import time
+from datetime import timedelta
+import pytest
+from sharefood import create_app, db
+from sharefood.config import TestingConfig
+from sharefood.mail_outbox import dispatch_all, dispatch_pending, enqueue_mail, DEAD, PENDING, SENT
+from sharefood.models import MailOutbox
+from .helpers import LocalSMTPServer
+
+# ----------------------------------------------
+#      <<-- テストの要件 -->>
+
+# /register はメールを送らず送信箱に追加するだけか
+# MAIL_OUTBOX_AUTOSTART なら、Webのプロセスが最初のリクエストで送信スレッドを動かし、登録確認メールが届くか（CLIでは動かないか）
+# 送信処理が1本のSMTP接続でまとめて送るか
+# 失敗したメールが指数バックオフで再送され、上限回数でdeadになるか
+# SMTPサーバーに接続できないときに全件が再送待ちになるか
+# ----------------------------------------------
+
+def make_app(port, autostart=False, database_uri=TestingConfig.SQLALCHEMY_DATABASE_URI):
+  class SMTPConfig(TestingConfig):
+    SQLALCHEMY_DATABASE_URI = database_uri
+    MAIL_OUTBOX_AUTOSTART = autostart
+    MAIL_OUTBOX_POLL_INTERVAL = 0.05
+    MAIL_SUPPRESS_SEND = False
+    MAIL_SERVER = '127.0.0.1'
+    MAIL_PORT = port
+    MAIL_USE_TLS = False
+    MAIL_USERNAME = None
+    MAIL_PASSWORD = None
+    MAIL_OUTBOX_BATCH_SIZE = 10
+    MAIL_OUTBOX_MAX_ATTEMPTS = 3
+    MAIL_OUTBOX_RETRY_BASE_SECONDS = 60
+
+  app = create_app(config_class=SMTPConfig)
+  with app.app_context():
+    db.create_all()
+  return app
+
+
+@pytest.fixture
+def smtp_server():
+  with LocalSMTPServer(reject={'busy@example.com'}) as server:
+    yield server
+
+
+def test_register_only_enqueues(client):
+  response = client.post(
+    '/api/v1/register',
+    data=json.dumps({'username': 'newuser', 'email_address': 'new@example.com', 'password': 'Password123'}),
+    content_type='application/json'
+  )
+  assert response.status_code == 201
+  with client.application.app_context():
+    outbox = MailOutbox.query.all()
+    assert len(outbox) == 1
+    assert outbox[0].recipient == 'new@example.com'
+    assert outbox[0].status == PENDING
+    assert '/verify-email?token=' in outbox[0].body
+
+
+def test_web_process_dispatches_registration_mail(smtp_server, tmp_path):
+  # 送信スレッドとリクエストが同時にDBを使うので、1本の接続を共有するインメモリDBではなくファイルのDBにする
+  app = make_app(smtp_server.port, autostart=True, database_uri=f"sqlite:///{tmp_path / 'app.db'}")
+  dispatcher = app.extensions['mail_dispatcher']
+  # アプリを作っただけ（flask db upgrade などのCLI）ではスレッドは動かない
+  assert not dispatcher.is_alive()
+  try:
+    response = app.test_client().post(
+      '/api/v1/register',
+      json={'username': 'newuser', 'email_address': 'new@example.com', 'password': 'Password123'}
+    )
+    assert response.status_code == 201
+    assert dispatcher.is_alive()
+    deadline = time.monotonic() + 5
+    while not smtp_server.messages and time.monotonic() < deadline:
+      time.sleep(0.05)
+  finally:
+    dispatcher.stop()
+    dispatcher.join(5)
+
+  assert [recipients for recipients, _ in smtp_server.messages] == [['new@example.com']]
+  with app.app_context():
+    assert MailOutbox.query.one().status == SENT
+
+
+def test_dispatch_sends_batch_over_one_connection(smtp_server):
+  app = make_app(smtp_server.port)
+  with app.app_context():
+    for i in range(25):
+      enqueue_mail(f'user{i}@example.com', '件名', f'本文{i}')
+    db.session.commit()
+
+    assert dispatch_all() == 25
+    assert MailOutbox.query.filter_by(status=SENT).count() == 25
+
+  assert len(smtp_server.messages) == 25
+  # バッチサイズ10なので、接続は3回だけ
+  assert smtp_server.connections == 3
+
+
+def test_failed_mail_is_retried_with_backoff_then_dead(smtp_server):
+  app = make_app(smtp_server.port)
+  with app.app_context():
+    enqueue_mail('ok@example.com', '件名', '本文')
+    busy = enqueue_mail('busy@example.com', '件名', '本文')
+    db.session.commit()
+
+    assert dispatch_pending() == (2, 1)
+    db.session.refresh(busy)
+    assert busy.status == PENDING
+    assert busy.attempts == 1
+    first_delay = busy.next_attempt_at - busy.claimed_at
+    assert timedelta(seconds=59) < first_delay <= timedelta(seconds=61)
+
+    # 再送予定時刻までは送信対象にならない
+    assert dispatch_pending() == (0, 0)
+
+    busy.next_attempt_at -= timedelta(hours=1)
+    db.session.commit()
+    dispatch_pending()
+    db.session.refresh(busy)
+    assert busy.attempts == 2
+    second_delay = busy.next_attempt_at - busy.claimed_at
+    assert timedelta(seconds=119) < second_delay <= timedelta(seconds=121)
+
+    busy.next_attempt_at -= timedelta(hours=1)
+    db.session.commit()
+    dispatch_pending()
+    db.session.refresh(busy)
+    assert busy.status == DEAD
+    assert busy.attempts == 3
+    assert '451' in busy.last_error
+
+
+def test_unreachable_server_schedules_retry():
+  with LocalSMTPServer() as server:
+    port = server.port
+  # サーバーは停止済みなので接続できない
+  app = make_app(port)
+  with app.app_context():
+    enqueue_mail('a@example.com', '件名', '本文')
+    enqueue_mail('b@example.com', '件名', '本文')
+    db.session.commit()
+
+    assert dispatch_all() == 0
+    rows = MailOutbox.query.all()
+    assert [row.status for row in rows] == [PENDING, PENDING]
+    assert all(row.attempts == 1 for row in rows)
@@ -0,0 +1,141 @@
+import re
+from sharefood import create_app, db
+from sharefood.config import TestingConfig
+from sharefood.metrics import MetricsRegistry, merge_snapshots, render
+from .helpers import create_test_user, create_test_item, get_auth_header
+
+# ----------------------------------------------
+#      <<-- テストの要件 -->>
+
+# /metrics がPrometheusのテキスト形式で、エンドポイントごとのリクエスト数・処理時間・SQLの数を返すか
+# ルートに一致しないリクエストは1つのラベルにまとめられるか
+# ヒストグラムのバケットが累積で、+Inf が件数と一致するか
+# 複数プロセスの集計（METRICS_DIR のファイル）が合算されるか
+# /metrics にはトークンが必要で、METRICS_AUTH_TOKEN が未設定（既定）なら集計はしても404になるか
+# METRICS_ENABLED が偽なら404になるか
+# ----------------------------------------------
+
+METRICS_TOKEN = 'scrape-secret'
+
+def get_metrics(client):
+  """トークンを設定して /metrics を取得する（未設定なら404になるため）"""
+  client.application.config['METRICS_AUTH_TOKEN'] = METRICS_TOKEN
+  return client.get('/metrics', headers={'Authorization': f'Bearer {METRICS_TOKEN}'})
+
+def sample(body, name, **labels):
+  """メトリクスの値を1つ取り出す（ラベルは指定したものをすべて含む行）"""
+  for line in body.splitlines():
+    if line.startswith(name + '{') or line.startswith(name + ' '):
+      if all(f'{key}="{value}"' in line for key, value in labels.items()):
+        return float(line.rsplit(' ', 1)[1])
+  return None
+
+
+def test_metrics_records_requests_and_sql(client):
+  with client.application.app_context():
+    user = create_test_user('alice', 'alice@example.com')
+    create_test_item(user)
+    headers = get_auth_header(user.id)
+
+  for _ in range(3):
+    assert client.get('/api/v1/items/', headers=headers).status_code == 200
+  client.get('/api/v1/items/9999', headers=headers)
+  client.get('/api/v1/me', headers=headers)
+
+  response = get_metrics(client)
+  assert response.status_code == 200
+  assert response.mimetype == 'text/plain'
+  body = response.get_data(as_text=True)
+
+  labels = {'endpoint': 'item_route.get_items', 'method': 'GET'}
+  assert sample(body, 'sharefood_http_requests_total', status='200', **labels) == 3
+  assert sample(body, 'sharefood_http_requests_total', endpoint='item_route.get_item', status='404') == 1
+  assert sample(body, 'sharefood_http_request_duration_seconds_count', **labels) == 3
+  assert sample(body, 'sharefood_http_request_duration_seconds_bucket', le='+Inf', **labels) == 3
+  assert sample(body, 'sharefood_http_request_duration_seconds_sum', **labels) > 0
+  assert sample(body, 'sharefood_sql_statements_total', endpoint='item_route.get_items') >= 3
+  assert sample(body, 'sharefood_sql_duration_seconds_total', endpoint='item_route.get_items') > 0
+  # テストデータの作成はリクエストの外
+  assert sample(body, 'sharefood_sql_statements_total', endpoint='(background)') > 0
+  assert '# TYPE sharefood_http_request_duration_seconds histogram' in body
+  assert sample(body, 'sharefood_token_checks_total') == 1
+
+
+def test_unmatched_requests_share_one_label(client):
+  # GET以外はReactアプリのルートにも一致しない
+  assert client.post('/api/v1/does-not-exist').status_code == 405
+  assert client.post('/api/v1/other-missing-path').status_code == 405
+  body = get_metrics(client).get_data(as_text=True)
+  assert sample(body, 'sharefood_http_requests_total', endpoint='(unmatched)', method='POST', status='405') == 2
+  assert 'does-not-exist' not in body
+
+
+def test_histogram_buckets_are_cumulative():
+  registry = MetricsRegistry(buckets=(0.1, 1.0))
+  for seconds in (0.05, 0.1, 0.5, 3.0):
+    registry.observe_request('x.view', 'GET', '200', seconds)
+  body = render(merge_snapshots([registry.snapshot()]))
+
+  buckets = re.findall(r'sharefood_http_request_duration_seconds_bucket\{.*le="([^"]+)"\} (\d+)', body)
+  assert buckets == [('0.1', '2'), ('1.0', '3'), ('+Inf', '4')]
+  assert sample(body, 'sharefood_http_request_duration_seconds_sum') == 3.65
+
+
+def test_label_values_are_escaped():
+  registry = MetricsRegistry()
+  registry.observe_sql('a"b\\c', 1, 0.5)
+  body = render(merge_snapshots([registry.snapshot()]))
+  assert 'sharefood_sql_statements_total{endpoint="a\\"b\\\\c"} 1' in body
+
+
+def test_snapshots_from_worker_processes_are_merged(tmp_path):
+  class MultiprocessConfig(TestingConfig):
+    METRICS_DIR = str(tmp_path)
+    METRICS_FLUSH_INTERVAL = 3600
+
+  # 同じディレクトリを使う2つのアプリ（gunicornの2つのワーカーの代わり）
+  apps = [create_app(config_class=MultiprocessConfig) for _ in range(2)]
+  try:
+    for app in apps:
+      with app.app_context():
+        db.create_all()
+      app.test_client().get('/api/v1/items/')
+    # 片方のワーカーの分は定期的な書き出しで共有される
+    apps[1].extensions['metrics_flusher'].flush()
+
+    body = get_metrics(apps[0].test_client()).get_data(as_text=True)
+    assert sample(body, 'sharefood_http_requests_total', endpoint='item_route.get_items', status='200') == 2
+    assert sample(body, 'sharefood_http_request_duration_seconds_count', endpoint='item_route.get_items') == 2
+    assert len(list(tmp_path.glob('metrics-*.json'))) == 2
+
+    # リクエストを処理していないプロセス（CLIなど）はファイルを作らない
+    cli_app = create_app(config_class=MultiprocessConfig)
+    assert not cli_app.extensions['metrics_flusher'].is_alive()
+    assert len(list(tmp_path.glob('metrics-*.json'))) == 2
+  finally:
+    for app in apps:
+      app.extensions['metrics_flusher'].stop()
+
+
+def test_metrics_are_hidden_without_auth_token(client):
+  # 既定（METRICS_AUTH_TOKEN なし）では、集計はしていても /metrics は公開しない
+  assert client.application.config['METRICS_AUTH_TOKEN'] is None
+  assert client.get('/api/v1/items/').status_code == 200
+  assert client.get('/metrics').status_code == 404
+  assert client.get('/metrics', headers={'Authorization': 'Bearer '}).status_code == 404
+  assert sample(get_metrics(client).get_data(as_text=True), 'sharefood_http_requests_total', status='200') >= 1
+
+
+def test_metrics_auth_token_and_disable():
+  class TokenConfig(TestingConfig):
+    METRICS_AUTH_TOKEN = METRICS_TOKEN
+
+  client = create_app(config_class=TokenConfig).test_client()
+  assert client.get('/metrics').status_code == 401
+  assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+  assert client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'}).status_code == 200
+
+  class DisabledConfig(TestingConfig):
+    METRICS_ENABLED = False
+
+  assert create_app(config_class=DisabledConfig).test_client().get('/metrics').status_code == 404
@@ -0,0 +1,98 @@
+import re
+from datetime import date
+import pytest
+from sqlalchemy import event
+from sharefood import db
+from sharefood.models import Item
+from .helpers import create_test_user, create_test_item, get_auth_header
+
+# ----------------------------------------------
+#      <<-- テストの要件 -->>
+
+# アイテムのよく使うクエリが、itemテーブルの全件スキャンや
+# ORDER BYのための一時ソートにならず、インデックスを使っているか
+# （EXPLAIN QUERY PLAN の結果で確認する）
+# ----------------------------------------------
+
+# "SCAN item" の後ろに USING INDEX などが続かないものが全件スキャン
+FULL_SCAN = re.compile(r'^SCAN item(?! USING)')
+# インデックス順に先頭から読むだけの "SCAN item USING INDEX" も、WHERE句があるなら実質全件スキャン
+ANY_SCAN = re.compile(r'^SCAN item\b')
+TEMP_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+
+def explain(statement, parameters):
+  rows = db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+  return [row[-1] for row in rows]
+
+
+def assert_uses_index(statement, parameters):
+  plan = explain(statement, parameters)
+  scan = ANY_SCAN if 'WHERE' in statement else FULL_SCAN
+  assert not [line for line in plan if scan.match(line) or TEMP_SORT in line], (statement, plan)
+
+
+def capture_item_selects(app, func):
+  """func内でitemテーブルに対して発行されたSELECT文（と、条件付きのUPDATE/DELETE文）を (SQL, パラメータ) のリストで返す"""
+  captured = []
+
+  def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    sql = statement.lstrip()
+    if (sql.startswith('SELECT') and re.search(r'\bFROM item\b', sql)) or re.match(r'(UPDATE|DELETE FROM) item\b', sql):
+      captured.append((statement, parameters))
+
+  with app.app_context():
+    engine = db.engine
+  event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+  try:
+    func()
+  finally:
+    event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+  assert captured
+  return captured
+
+
+@pytest.fixture
+def seeded(client):
+  with client.application.app_context():
+    user = create_test_user()
+    for i in range(5):
+      create_test_item(user, name=f"商品{i}", expiration_date=date(2030, 1, i + 1))
+    auth_header = get_auth_header(user.id)
+    user_id = user.id
+  first_page = client.get('/api/v1/items/?limit=2').get_json()
+  return {'user_id': user_id, 'auth_header': auth_header, 'cursor': first_page['next_cursor']}
+
+
+@pytest.mark.parametrize('params', [
+  'limit=2',
+  'limit=2&cursor={cursor}',
+  'limit=2&is_available=true',
+  'limit=2&is_available=false&cursor={cursor}',
+  'limit=2&user_id={user_id}',
+  'limit=2&user_id={user_id}&cursor={cursor}',
+])
+def test_get_items_uses_index(client, seeded, params):
+  url = '/api/v1/items/?' + params.format(**seeded)
+  captured = capture_item_selects(client.application, lambda: client.get(url))
+  with client.application.app_context():
+    for statement, parameters in captured:
+      assert_uses_index(statement, parameters)
+
+
+def test_toggle_availability_uses_index(client, seeded):
+  captured = capture_item_selects(
+    client.application,
+    lambda: client.post('/api/v1/items/1/toggle-availability', headers=seeded['auth_header'])
+  )
+  with client.application.app_context():
+    for statement, parameters in captured:
+      assert_uses_index(statement, parameters)
+
+
+def test_expiration_query_uses_index(client, seeded):
+  with client.application.app_context():
+    query = Item.query.filter(Item.is_available.is_(True), Item.expiration_date < date(2030, 1, 3))
+    compiled = query.statement.compile(db.engine)
+    parameters = tuple(compiled.construct_params()[name] for name in compiled.positiontup)
+    assert_uses_index(str(compiled), parameters)
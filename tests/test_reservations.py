@@ -0,0 +1,211 @@
+import threading
+from datetime import date, timedelta
+from sharefood import create_app, db
+from sharefood.clock import utcnow
+from sharefood.config import TestingConfig
+from sharefood.models import Item, Reservation
+from sharefood.reservations import expire_command, expire_reservations
+from .helpers import create_test_user, create_test_item, get_auth_header, count_queries
+
+# ----------------------------------------------
+#      <<-- テストの要件 -->>
+
+# 予約すると数量が条件付きのUPDATE文1つで差し引かれ、予約が作られるか
+# 数量が足りない・自分の出品・受付停止中・存在しないアイテムは予約できないか
+# 多数のスレッドから同時に予約しても、数量を超えて予約されないか
+# 出品者が確定でき、予約した本人が取り消すと数量が戻るか
+# 期限切れの予約がバッチ単位で期限切れになり、数量が戻るか（CLIからも実行できるか）
+# 予約されたアイテムを削除すると（1件・まとめて）、予約も一緒に消えるか
+# ----------------------------------------------
+
+def setup_item(client, quantity=5, **fields):
+  """出品者・受け取り希望者2人と、出品者のアイテムを作る"""
+  with client.application.app_context():
+    owner = create_test_user('owner', 'owner@example.com')
+    alice = create_test_user('alice', 'alice@example.com')
+    bob = create_test_user('bob', 'bob@example.com')
+    item_id = create_test_item(owner, quantity=quantity, **fields).id
+    return item_id, {
+      'owner': get_auth_header(owner.id), 'alice': get_auth_header(alice.id), 'bob': get_auth_header(bob.id),
+    }
+
+def item_quantity(client, item_id):
+  with client.application.app_context():
+    return db.session.get(Item, item_id).quantity
+
+
+def test_reserve_decrements_quantity(client):
+  item_id, headers = setup_item(client)
+
+  with count_queries(client.application) as statements:
+    response = client.post(f'/api/v1/items/{item_id}/reservations', json={'quantity': 2}, headers=headers['alice'])
+  assert response.status_code == 201
+  reservation = response.get_json()['reservation']
+  assert reservation['quantity'] == 2 and reservation['status'] == 'pending'
+  assert reservation['expires_at'] > reservation['created_at']
+  assert item_quantity(client, item_id) == 3
+
+  updates = [sql for sql in statements if sql.lstrip().startswith('UPDATE item')]
+  assert len(updates) == 1 and 'quantity >=' in updates[0]
+  assert not [sql for sql in statements if sql.lstrip().startswith('SELECT') and 'FROM item' in sql]
+
+  # 数量を省略すると1
+  response = client.post(f'/api/v1/items/{item_id}/reservations', headers=headers['bob'])
+  assert response.get_json()['reservation']['quantity'] == 1
+
+  response = client.get('/api/v1/reservations', headers=headers['alice'])
+  assert [r['id'] for r in response.get_json()['reservations']] == [reservation['id']]
+
+
+def test_reserve_rejections(client):
+  item_id, headers = setup_item(client, quantity=2)
+  url = f'/api/v1/items/{item_id}/reservations'
+
+  response = client.post(url, json={'quantity': 3}, headers=headers['alice'])
+  assert response.status_code == 409
+  assert '残り2個' in response.get_json()['message']
+  assert client.post(url, json={'quantity': 0}, headers=headers['alice']).status_code == 422
+  assert client.post(url, headers=headers['owner']).status_code == 400
+  assert client.post('/api/v1/items/9999/reservations', headers=headers['alice']).status_code == 404
+  assert client.post(url).status_code == 401
+
+  client.post(f'/api/v1/items/{item_id}/toggle-availability', headers=headers['owner'])
+  assert client.post(url, headers=headers['alice']).status_code == 409
+  assert item_quantity(client, item_id) == 2
+
+
+def test_expired_items_cannot_be_reserved(client):
+  item_id, headers = setup_item(client, expiration_date=date.today() - timedelta(days=1))
+  assert client.post(f'/api/v1/items/{item_id}/reservations', headers=headers['alice']).status_code == 409
+
+
+def test_confirm_and_cancel(client):
+  item_id, headers = setup_item(client)
+  url = f'/api/v1/items/{item_id}/reservations'
+  first = client.post(url, json={'quantity': 2}, headers=headers['alice']).get_json()['reservation']['id']
+  second = client.post(url, json={'quantity': 1}, headers=headers['bob']).get_json()['reservation']['id']
+  assert item_quantity(client, item_id) == 2
+
+  # 確定できるのは出品者だけ
+  assert client.post(f'/api/v1/reservations/{first}/confirm', headers=headers['alice']).status_code == 404
+  assert client.post(f'/api/v1/reservations/{first}/confirm', headers=headers['owner']).status_code == 200
+  assert client.post(f'/api/v1/reservations/{first}/confirm', headers=headers['owner']).status_code == 409
+  # 確定した予約は取り消せない
+  assert client.delete(f'/api/v1/reservations/{first}', headers=headers['alice']).status_code == 404
+
+  # 取り消せるのは予約した本人だけで、取り消すと数量が戻る
+  assert client.delete(f'/api/v1/reservations/{second}', headers=headers['alice']).status_code == 404
+  assert client.delete(f'/api/v1/reservations/{second}', headers=headers['bob']).status_code == 200
+  assert client.delete(f'/api/v1/reservations/{second}', headers=headers['bob']).status_code == 404
+  assert item_quantity(client, item_id) == 3
+
+  with client.application.app_context():
+    assert db.session.get(Reservation, first).status == 'confirmed'
+    assert db.session.get(Reservation, second).status == 'cancelled'
+
+
+def test_expire_reservations_in_batches(client):
+  app = client.application
+  with app.app_context():
+    owner = create_test_user('owner', 'owner@example.com')
+    alice = create_test_user('alice', 'alice@example.com')
+    apple = create_test_item(owner, name='りんご', quantity=1)
+    milk = create_test_item(owner, name='牛乳', quantity=1)
+    now = utcnow()
+    past, future = now - timedelta(minutes=1), now + timedelta(minutes=30)
+    rows = [(apple, past)] * 5 + [(milk, past)] * 2 + [(milk, future)]
+    for item, expires_at in rows:
+      db.session.add(Reservation(
+        item_id=item.id, user_id=alice.id, quantity=2, status='pending', created_at=now, expires_at=expires_at
+      ))
+    db.session.commit()
+    apple_id, milk_id = apple.id, milk.id
+
+    with count_queries(app) as statements:
+      assert expire_reservations(batch_size=3) == 7
+    # 3件ずつ3回に分けて処理し、数量を戻すUPDATEはバッチごとに1文
+    assert len([sql for sql in statements if sql.lstrip().startswith('UPDATE reservation')]) == 3
+    assert len([sql for sql in statements if sql.lstrip().startswith('UPDATE item')]) == 3
+
+    assert db.session.get(Item, apple_id).quantity == 11
+    assert db.session.get(Item, milk_id).quantity == 5
+    assert Reservation.query.filter_by(status='expired').count() == 7
+    assert Reservation.query.filter_by(status='pending').count() == 1
+
+  result = app.test_cli_runner().invoke(expire_command)
+  assert '0件の予約を期限切れにしました' in result.output
+
+
+def test_deleting_reserved_items_removes_reservations(client):
+  item_id, headers = setup_item(client)
+  with client.application.app_context():
+    owner_id = db.session.get(Item, item_id).user_id
+    other_id = create_test_item(db.session.get(Item, item_id).user, name='牛乳').id
+  for reserved in (item_id, other_id):
+    response = client.post(f'/api/v1/items/{reserved}/reservations', headers=headers['alice'])
+    assert response.status_code == 201
+
+  assert client.delete(f'/api/v1/items/{item_id}', headers=headers['owner']).status_code == 200
+  response = client.get('/api/v1/reservations', headers=headers['alice'])
+  assert [r['item_id'] for r in response.get_json()['reservations']] == [other_id]
+
+  response = client.delete('/api/v1/items/bulk', json={'ids': [other_id]}, headers=headers['owner'])
+  assert response.get_json()['ids'] == [other_id]
+  assert client.get('/api/v1/reservations', headers=headers['alice']).get_json()['reservations'] == []
+
+  with client.application.app_context():
+    assert Reservation.query.count() == 0
+    assert Item.query.filter_by(user_id=owner_id).count() == 0
+    # 期限切れの処理が、存在しないアイテムに数量を戻そうとしない
+    assert expire_reservations(now=utcnow() + timedelta(days=1)) == 0
+
+
+def test_expired_reservation_cannot_be_confirmed(client):
+  item_id, headers = setup_item(client)
+  reservation_id = client.post(f'/api/v1/items/{item_id}/reservations', headers=headers['alice']).get_json()['reservation']['id']
+  with client.application.app_context():
+    reservation = db.session.get(Reservation, reservation_id)
+    reservation.expires_at = utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+  assert client.post(f'/api/v1/reservations/{reservation_id}/confirm', headers=headers['owner']).status_code == 409
+  with client.application.app_context():
+    assert expire_reservations() == 1
+  assert item_quantity(client, item_id) == 5
+
+
+def test_concurrent_reservations_never_oversell(tmp_path):
+  """数量10のアイテムに8スレッドから合計80回予約しても、ちょうど10件だけ成功すること"""
+  class FileDBConfig(TestingConfig):
+    SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'reserve.db'}"
+
+  app = create_app(config_class=FileDBConfig)
+  with app.app_context():
+    db.create_all()
+    owner = create_test_user('owner', 'owner@example.com')
+    item_id = create_test_item(owner, quantity=10).id
+    headers = [
+      get_auth_header(create_test_user(f'user{i}', f'user{i}@example.com').id) for i in range(8)
+    ]
+
+  statuses = []
+  start = threading.Barrier(len(headers))
+
+  def hammer(auth_header):
+    client = app.test_client()
+    start.wait()
+    for _ in range(10):
+      statuses.append(client.post(f'/api/v1/items/{item_id}/reservations', headers=auth_header).status_code)
+
+  threads = [threading.Thread(target=hammer, args=(header,)) for header in headers]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+  assert statuses.count(201) == 10
+  assert statuses.count(409) == 70
+  with app.app_context():
+    assert db.session.get(Item, item_id).quantity == 0
+    assert db.session.query(db.func.sum(Reservation.quantity)).scalar() == 10
+    db.engine.dispose()
@@ -0,0 +1,175 @@
+import uuid
+from datetime import timedelta
+from flask_jwt_extended import decode_token
+from sharefood import create_app, db
+from sharefood.clock import utcnow
+from sharefood.config import TestingConfig
+from sharefood.models import RevokedToken
+from sharefood.revocation import BloomFilter, RedisRevocationStore, prune_command, token_blocklist
+from .helpers import create_test_user, get_auth_header, count_queries
+
+# ----------------------------------------------
+#      <<-- テストの要件 -->>
+
+# ブルームフィルターが、追加したものを取りこぼさず、誤判定の割合が設定程度に収まるか
+# 無効化されていないトークンの確認ではストアに問い合わせない（SQLを発行しない）か
+# 他のプロセスがストアに書いた無効化が、同期の間隔ごとに取り込まれるか
+# 有効期限を過ぎたjtiが削除され、フィルターの作り直しで消えるか
+# Redis互換ストアでも同じように動くか
+# ----------------------------------------------
+
+class FakeClock:
+  def __init__(self):
+    self.now = 1000.0
+
+  def __call__(self):
+    return self.now
+
+class FakeRedis:
+  """テスト用のRedisの代わり（使うコマンドだけ。キーの有効期限は扱わない）"""
+
+  def __init__(self):
+    self.data = {}
+    self.zsets = {}
+
+  def set(self, key, value, ex=None):
+    self.data[key] = value
+
+  def exists(self, key):
+    return int(key in self.data)
+
+  def incr(self, key):
+    self.data[key] = int(self.data.get(key, 0)) + 1
+    return self.data[key]
+
+  def zadd(self, key, mapping):
+    self.zsets.setdefault(key, {}).update(mapping)
+
+  def zrangebyscore(self, key, low, high, withscores=False):
+    def bound(value, default):
+      if value in ('-inf', '+inf'):
+        return default, False
+      text = str(value)
+      return float(text.lstrip('(')), text.startswith('(')
+    (low, low_open), (high, high_open) = bound(low, float('-inf')), bound(high, float('inf'))
+    entries = sorted(
+      (score, member.encode()) for member, score in self.zsets.get(key, {}).items()
+      if (score > low if low_open else score >= low) and (score < high if high_open else score <= high)
+    )
+    return [(member, score) for score, member in entries] if withscores else [member for _, member in entries]
+
+  def zrem(self, key, *members):
+    for member in members:
+      self.zsets.get(key, {}).pop(member.decode() if isinstance(member, bytes) else member, None)
+
+
+def make_app(clock, **overrides):
+  class RevocationConfig(TestingConfig):
+    JWT_REVOCATION_SYNC_SECONDS = 5
+    JWT_REVOCATION_REBUILD_SECONDS = 3600
+
+  for key, value in overrides.items():
+    setattr(RevocationConfig, key, value)
+  app = create_app(config_class=RevocationConfig)
+  token_blocklist.init_app(app, clock=clock)
+  with app.app_context():
+    db.create_all()
+  return app
+
+def revoke_elsewhere(jti, expires_at=None):
+  """別のプロセスが無効にした状況（ストアにだけ書き、このプロセスのフィルターには入れない）"""
+  token_blocklist.store.revoke(jti, 'access', None, expires_at or utcnow() + timedelta(minutes=5))
+
+
+def test_bloom_filter():
+  bloom = BloomFilter(1000, error_rate=0.01)
+  added = [uuid.uuid4().hex for _ in range(1000)]
+  for key in added:
+    bloom.add(key)
+  assert all(key in bloom for key in added)
+  false_positives = sum(uuid.uuid4().hex in bloom for _ in range(10000))
+  assert false_positives < 300  # 1%の想定に対して余裕を持たせる
+
+
+def test_checks_do_not_query_store():
+  clock = FakeClock()
+  app = make_app(clock)
+  client = app.test_client()
+  with app.app_context():
+    user = create_test_user()
+    auth_header = get_auth_header(user.id)
+    revoked_header = get_auth_header(user.id)
+  client.post('/api/v1/logout', headers=revoked_header)
+
+  # 同期の間隔内なら、無効化されていないトークンの確認ではrevoked_tokenを見ない
+  with count_queries(app) as statements:
+    for _ in range(5):
+      assert client.get('/api/v1/me', headers=auth_header).status_code == 200
+  assert not [sql for sql in statements if 'revoked_token' in sql]
+
+  with app.app_context():
+    stats = token_blocklist.state.stats
+    assert stats['revoked'] == 0 and stats['filter_hits'] <= 1
+
+
+def test_revocations_from_other_processes_are_synced():
+  clock = FakeClock()
+  app = make_app(clock)
+  client = app.test_client()
+  with app.app_context():
+    user = create_test_user()
+    auth_header = get_auth_header(user.id)
+    assert client.get('/api/v1/me', headers=auth_header).status_code == 200
+
+    jti = decode_token(auth_header['Authorization'].split()[1])['jti']
+    revoke_elsewhere(jti)
+
+  # 同期の間隔が過ぎるまではこのプロセスのフィルターに入っていない
+  assert client.get('/api/v1/me', headers=auth_header).status_code == 200
+  clock.now += 5
+  assert client.get('/api/v1/me', headers=auth_header).status_code == 401
+
+
+def test_expired_revocations_are_pruned():
+  clock = FakeClock()
+  app = make_app(clock)
+  with app.app_context():
+    expired_jti, active_jti = uuid.uuid4().hex, uuid.uuid4().hex
+    revoke_elsewhere(expired_jti, expires_at=utcnow() - timedelta(minutes=1))
+    revoke_elsewhere(active_jti)
+
+    # フィルターの作り直しでは有効期限内のものだけを入れる
+    assert token_blocklist.is_revoked(active_jti)
+    assert expired_jti not in token_blocklist.state.filter
+
+  result = app.test_cli_runner().invoke(prune_command)
+  assert '1件の無効化済みトークンを削除しました' in result.output
+  with app.app_context():
+    assert [row.jti for row in RevokedToken.query.all()] == [active_jti]
+
+
+def test_redis_store():
+  clock = FakeClock()
+  store = RedisRevocationStore(FakeRedis())
+  app = make_app(clock, JWT_REVOCATION_STORE=store)
+  client = app.test_client()
+  with app.app_context():
+    user = create_test_user()
+    auth_header = get_auth_header(user.id)
+    old_jti = uuid.uuid4().hex
+    revoke_elsewhere(old_jti, expires_at=utcnow() - timedelta(minutes=1))
+
+  assert client.post('/api/v1/logout', headers=auth_header).status_code == 200
+  assert client.get('/api/v1/me', headers=auth_header).status_code == 401
+
+  # 別のプロセスが無効にしたものも、同期で取り込む
+  with app.app_context():
+    jti = uuid.uuid4().hex
+    revoke_elsewhere(jti)
+    assert not token_blocklist.is_revoked(jti)
+    clock.now += 5
+    assert token_blocklist.is_revoked(jti)
+
+  # ログアウトのときに期限切れのものを消している
+  assert old_jti.encode() not in store.client.zrangebyscore(store.prefix + 'log', '-inf', '+inf')
+  assert store.prune(utcnow()) == 0
@@ -0,0 +1,93 @@
+from sharefood import db
+from sharefood.models import Item
+from sharefood.search import normalize
+from .helpers import create_test_user, create_test_item, get_auth_header
+
+# ----------------------------------------------
+#      <<-- テストの要件 -->>
+
+# 全角/半角・カタカナ/ひらがなの違いが正規化されるか
+# 食品名だけでなく説明文も検索対象になるか
+# アイテムの作成・更新・削除が検索インデックスに反映されるか
+# 関連度の高い順に返るか
+# ----------------------------------------------
+
+def test_normalize():
+  assert normalize("ﾘﾝｺﾞ") == "りんご"
+  assert normalize("リンゴ") == "りんご"
+  assert normalize("ＡＢＣ　Ｊｕｉｃｅ") == "abc juice"
+  assert normalize(None) == ""
+
+
+def test_search_matches_name_and_description(client):
+  with client.application.app_context():
+    user = create_test_user()
+    create_test_item(user, name="リンゴ", description="青森産")
+    create_test_item(user, name="果物セット", description="りんごとみかん")
+    create_test_item(user, name="バナナ", description="フィリピン産")
+
+  response = client.get('/api/v1/items/search?q=ﾘﾝｺﾞ')
+  names = [item['name'] for item in response.get_json()['items']]
+  assert response.status_code == 200
+  assert sorted(names) == ["リンゴ", "果物セット"]
+
+  # 3文字未満の検索語でも部分一致する
+  response = client.get('/api/v1/items/search?q=産')
+  names = [item['name'] for item in response.get_json()['items']]
+  assert sorted(names) == ["バナナ", "リンゴ"]
+
+  # 複数の語はAND条件
+  response = client.get('/api/v1/items/search?q=りんご 青森')
+  names = [item['name'] for item in response.get_json()['items']]
+  assert names == ["リンゴ"]
+
+
+def test_search_is_ranked(client):
+  with client.application.app_context():
+    user = create_test_user()
+    create_test_item(user, name="詰め合わせ", description="みかん、ぶどう、もも、なし、かき、りんご")
+    create_test_item(user, name="りんご", description="りんごジュース用のりんご")
+
+  response = client.get('/api/v1/items/search?q=りんご')
+  names = [item['name'] for item in response.get_json()['items']]
+  assert names == ["りんご", "詰め合わせ"]
+
+
+def test_search_index_stays_in_sync(client):
+  with client.application.app_context():
+    user = create_test_user()
+    item = create_test_item(user, name="トマト", description="")
+    auth_header = get_auth_header(user.id)
+    item_id = item.id
+
+  assert len(client.get('/api/v1/items/search?q=トマト').get_json()['items']) == 1
+
+  # 更新すると古い語では引けなくなり、新しい語で引ける
+  client.put(f'/api/v1/items/{item_id}', json={"name": "キュウリ"}, headers=auth_header)
+  assert client.get('/api/v1/items/search?q=トマト').get_json()['items'] == []
+  assert len(client.get('/api/v1/items/search?q=きゅうり').get_json()['items']) == 1
+
+  # 削除するとインデックスからも消える
+  client.delete(f'/api/v1/items/{item_id}', headers=auth_header)
+  assert client.get('/api/v1/items/search?q=きゅうり').get_json()['items'] == []
+
+  with client.application.app_context():
+    rows = db.session.execute(db.text("SELECT count(*) FROM item_search")).scalar()
+    assert rows == Item.query.count() == 0
+
+
+def test_get_items_name_filter_uses_search(client):
+  with client.application.app_context():
+    user = create_test_user()
+    create_test_item(user, name="ニンジン", description="")
+    create_test_item(user, name="野菜セット", description="にんじん入り")
+    create_test_item(user, name="ピーマン", description="")
+
+  response = client.get('/api/v1/items/?name=にんじん')
+  names = [item['name'] for item in response.get_json()['items']]
+  assert names == ["野菜セット", "ニンジン"]
+
+
+def test_search_requires_query(client):
+  response = client.get('/api/v1/items/search')
+  assert response.status_code == 400
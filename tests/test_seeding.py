@@ -0,0 +1,146 @@
+import random
+from datetime import datetime
+from sharefood import db
+from sharefood.models import Item, User
+from sharefood.seeding import CITIES, FOODS, generate_items, seed_command, seed_database
+from .helpers import create_test_user, create_test_item, get_auth_header
+
+# ----------------------------------------------
+#      <<-- テストの要件 -->>
+
+# 指定した件数のユーザーとアイテムが入り、共通のパスワードでログインできるか
+# アイテムのIDと作成日時の順番が揃うか
+# 一時的に外したトリガーとインデックスが元に戻り、追加した行が全文検索・位置検索の索引に入るか
+# --defer-indexes なら索引を作らずに終わり（その間に削除しても索引が壊れない）、reindex で作られるか
+# 失敗したときはトリガーとインデックスを含めて元に戻るか
+# 既存のユーザー・アイテムがあっても続きのIDで追加できるか
+# CLIで件数と時間が表示され、ユーザーがいなければエラーになるか
+# ----------------------------------------------
+
+NOW = datetime(2026, 4, 1, 12, 0, 0)
+FOOD_NAMES = [food for food, _, _ in FOODS]
+
+def food_of(item):
+  """「国産りんご」のような名前から食品名を取り出す"""
+  return next(food for food in FOOD_NAMES if item.name.endswith(food))
+
+def item_triggers_and_indexes():
+  return sorted(db.session.execute(db.text(
+    "SELECT name FROM sqlite_master WHERE tbl_name = 'item' AND type IN ('index', 'trigger') AND sql IS NOT NULL"
+  )).scalars())
+
+
+def test_seed_users_and_items(client):
+  with client.application.app_context():
+    before = item_triggers_and_indexes()
+    result = seed_database(users=20, items=300, rng=random.Random(1), now=NOW, chunk_size=64)
+    assert result['users'] == 20 and result['items'] == 300
+    assert User.query.count() == 20 and Item.query.count() == 300
+    assert item_triggers_and_indexes() == before
+
+    # 作成日時はIDの順に並び、指定した日数の範囲に収まる
+    items = Item.query.order_by(Item.id).all()
+    created = [item.created_at for item in items]
+    assert created == sorted(created)
+    assert all((NOW - timestamp).days < 90 for timestamp in created)
+    assert all(food_of(item) for item in items)
+    assert {item.user_id for item in items} <= {user.id for user in User.query}
+
+  response = client.post('/api/v1/login', json={'email_address': 'user20@example.com', 'password': 'password'})
+  assert response.status_code == 200
+
+
+def test_generate_items_for_other_databases():
+  # SQLite以外のDBで使う、Pythonで行を作る方
+  chunks = list(generate_items(random.Random(1), 250, [1, 2, 3], NOW, chunk_size=100))
+  assert [len(chunk) for chunk in chunks] == [100, 100, 50]
+  rows = [row for chunk in chunks for row in chunk]
+  created = [row[6] for row in rows]
+  assert created == sorted(created) and all((NOW - timestamp).days < 90 for timestamp in created)
+  assert {row[10] for row in rows} <= {1, 2, 3}
+
+
+def test_seeded_items_are_searchable(client):
+  with client.application.app_context():
+    seed_database(users=5, items=200, rng=random.Random(2), now=NOW)
+    available = Item.query.filter(Item.is_available.is_(True))
+    food = food_of(available.first())
+    expected = {item.id for item in available if food_of(item) == food}
+
+  response = client.get('/api/v1/items/search', query_string={'q': food, 'limit': 100})
+  assert {item['id'] for item in response.get_json()['items']} == expected
+
+  _, lat, lng, _, _ = CITIES[0]
+  response = client.get('/api/v1/items/nearby', query_string={'lat': lat, 'lng': lng, 'radius_km': 20})
+  assert response.get_json()['items']
+
+
+def test_seed_appends_to_existing_data(client):
+  with client.application.app_context():
+    owner = create_test_user('alice', 'alice@example.com')
+    create_test_item(owner, name='りんご')
+    seed_database(users=3, items=10, password_hash=owner.password_hash, rng=random.Random(3), now=NOW)
+
+    assert [user.email_address for user in User.query.order_by(User.id)] == [
+      'alice@example.com', 'user2@example.com', 'user3@example.com', 'user4@example.com',
+    ]
+    # IDが飛んでいても、存在するユーザーだけが出品者になる
+    db.session.execute(db.delete(User).where(User.email_address == 'user3@example.com'))
+    db.session.commit()
+    seed_database(items=200, rng=random.Random(5), now=NOW)
+    assert {item.user_id for item in Item.query.filter(Item.id > 11)} == {1, 2, 4}
+
+    # トリガーが戻っているので、後からORMで追加したアイテムも検索できる
+    create_test_item(owner, name='ドラゴンフルーツ')
+  response = client.get('/api/v1/items/search', query_string={'q': 'どらごんふるーつ'})
+  assert [item['name'] for item in response.get_json()['items']] == ['ドラゴンフルーツ']
+
+
+def test_defer_indexes_and_reindex(client):
+  runner = client.application.test_cli_runner()
+  with client.application.app_context():
+    before = item_triggers_and_indexes()
+  result = runner.invoke(seed_command, ['--users', '3', '--items', '200', '--seed', '4', '--defer-indexes'])
+  assert result.exit_code == 0, result.output
+  assert 'flask seed reindex' in result.output
+
+  with client.application.app_context():
+    assert item_triggers_and_indexes() == []
+    item = Item.query.filter(Item.is_available.is_(True)).order_by(Item.id).first()
+    food, item_id, owner_id = food_of(item), item.id, item.user_id
+  # 索引を作る前は検索に出ない。索引に入っていない行を削除しても（FTS5の索引が壊れず）削除できる
+  assert client.get('/api/v1/items/search', query_string={'q': food}).get_json()['items'] == []
+  assert client.delete(f'/api/v1/items/{item_id}', headers=get_auth_header(owner_id)).status_code == 200
+
+  result = runner.invoke(seed_command, ['reindex'])
+  assert result.exit_code == 0, result.output
+  assert 'search=' in result.output and 'geo=' in result.output
+  with client.application.app_context():
+    assert item_triggers_and_indexes() == before
+    expected = {
+      item.id for item in Item.query.filter(Item.is_available.is_(True)) if food_of(item) == food
+    }
+  response = client.get('/api/v1/items/search', query_string={'q': food, 'limit': 100})
+  assert {item['id'] for item in response.get_json()['items']} == expected
+  _, lat, lng, _, _ = CITIES[0]
+  response = client.get('/api/v1/items/nearby', query_string={'lat': lat, 'lng': lng, 'radius_km': 20})
+  assert response.get_json()['items']
+
+
+def test_seed_command(client):
+  runner = client.application.test_cli_runner()
+  with client.application.app_context():
+    before = item_triggers_and_indexes()
+  result = runner.invoke(seed_command, ['--users', '0', '--items', '10'])
+  assert result.exit_code != 0
+  assert 'ユーザーが必要です' in result.output
+  # 途中で失敗しても、外したトリガーとインデックスは元に戻っている
+  with client.application.app_context():
+    assert item_triggers_and_indexes() == before
+
+  result = runner.invoke(seed_command, ['--users', '4', '--items', '10', '--seed', '1'])
+  assert result.exit_code == 0, result.output
+  assert '4人のユーザーと10件のアイテム' in result.output
+  assert 'indexes=' in result.output
+  with client.application.app_context():
+    assert Item.query.count() == 10
@@ -0,0 +1,52 @@
+from datetime import date, datetime
+from flask import url_for
+from sharefood.images import variant_filenames
+from sharefood.models import Item
+from sharefood.schemas import items_schema
+from sharefood.serializers import dump_item_rows, item_rows_query
+from sqlalchemy.orm import joinedload
+from .helpers import create_test_user, create_test_item
+
+# ----------------------------------------------
+#      <<-- テストの要件 -->>
+
+# 高速シリアライザの出力が items_schema.dump() と完全に一致するか
+# （値がNoneのフィールドや、URLエスケープが必要な画像ファイル名も含めて）
+# 縮小版のURLが url_for で作ったものと一致し、マイクロ秒のある作成日時も秒までになるか
+# ----------------------------------------------
+
+def test_fast_serializer_matches_schema(client):
+  app = client.application
+  with app.app_context():
+    owner = create_test_user("出品者", "owner@example.com")
+    other = create_test_user("other", "other@example.com")
+    create_test_item(owner, name="りんご", expiration_date=date(2030, 1, 31), location="渋谷駅", img_url="apple.png")
+    create_test_item(other, name="説明なし", description=None, unit=None, is_available=False)
+    create_test_item(owner, name="記号", img_url="a b+c&d/写真.jpg", created_at=datetime(2030, 1, 2, 3, 4, 5, 678901))
+
+  with app.test_request_context('/api/v1/items/'):
+    items = Item.query.options(joinedload(Item.user)).order_by(Item.id).all()
+    rows = item_rows_query(Item.query).order_by(Item.id).all()
+    dumped = dump_item_rows(rows)
+    assert dumped == items_schema.dump(items)
+
+    assert dumped[2]['created_at'] == '2030-01-02T03:04:05'
+    widths = sorted(app.config['IMAGE_VARIANT_WIDTHS'])
+    assert [variant['width'] for variant in dumped[2]['image_variants']] == widths
+    for variant in dumped[2]['image_variants']:
+      jpeg_name, webp_name = variant_filenames("a b+c&d/写真.jpg", variant['width'])
+      assert variant['url'] == url_for('static', filename=f'uploads/{jpeg_name}', _external=True)
+      assert variant['webp_url'] == url_for('static', filename=f'uploads/{webp_name}', _external=True)
+
+
+def test_list_response_matches_schema(client):
+  app = client.application
+  with app.app_context():
+    user = create_test_user()
+    create_test_item(user, img_url="x.png", expiration_date=date(2030, 5, 1))
+    create_test_item(user)
+
+  response = client.get('/api/v1/items/')
+  with app.test_request_context('/api/v1/items/'):
+    items = Item.query.options(joinedload(Item.user)).order_by(Item.created_at.desc(), Item.id.desc()).all()
+    assert response.get_json()['items'] == items_schema.dump(items)
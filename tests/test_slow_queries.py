@@ -0,0 +1,140 @@
+import json
+import logging
+from sharefood import create_app, db, slow_queries
+from sharefood.config import TestingConfig
+from sharefood.slow_queries import SlowQueryLog, dump_command, normalize, parameter_shape
+from .helpers import create_test_user, create_test_item
+
+# ----------------------------------------------
+#      <<-- テストの要件 -->>
+
+# SQLが正規化され（リテラル・INの要素数・空白）、パラメータは値ではなく型だけが記録されるか
+# しきい値を超えたSQLが、ルートと実行計画と一緒にログに出るか
+# 同じ文は1行にまとめられ、実行計画は1回だけ取られるか
+# 表の大きさに上限があり、合計時間の小さいものから捨てられるか
+# CLIで METRICS_DIR に書き出された表を表示でき（未設定ならエラー）、複数プロセスの表がまとめられるか
+# ----------------------------------------------
+
+class SlowQueryConfig(TestingConfig):
+  SLOW_QUERY_THRESHOLD_MS = 0.000001  # すべてのSQLを「遅い」として記録する
+
+def make_app(config_class=SlowQueryConfig):
+  app = create_app(config_class=config_class)
+  with app.app_context():
+    db.create_all()
+    create_test_item(create_test_user('alice', 'alice@example.com'), name='りんご')
+  return app
+
+def items_entry(app):
+  entries = slow_queries.collect_entries(app)
+  return next(entry for entry in entries if entry['sql'].startswith('SELECT item.id') and 'LIMIT' in entry['sql'])
+
+
+def test_normalize_and_parameter_shape():
+  sql = "SELECT *  FROM item\n WHERE name = 'りんご' AND quantity > 3 AND id IN (?, ?, ?) AND col2 = ?"
+  assert normalize(sql) == 'SELECT * FROM item WHERE name = ? AND quantity > ? AND id IN (?...) AND col2 = ?'
+  assert normalize('SELECT 1 WHERE id IN (?, ?)') == normalize('SELECT 1 WHERE id IN (?, ?, ?, ?)')
+
+  assert parameter_shape(('alice@example.com', 3, None)) == '(str, int, NoneType)'
+  assert parameter_shape({'email': 'alice@example.com'}) == '{email: str}'
+  assert parameter_shape([(1, 'a'), (2, 'b')], executemany=True) == '2 x (int, str)'
+
+
+def test_slow_queries_are_logged_with_route_and_plan(caplog):
+  app = make_app()
+  client = app.test_client()
+  with caplog.at_level(logging.WARNING, logger=app.logger.name):
+    response = client.get('/api/v1/items/?name=りんご')
+  # 実行計画を取っても、元のSQLの結果は壊れない
+  assert [item['name'] for item in response.get_json()['items']] == ['りんご']
+
+  messages = [record.getMessage() for record in caplog.records if '遅いSQL' in record.getMessage()]
+  item_messages = [message for message in messages if 'item_route.get_items' in message and 'FROM item' in message]
+  assert item_messages
+  assert '実行計画:' in item_messages[0]
+  # パラメータの値（検索語）はログに出さない
+  assert not [message for message in messages if 'りんご' in message]
+
+  entry = items_entry(app)
+  assert entry['routes'] == {'item_route.get_items': 1}
+  assert entry['plan'] and ('SCAN' in entry['plan'] or 'SEARCH' in entry['plan'])
+
+
+def test_identical_statements_are_deduplicated(monkeypatch):
+  app = make_app()
+  calls = []
+  original = slow_queries.explain
+  monkeypatch.setattr(slow_queries, 'explain', lambda *args: calls.append(args[1]) or original(*args))
+
+  client = app.test_client()
+  for _ in range(3):
+    client.get('/api/v1/items/?name=りんご')
+  client.get('/api/v1/items/?name=みかん')
+
+  entry = items_entry(app)
+  assert entry['count'] == 4
+  assert entry['max_ms'] <= entry['total_ms']
+  assert calls.count(calls[0]) == 1  # 同じ文の実行計画は1回だけ
+  assert len(calls) == len(set(calls))
+
+
+def test_table_is_bounded():
+  log = SlowQueryLog(max_entries=2)
+  log.record('SELECT a', 50.0, 'r', '()')
+  log.record('SELECT b', 10.0, 'r', '()')
+  log.record('SELECT c', 30.0, 'r', '()')
+  assert sorted(entry['sql'] for entry in log.snapshot()) == ['SELECT a', 'SELECT c']
+
+  # 同じ文は何度記録しても最初の1回だけが実行計画を取る役目になる
+  assert log.record('SELECT a', 1.0, 'r', '()') is False
+
+
+def test_dump_command(tmp_path):
+  class MultiprocessConfig(SlowQueryConfig):
+    METRICS_DIR = str(tmp_path)
+    METRICS_FLUSH_INTERVAL = 3600
+
+  server = make_app(MultiprocessConfig)
+  try:
+    server.test_client().get('/api/v1/items/?name=りんご')
+    server.extensions['metrics_flusher'].flush()
+
+    # CLIは別のプロセス（別のアプリ）として動き、サーバーが書き出した表を読む。自分のファイルは作らない
+    runner = create_app(config_class=MultiprocessConfig).test_cli_runner()
+    result = runner.invoke(dump_command, ['--limit', '50'])
+    assert 'SQL: SELECT item.id' in result.output
+    assert 'ルート: item_route.get_items(1)' in result.output
+    assert '実行計画:' in result.output
+
+    entries = json.loads(runner.invoke(dump_command, ['--json', '--limit', '1']).output)
+    assert len(entries) == 1 and entries[0]['count'] >= 1
+    assert len(list(tmp_path.glob('metrics-*.json'))) == 1
+  finally:
+    server.extensions['metrics_flusher'].stop()
+
+  # METRICS_DIR がなければ、空の表ではなくエラーにする
+  result = make_app().test_cli_runner().invoke(dump_command)
+  assert result.exit_code != 0 and 'METRICS_DIR' in result.output
+
+  disabled = create_app(config_class=TestingConfig)
+  disabled.config['SLOW_QUERY_THRESHOLD_MS'] = 0
+  assert '記録していません' in disabled.test_cli_runner().invoke(dump_command).output
+
+
+def test_dump_merges_worker_processes(tmp_path):
+  class MultiprocessConfig(SlowQueryConfig):
+    METRICS_DIR = str(tmp_path)
+    METRICS_FLUSH_INTERVAL = 3600
+
+  apps = [make_app(MultiprocessConfig) for _ in range(2)]
+  try:
+    for app in apps:
+      app.test_client().get('/api/v1/items/?name=りんご')
+    apps[1].extensions['metrics_flusher'].flush()
+
+    entry = items_entry(apps[0])
+    assert entry['count'] == 2
+    assert entry['routes'] == {'item_route.get_items': 2}
+  finally:
+    for app in apps:
+      app.extensions['metrics_flusher'].stop()
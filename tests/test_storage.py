@@ -0,0 +1,158 @@
+import hashlib
+import io
+import os
+import time
+from sharefood import db, image_pipeline
+from sharefood.models import Item
+from sharefood.storage import content_filename, gc_command, migrate_command
+from .helpers import create_test_user, create_test_item, make_jpeg, make_png, post_item
+
+# ----------------------------------------------
+#      <<-- テストの要件 -->>
+
+# 内容のハッシュから決まるサブディレクトリに保存されるか
+# 同じ名前の別の画像が上書きし合わないか
+# 同じ画像を再度アップロードすると、既存のファイルを使って処理し直さないか
+# flask uploads migrate で旧形式のファイルが移動され、img_url が書き換わるか
+# flask uploads gc が猶予期間より古く参照されていないファイルだけを消し（または隔離し）、解放したバイト数を表示するか
+# 使い回したファイルがGCで消されないか
+# ----------------------------------------------
+
+def test_content_filename_is_sharded():
+  digest = hashlib.sha256(b'abc').hexdigest()
+  assert content_filename(digest, 'jpg') == f'ba/78/{digest}.jpg'
+
+
+def test_same_name_different_content_does_not_overwrite(image_client):
+  client, auth_header = image_client
+  first = post_item(client, auth_header, make_jpeg(800, 600), 'IMG_0001.jpg').get_json()['item']
+  second = post_item(client, auth_header, make_jpeg(640, 480), 'IMG_0001.jpg').get_json()['item']
+  assert first['image_url'] != second['image_url']
+
+
+def test_duplicate_upload_reuses_existing_file(image_client):
+  client, auth_header = image_client
+  data = make_png()
+  first = post_item(client, auth_header, data, 'a.png').get_json()['item']
+  app = client.application
+  with app.app_context():
+    image_pipeline.wait(timeout=10)
+
+  upload_folder = app.config['UPLOAD_FOLDER']
+  path = os.path.join(upload_folder, content_filename(hashlib.sha256(data).hexdigest(), 'png'))
+  inode = os.stat(path).st_ino
+
+  second = post_item(client, auth_header, data, 'b.png').get_json()['item']
+  assert second['image_url'] == first['image_url']
+  with app.app_context():
+    image_pipeline.wait(timeout=10)
+  assert os.stat(path).st_ino == inode  # 処理し直していない（書き直すと別のファイルに置き換わる）
+  assert os.listdir(app.config['IMAGE_SPOOL_FOLDER']) == []
+
+
+def test_migrate_command_moves_legacy_files(image_client):
+  client, _ = image_client
+  app = client.application
+  upload_folder = app.config['UPLOAD_FOLDER']
+  data = make_jpeg()
+  with open(os.path.join(upload_folder, 'IMG_0001.jpg'), 'wb') as f:
+    f.write(data)
+
+  with app.app_context():
+    user = create_test_user(username='other', email='other@example.com')
+    ids = [create_test_item(user, img_url='IMG_0001.jpg').id for _ in range(2)]
+    missing_id = create_test_item(user, img_url='missing.jpg').id
+
+  result = app.test_cli_runner().invoke(migrate_command)
+  assert result.exit_code == 0, result.output
+  assert '1件を移動しました' in result.output
+
+  new_name = content_filename(hashlib.sha256(data).hexdigest(), 'jpg')
+  with app.app_context():
+    assert {db.session.get(Item, item_id).img_url for item_id in ids} == {new_name}
+    assert db.session.get(Item, missing_id).img_url == 'missing.jpg'
+    assert image_pipeline.is_stored(new_name)
+  assert not os.path.exists(os.path.join(upload_folder, 'IMG_0001.jpg'))
+
+  # 2回目は何もしない
+  result = app.test_cli_runner().invoke(migrate_command)
+  assert '0件を移動しました' in result.output
+
+
+def write_file(folder, relative, size, age_hours):
+  path = os.path.join(folder, relative)
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  with open(path, 'wb') as f:
+    f.write(b'x' * size)
+  mtime = time.time() - age_hours * 3600
+  os.utime(path, (mtime, mtime))
+  return path
+
+
+def test_gc_removes_only_old_unreferenced_files(image_client):
+  client, _ = image_client
+  app = client.application
+  upload_folder = app.config['UPLOAD_FOLDER']
+  referenced = 'aa/bb/aabb.jpg'
+  paths = {
+    'referenced': write_file(upload_folder, referenced, 100, 48),
+    'variant': write_file(upload_folder, 'aa/bb/aabb_w160.webp', 10, 48),
+    'legacy': write_file(upload_folder, 'legacy.png', 10, 48),
+    'orphan': write_file(upload_folder, 'cc/dd/ccdd.png', 1000, 48),
+    'orphan_variant': write_file(upload_folder, 'cc/dd/ccdd_w160.jpg', 200, 48),
+    'recent': write_file(upload_folder, 'ee/ff/eeff.jpg', 50, 1),
+    'spool': write_file(app.config['IMAGE_SPOOL_FOLDER'], 'stale.upload', 5, 48),
+  }
+  with app.app_context():
+    user = create_test_user(username='other', email='other@example.com')
+    create_test_item(user, img_url=referenced)
+    create_test_item(user, img_url='legacy.png')
+
+  runner = app.test_cli_runner()
+  result = runner.invoke(gc_command, ['--dry-run'])
+  assert result.exit_code == 0, result.output
+  assert '6件を確認し、3件が削除対象です' in result.output
+  assert all(os.path.exists(path) for path in paths.values())
+
+  result = runner.invoke(gc_command)
+  assert result.exit_code == 0, result.output
+  assert '3件を削除しました（1.2KB）' in result.output
+  remaining = {key for key, path in paths.items() if os.path.exists(path)}
+  assert remaining == {'referenced', 'variant', 'legacy', 'recent'}
+
+  result = runner.invoke(gc_command, ['--grace-hours', '0'])
+  assert '1件を削除しました（50B）' in result.output
+  assert not os.path.exists(paths['recent'])
+
+
+def test_gc_quarantine(image_client, tmp_path):
+  client, _ = image_client
+  app = client.application
+  write_file(app.config['UPLOAD_FOLDER'], 'cc/dd/ccdd.png', 10, 48)
+
+  quarantine = tmp_path / 'quarantine'
+  result = app.test_cli_runner().invoke(gc_command, ['--quarantine', str(quarantine)])
+  assert '1件を隔離しました' in result.output
+  assert (quarantine / 'cc' / 'dd' / 'ccdd.png').is_file()
+  assert not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], 'cc/dd/ccdd.png'))
+
+
+def test_reused_upload_is_protected_from_gc(image_client):
+  client, auth_header = image_client
+  app = client.application
+  data = make_png()
+  post_item(client, auth_header, data, 'a.png')
+  with app.app_context():
+    image_pipeline.wait(timeout=10)
+  # アイテムを削除して参照がなくなった古いファイルを、同じ内容で再度アップロードする
+  name = content_filename(hashlib.sha256(data).hexdigest(), 'png')
+  path = os.path.join(app.config['UPLOAD_FOLDER'], name)
+  os.utime(path, (time.time() - 48 * 3600,) * 2)
+  with app.app_context():
+    Item.query.delete()
+    db.session.commit()
+
+  response = client.post('/api/v1/upload', data={'images': [(io.BytesIO(data), 'b.png')]}, content_type='multipart/form-data')
+  assert response.get_json()['files'] == [name]
+  app.test_cli_runner().invoke(gc_command)
+  assert os.path.exists(path)
@@ -0,0 +1,83 @@
+from sharefood import db
+from sharefood.models import User
+from sharefood.user_cache import user_cache
+from .helpers import create_test_user, get_auth_header, count_queries
+
+# ----------------------------------------------
+#      <<-- テストの要件 -->>
+
+# 2回目以降の認証付きの読み取りでは、ユーザーのSELECTが発行されないか（ヒット・ミスが数えられるか）
+# ログインしたユーザーは、最初のリクエストからキャッシュに入っているか
+# ユーザー名の変更・メール認証・削除をコミットすると、キャッシュが無効になるか
+# ----------------------------------------------
+
+def user_selects(statements):
+  return [sql for sql in statements if 'FROM user' in sql]
+
+
+def test_authenticated_reads_hit_cache(client):
+  app = client.application
+  with app.app_context():
+    user = create_test_user()
+    auth_header = get_auth_header(user.id)
+
+  with count_queries(app) as statements:
+    assert client.get('/api/v1/me', headers=auth_header).status_code == 200
+  assert len(user_selects(statements)) == 1
+
+  with count_queries(app) as statements:
+    for _ in range(3):
+      response = client.get('/api/v1/me', headers=auth_header)
+  assert response.get_json()['user']['username'] == 'testuser'
+  assert statements == []
+
+  with app.app_context():
+    stats = user_cache.stats()
+  assert (stats['hits'], stats['misses'], stats['entries']) == (3, 1, 1)
+
+
+def test_login_primes_cache(client):
+  with client.application.app_context():
+    create_test_user()
+  response = client.post('/api/v1/login', json={'email_address': 'test@example.com', 'password': 'password'})
+  auth_header = {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+  with count_queries(client.application) as statements:
+    assert client.get('/api/v1/me', headers=auth_header).status_code == 200
+  assert user_selects(statements) == []
+
+
+def test_user_changes_invalidate_cache(client):
+  app = client.application
+  with app.app_context():
+    user = create_test_user(is_verified=False)
+    token = user.generate_verification_token()
+    db.session.commit()
+    user_id = user.id
+    auth_header = get_auth_header(user_id)
+
+  assert client.get('/api/v1/me', headers=auth_header).status_code == 200
+  with app.app_context():
+    assert user_cache.load(user_id).is_verified is False
+
+  # メール認証
+  assert client.get(f'/api/v1/verify-email?token={token}').status_code == 200
+  with app.app_context():
+    assert user_cache.load(user_id).is_verified is True
+
+  # ユーザー名の変更
+  with app.app_context():
+    db.session.get(User, user_id).username = '新しい名前'
+    db.session.commit()
+  assert client.get('/api/v1/me', headers=auth_header).get_json()['user']['username'] == '新しい名前'
+
+  # 削除されたユーザーのトークンは、キャッシュに残っていても使えない
+  with app.app_context():
+    db.session.delete(db.session.get(User, user_id))
+    db.session.commit()
+  response = client.get('/api/v1/me', headers=auth_header)
+  assert response.status_code == 404
+  assert response.get_json()['message'] == 'ユーザーが見つかりません'
+
+  with app.app_context():
+    assert user_cache.stats()['invalidations'] >= 3
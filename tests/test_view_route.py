@@ -0,0 +1,154 @@
+import gzip
+import os
+import pytest
+from flask import url_for
+from sharefood import create_app
+from sharefood.config import TestingConfig
+from sharefood.routes import view_route
+from sharefood.static_assets import IMMUTABLE_CACHE_CONTROL
+
+# ----------------------------------------------
+#      <<-- テストの要件 -->>
+
+# APIでもファイルでもないパスには index.html（メモリ上のもの）が返り、ETagで304になるか
+# 起動後はファイルシステムを見ずにマニフェストから返すか
+# ハッシュ付きのファイル名にだけimmutableのキャッシュヘッダーが付くか
+# Accept-Encoding に応じて .br / .gz の圧縮済みファイルが返るか
+# アップロード画像が返り、内容ハッシュのファイル名ならimmutableになるか（ディレクトリは404か）
+# X-Accel-Redirect / X-Sendfile モードで中身を送らずにヘッダーだけ返すか
+# ----------------------------------------------
+
+INDEX_HTML = b'<!doctype html><div id="root"></div>'
+MAIN_JS = b'console.log("sharefood");' * 20
+
+def write(folder, relative, data):
+  path = os.path.join(folder, relative)
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  with open(path, 'wb') as f:
+    f.write(data)
+  return path
+
+
+@pytest.fixture
+def static_app(tmp_path):
+  static = tmp_path / 'static'
+  uploads = tmp_path / 'uploads'
+  write(static, 'index.html', INDEX_HTML)
+  write(static, 'index.html.gz', gzip.compress(INDEX_HTML))
+  write(static, 'favicon.ico', b'icon')
+  write(static, 'static/js/main.3f2a1b9c.js', MAIN_JS)
+  write(static, 'static/js/main.3f2a1b9c.js.br', b'brotli-bytes')
+  write(static, 'static/js/main.3f2a1b9c.js.gz', gzip.compress(MAIN_JS))
+  write(uploads, 'aa/bb/aabb.jpg', b'jpeg-bytes')
+  write(uploads, 'legacy.jpg', b'legacy-bytes')
+
+  def make(**overrides):
+    class StaticConfig(TestingConfig):
+      STATIC_FOLDER = str(static)
+      UPLOAD_FOLDER = str(uploads)
+      IMAGE_SPOOL_FOLDER = str(tmp_path / 'spool')
+
+    for key, value in overrides.items():
+      setattr(StaticConfig, key, value)
+    return create_app(config_class=StaticConfig)
+
+  make.static = static
+  return make
+
+
+def test_spa_fallback_serves_index_from_memory(static_app):
+  app = static_app()
+  client = app.test_client()
+  # 起動後にファイルを消しても、メモリ上の index.html が返る
+  os.remove(os.path.join(static_app.static, 'index.html'))
+
+  for url in ['/', '/login', '/items/3']:
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.data == INDEX_HTML
+    assert response.mimetype == 'text/html'
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+  etag = response.headers['ETag']
+  assert client.get('/login', headers={'If-None-Match': etag}).status_code == 304
+
+  response = client.get('/login', headers={'Accept-Encoding': 'gzip'})
+  assert response.headers['Content-Encoding'] == 'gzip'
+  assert gzip.decompress(response.data) == INDEX_HTML
+  assert response.headers['ETag'] != etag
+
+  assert client.get('/api/v1/unknown').status_code == 404
+
+
+def test_hashed_assets_are_immutable_and_precompressed(static_app):
+  client = static_app().test_client()
+
+  response = client.get('/static/js/main.3f2a1b9c.js')
+  assert response.status_code == 200
+  assert response.data == MAIN_JS
+  assert response.headers['Cache-Control'] == IMMUTABLE_CACHE_CONTROL
+  assert 'Accept-Encoding' in response.headers['Vary']
+  assert 'Content-Encoding' not in response.headers
+  response.close()
+
+  response = client.get('/static/js/main.3f2a1b9c.js', headers={'Accept-Encoding': 'gzip, deflate, br'})
+  assert response.headers['Content-Encoding'] == 'br'
+  assert response.data == b'brotli-bytes'
+  assert response.mimetype.endswith('javascript')
+  response.close()
+
+  response = client.get('/static/js/main.3f2a1b9c.js', headers={'Accept-Encoding': 'gzip, br;q=0'})
+  assert response.headers['Content-Encoding'] == 'gzip'
+  response.close()
+
+  response = client.get('/favicon.ico')
+  assert response.data == b'icon'
+  assert response.headers['Cache-Control'] == 'no-cache'
+  response.close()
+
+
+def test_uploads(static_app):
+  app = static_app()
+  client = app.test_client()
+
+  # url_for('static', ...) のURLが、staticエンドポイントとして登録した関数で返る
+  with app.test_request_context():
+    assert url_for('static', filename='uploads/aa/bb/aabb.jpg') == '/uploads/aa/bb/aabb.jpg'
+  assert app.view_functions['static'] is view_route.static
+
+  response = client.get('/uploads/aa/bb/aabb.jpg')
+  assert response.data == b'jpeg-bytes'
+  assert response.headers['Cache-Control'] == IMMUTABLE_CACHE_CONTROL
+  response.close()
+
+  response = client.get('/uploads/legacy.jpg')
+  assert response.data == b'legacy-bytes'
+  assert response.headers['Cache-Control'] == 'no-cache'
+  response.close()
+
+  assert client.get('/uploads/missing.jpg').status_code == 404
+  assert client.get('/uploads/../index.html').status_code == 404
+  # シャードのディレクトリは404（send_fileに渡して500にしない）
+  assert client.get('/uploads/aa').status_code == 404
+  assert client.get('/uploads/aa/bb').status_code == 404
+  assert client.get('/uploads/aa/bb/').status_code == 404
+
+
+def test_x_accel_redirect_mode(static_app):
+  client = static_app(STATIC_SENDFILE_MODE='x-accel-redirect').test_client()
+
+  response = client.get('/static/js/main.3f2a1b9c.js', headers={'Accept-Encoding': 'br'})
+  assert response.headers['X-Accel-Redirect'] == '/_static/static/js/main.3f2a1b9c.js.br'
+  assert response.headers['Content-Encoding'] == 'br'
+  assert response.data == b''
+
+  response = client.get('/uploads/aa/bb/aabb.jpg')
+  assert response.headers['X-Accel-Redirect'] == '/_uploads/aa/bb/aabb.jpg'
+  assert response.data == b''
+
+
+def test_x_sendfile_mode(static_app):
+  client = static_app(STATIC_SENDFILE_MODE='x-sendfile').test_client()
+  response = client.get('/favicon.ico')
+  assert response.headers['X-Sendfile'] == os.path.join(static_app.static, 'favicon.ico')
+  assert response.data == b''
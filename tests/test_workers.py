@@ -0,0 +1,72 @@
+import threading
+from flask import current_app
+from sharefood import create_app
+from sharefood.config import TestingConfig
+from sharefood.workers import PeriodicWorker
+
+# ----------------------------------------------
+#      <<-- テストの要件 -->>
+
+# 設定した間隔ごとに、アプリコンテキストの中で run_once() が呼ばれるか
+# run_once() で例外が出てもスレッドは止まらず、次の回も動くか
+# run_at_start なら最初の間隔を待たずに動くか、stop() で止まるか
+# ----------------------------------------------
+
+class CountingWorker(PeriodicWorker):
+  thread_name = 'test-worker'
+  interval_setting = 'TEST_WORKER_INTERVAL'
+  label = 'テストの処理'
+
+  def __init__(self, app, fail_first=False):
+    super().__init__(app)
+    self.fail_first = fail_first
+    self.calls = []
+    self.called = threading.Event()
+    self.called_twice = threading.Event()
+
+  def run_once(self):
+    self.calls.append(current_app._get_current_object())
+    self.called.set()
+    if len(self.calls) >= 2:
+      self.called_twice.set()
+    if self.fail_first and len(self.calls) == 1:
+      raise RuntimeError('1回目だけ失敗する')
+
+
+def make_app(interval):
+  app = create_app(config_class=TestingConfig)
+  app.config['TEST_WORKER_INTERVAL'] = interval
+  return app
+
+
+def test_keeps_running_after_an_error(caplog):
+  app = make_app(0.01)
+  worker = CountingWorker(app, fail_first=True)
+  worker.start()
+  try:
+    assert worker.called_twice.wait(5)
+  finally:
+    worker.stop()
+    worker.join(5)
+  assert not worker.is_alive()
+  assert all(called is app for called in worker.calls)
+  assert 'テストの処理でエラーが発生しました: 1回目だけ失敗する' in caplog.text
+
+
+def test_run_at_start():
+  app = make_app(60)
+  worker = CountingWorker(app)
+  worker.start()
+  worker.stop()
+  worker.join(5)
+  assert worker.calls == []
+
+  worker = CountingWorker(app)
+  worker.run_at_start = True
+  worker.start()
+  try:
+    assert worker.called.wait(5)
+  finally:
+    worker.stop()
+    worker.join(5)
+  assert worker.calls == [app] and not worker.is_alive()